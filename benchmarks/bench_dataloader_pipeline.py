@@ -0,0 +1,76 @@
+"""
+Benchmarks the train data loader across epochs, comparing
+    respawn     : the workers are respawned every epoch, re-pickling the dataset and the tokeniser
+    persistent  : the workers are kept alive across epochs, see BuilderNli persistent_workers
+
+Each epoch runs a simulated train step per batch, and reports the time to the first batch and the data wait per step measured by DevicePrefetcher.
+
+Usage:
+    export PYTHONPATH=./src
+    python benchmarks/bench_dataloader_pipeline.py --records 20000 --numworkers 2 --stepms 5
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from bench_snli_loading import generate_file
+
+
+def _build_vocab(root_dir):
+    vocab_file = os.path.join(root_dir, "vocab.txt")
+    words = "a person on horse jumps over broken down airplane number is training his for competition .".split()
+    with open(vocab_file, "w") as f:
+        f.write("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]"] + words + [str(i) for i in range(10)]))
+    return vocab_file
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", help="The number of records in the synthetic file", type=int, default=20000)
+    parser.add_argument("--batch", help="The batch size", type=int, default=32)
+    parser.add_argument("--numworkers", help="The number of data loader workers", type=int, default=2)
+    parser.add_argument("--epochs", help="The number of epochs", type=int, default=3)
+    parser.add_argument("--stepms", help="The simulated train step time in milliseconds", type=float, default=5)
+    parser.add_argument("--log-level", help="Log level", default="WARN", choices={"INFO", "WARN", "DEBUG", "ERROR"})
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.getLevelName(args.log_level), handlers=[logging.StreamHandler(sys.stdout)],
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    import transformers
+
+    from builder_nli import BuilderNli
+    from device_prefetcher import DevicePrefetcher
+
+    root_dir = tempfile.mkdtemp()
+    json_file = os.path.join(root_dir, "snli_synthetic.jsonl")
+    generate_file(json_file, args.records)
+    tokeniser = transformers.BertTokenizerFast(_build_vocab(root_dir))
+
+    print("{:<12} {:>6} {:>24} {:>22} {:>14}".format("mode", "epoch", "time to first batch (s)", "data wait (ms/step)",
+                                                     "epoch (s)"))
+    for mode in ["respawn", "persistent"]:
+        builder = BuilderNli(json_file, json_file, root_dir, num_workers=args.numworkers, batch_size=args.batch,
+                             max_seq_len=64, dynamic_padding=True, persistent_workers=mode == "persistent")
+        # Uses the local vocab instead of downloading the pretrained tokeniser
+        builder._tokenisor = tokeniser
+        train_loader, _ = builder.get_train_val_dataloader()
+
+        for epoch in range(args.epochs):
+            batches = DevicePrefetcher(train_loader, "cpu")
+            start = time.perf_counter()
+            first_batch_time = None
+            for _ in batches:
+                if first_batch_time is None:
+                    first_batch_time = time.perf_counter() - start
+                time.sleep(args.stepms / 1000)
+            print("{:<12} {:>6} {:>24.3f} {:>22.2f} {:>14.2f}".format(mode, epoch, first_batch_time,
+                                                                     batches.mean_wait_ms,
+                                                                     time.perf_counter() - start))
+
+
+if "__main__" == __name__:
+    main()
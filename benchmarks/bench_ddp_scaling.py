@@ -0,0 +1,90 @@
+"""
+Measures the scaling efficiency of distributed data parallel training on cpu, using the gloo backend.
+The same number of samples is trained for each world size, split across the processes, and the efficiency is
+    throughput(world size) / (world size * throughput(1 process))
+
+Usage:
+    export PYTHONPATH=./src
+    python benchmarks/bench_ddp_scaling.py --worldsizes 1 2 4
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import torch
+import torch.distributed
+import torch.multiprocessing
+import transformers
+from torch.utils.data import DataLoader, DistributedSampler, TensorDataset
+
+from bert_model import BertModel
+from bert_train import Train
+
+
+def _run(rank, world_size, init_file, args, results):
+    torch.set_num_threads(max(1, args.threads // world_size))
+    torch.distributed.init_process_group("gloo", init_method="file://{}".format(init_file), rank=rank,
+                                         world_size=world_size)
+
+    torch.manual_seed(42)
+    config = transformers.BertConfig(vocab_size=1000, hidden_size=args.hiddensize, num_hidden_layers=args.layers,
+                                     num_attention_heads=4, intermediate_size=4 * args.hiddensize, num_labels=3)
+    network = BertModel(None, None, fine_tune=False, bert_config=config)
+
+    input_ids = torch.randint(low=1, high=1000, size=(args.samples, args.seqlen))
+    labels = torch.randint(high=3, size=(args.samples,))
+    dataset = TensorDataset(input_ids, labels)
+    train = DataLoader(dataset, batch_size=args.batch,
+                       sampler=DistributedSampler(dataset, num_replicas=world_size, rank=rank))
+    val = DataLoader(TensorDataset(input_ids[:args.batch], labels[:args.batch]), batch_size=args.batch)
+
+    trainer = Train(model_dir=tempfile.mkdtemp(), epochs=args.epochs, device="cpu")
+    trainer.snapshot = lambda *a, **k: None
+
+    torch.distributed.barrier()
+    start = time.perf_counter()
+    trainer.run_train(train, val, network, torch.nn.CrossEntropyLoss(),
+                      torch.optim.AdamW(network.parameters(), lr=1e-4), pos_label=0)
+    torch.distributed.barrier()
+
+    if rank == 0:
+        results[world_size] = time.perf_counter() - start
+    torch.distributed.destroy_process_group()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--worldsizes", help="The number of processes to compare", type=int, nargs="+",
+                        default=[1, 2, 4])
+    parser.add_argument("--samples", help="The total number of train samples per epoch", type=int, default=512)
+    parser.add_argument("--batch", help="The batch size per process", type=int, default=16)
+    parser.add_argument("--seqlen", help="The sequence length", type=int, default=64)
+    parser.add_argument("--epochs", help="The number of epochs", type=int, default=1)
+    parser.add_argument("--hiddensize", help="The bert hidden size", type=int, default=128)
+    parser.add_argument("--layers", help="The number of bert layers", type=int, default=2)
+    parser.add_argument("--threads", help="The total number of cpu threads, split across the processes", type=int,
+                        default=os.cpu_count())
+    parser.add_argument("--log-level", help="Log level", default="WARN", choices={"INFO", "WARN", "DEBUG", "ERROR"})
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.getLevelName(args.log_level), handlers=[logging.StreamHandler(sys.stdout)],
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    results = torch.multiprocessing.Manager().dict()
+    for world_size in args.worldsizes:
+        init_file = os.path.join(tempfile.mkdtemp(), "dist_init")
+        torch.multiprocessing.spawn(_run, args=(world_size, init_file, args, results), nprocs=world_size)
+
+    print("{:>10} {:>12} {:>16} {:>12}".format("processes", "time (s)", "samples / sec", "efficiency"))
+    baseline = args.samples * args.epochs / results[args.worldsizes[0]] / args.worldsizes[0]
+    for world_size in args.worldsizes:
+        throughput = args.samples * args.epochs / results[world_size]
+        print("{:>10} {:>12.2f} {:>16.1f} {:>12.2f}".format(world_size, results[world_size], throughput,
+                                                             throughput / (world_size * baseline)))
+
+
+if "__main__" == __name__:
+    main()
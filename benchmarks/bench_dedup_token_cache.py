@@ -0,0 +1,84 @@
+"""
+Benchmarks the token cache of a mixture of sources, comparing
+    per file    : a NliTokenCache per source file, tokenising and storing every record, see SnliDataset
+    dedup       : a single NliDedupTokenCache across the sources, tokenising and storing each distinct sentence once, see NliMixtureDataset
+
+Reports the time to build the cache, its size on disk, and the time to read an item, as the dedup cache formats the items on read.
+The synthetic sources pair each premise with 3 hypotheses, as in SNLI, and the second source repeats some of the premises of the first.
+
+Usage:
+    export PYTHONPATH=./src
+    python benchmarks/bench_dedup_token_cache.py --records 100000 --maxseqlen 128
+"""
+import argparse
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from bench_dataloader_pipeline import _build_vocab
+from bench_snli_loading import generate_file
+
+
+def _dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", help="The number of records in each synthetic source", type=int, default=100000)
+    parser.add_argument("--maxseqlen", help="The max sequence len", type=int, default=128)
+    parser.add_argument("--padtomax", help="Pads each record to the max sequence len in the cache", type=int,
+                        default=0, choices={1, 0})
+    parser.add_argument("--reads", help="The number of random items to read", type=int, default=20000)
+    parser.add_argument("--log-level", help="Log level", default="WARN", choices={"INFO", "WARN", "DEBUG", "ERROR"})
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.getLevelName(args.log_level), handlers=[logging.StreamHandler(sys.stdout)],
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    import transformers
+
+    from nli_mixture_dataset import NliMixtureDataset
+    from preprocessor_nli_bert_tokeniser_fast import PreprocessorNliBertTokeniserFast
+    from snli_dataset import SnliDataset
+
+    root_dir = tempfile.mkdtemp()
+    sources = []
+    for name, num_records in [("snli", args.records), ("mnli", args.records // 2)]:
+        json_file = os.path.join(root_dir, "{}_synthetic.jsonl".format(name))
+        generate_file(json_file, num_records)
+        sources.append((name, json_file))
+
+    preprocessor = PreprocessorNliBertTokeniserFast(max_feature_len=args.maxseqlen, pad_to_max=bool(args.padtomax),
+                                                    tokeniser=transformers.BertTokenizerFast(_build_vocab(root_dir)))
+
+    print("{:<10} {:>10} {:>14} {:>16} {:>16}".format("mode", "records", "build (s)", "disk (MB)", "read (us/item)"))
+    for mode in ["per file", "dedup"]:
+        cache_dir = os.path.join(root_dir, "cache_{}".format(mode.replace(" ", "_")))
+        start = time.perf_counter()
+        if mode == "per file":
+            datasets = [SnliDataset(json_file, preprocessor=preprocessor, token_cache_dir=cache_dir)
+                        for _, json_file in sources]
+        else:
+            datasets = [NliMixtureDataset(sources, preprocessor=preprocessor, token_cache_dir=cache_dir)]
+        build_seconds = time.perf_counter() - start
+
+        items = [(d, i) for d in datasets for i in range(len(d))]
+        reads = random.Random(0).sample(items, min(args.reads, len(items)))
+        start = time.perf_counter()
+        for d, i in reads:
+            d[i]
+        read_us = 1e6 * (time.perf_counter() - start) / len(reads)
+
+        print("{:<10} {:>10} {:>14.2f} {:>16.2f} {:>16.1f}".format(mode, len(items), build_seconds,
+                                                                   _dir_size(cache_dir) / 1024 / 1024, read_us))
+
+    shutil.rmtree(root_dir, ignore_errors=True)
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmarks the largest train batch that fits in a memory budget per max sequence length, with and without gradient checkpointing, see BertModel gradient_checkpointing.
+
+Each (sequence length, batch) runs a train step, forward, backward and optimiser step, in a fresh process and measures its peak memory.
+On cuda this is the peak allocated memory, and an out of memory error is infeasible. On cpu this is the increase in the peak resident memory of the process over the step.
+The batch is doubled until the step no longer fits in the budget, and the throughput is reported at the largest batch that fits.
+
+Usage:
+    export PYTHONPATH=./src
+    python benchmarks/bench_gradient_checkpointing.py --seqlens 128 256 512 --memorymb 2048 --layers 4 --hiddensize 256
+"""
+import argparse
+import logging
+import multiprocessing
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _run_step(hidden_size, layers, seq_len, batch, gradient_checkpointing, device, steps):
+    """
+    Runs in a fresh process, so that the peak memory is that of the step only
+    :return: a tuple (peak memory mb or None when out of memory, mean step seconds)
+    """
+    import torch
+    import transformers
+
+    from bert_model import BertModel
+
+    config = transformers.BertConfig(vocab_size=30522, hidden_size=hidden_size, num_hidden_layers=layers,
+                                     num_attention_heads=max(1, hidden_size // 64), intermediate_size=4 * hidden_size,
+                                     max_position_embeddings=max(512, seq_len), num_labels=3)
+    model = BertModel(None, None, fine_tune=False, bert_config=config,
+                      gradient_checkpointing=gradient_checkpointing).to(device)
+    model.train()
+    optimizer = torch.optim.Adam(model.parameters())
+    loss_function = torch.nn.CrossEntropyLoss()
+    x = torch.randint(high=config.vocab_size, size=(batch, seq_len), device=device)
+    y = torch.randint(high=3, size=(batch,), device=device)
+
+    def step():
+        loss_function(model(x)[0], y).backward()
+        optimizer.step()
+        optimizer.zero_grad()
+
+    try:
+        # The first step allocates the optimiser state, and so is included in the peak memory
+        if device.startswith("cuda"):
+            torch.cuda.reset_peak_memory_stats(device)
+            step()
+            torch.cuda.synchronize(device)
+            peak_mb = torch.cuda.max_memory_allocated(device) / 1024 / 1024
+        else:
+            baseline_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            step()
+            peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 - baseline_mb
+
+        start = time.perf_counter()
+        for _ in range(steps):
+            step()
+        if device.startswith("cuda"):
+            torch.cuda.synchronize(device)
+        return peak_mb, (time.perf_counter() - start) / steps if steps else None
+    except RuntimeError as e:
+        if "out of memory" not in str(e):
+            raise
+        return None, None
+
+
+def _measure(*args):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(_run_step, *args).result()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seqlens", help="The max sequence lengths", type=int, nargs="+", default=[128, 256, 512])
+    parser.add_argument("--memorymb", help="The memory budget of a train step in MB", type=float, default=2048)
+    parser.add_argument("--maxbatch", help="The largest batch to try", type=int, default=256)
+    parser.add_argument("--layers", help="The number of encoder layers, 12 for bert base", type=int, default=4)
+    parser.add_argument("--hiddensize", help="The hidden size, 768 for bert base", type=int, default=256)
+    parser.add_argument("--steps", help="The number of timed steps at the largest batch", type=int, default=2)
+    parser.add_argument("--device", help="The device", default=None)
+    parser.add_argument("--log-level", help="Log level", default="WARN", choices={"INFO", "WARN", "DEBUG", "ERROR"})
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.getLevelName(args.log_level), handlers=[logging.StreamHandler(sys.stdout)],
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    import torch
+    device = args.device or ("cuda:0" if torch.cuda.is_available() else "cpu")
+
+    print("{:<8} {:<14} {:>10} {:>16} {:>14} {:>16}".format("seqlen", "checkpointing", "max batch", "peak memory (MB)",
+                                                           "step (s)", "samples / sec"))
+    for seq_len in args.seqlens:
+        for gradient_checkpointing in [False, True]:
+            best = None
+            batch = 1
+            while batch <= args.maxbatch:
+                peak_mb, _ = _measure(args.hiddensize, args.layers, seq_len, batch, gradient_checkpointing, device, 0)
+                if peak_mb is None or peak_mb > args.memorymb:
+                    break
+                best = (batch, peak_mb)
+                batch *= 2
+
+            if best is None:
+                print("{:<8} {:<14} {:>10}".format(seq_len, str(gradient_checkpointing), "none fits"))
+                continue
+
+            batch, peak_mb = best
+            _, step_seconds = _measure(args.hiddensize, args.layers, seq_len, batch, gradient_checkpointing, device,
+                                       args.steps)
+            print("{:<8} {:<14} {:>10} {:>16.0f} {:>14.3f} {:>16.1f}".format(
+                seq_len, str(gradient_checkpointing), batch, peak_mb, step_seconds, batch / step_seconds))
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmarks the cpu latency of the inference backends, see ModelArtifacts.backends, across batch sizes and sequence lengths,
+using a randomly initialised bert model. The speedup is relative to the first backend.
+
+Usage:
+    export PYTHONPATH=./src
+    python benchmarks/bench_inference_backends.py --backends eager torchscript onnx --batchsizes 1 8 32 --seqlens 32 128 256
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import torch
+import transformers
+
+from bert_model import BertModel
+from model_artifacts import ModelArtifacts
+from preprocessor_nli_bert_tokeniser_fast import PreprocessorNliBertTokeniserFast
+from snli_dataset_label_mapper import SnliLabelMapper
+
+
+def _build_model_dir(hidden_size, layers, max_seq_len, vocab_size=1000):
+    model_dir = tempfile.mkdtemp()
+    vocab_file = os.path.join(tempfile.mkdtemp(), "vocab.txt")
+    with open(vocab_file, "w") as f:
+        f.write("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]"] + ["w{}".format(i) for i in range(vocab_size - 4)]))
+
+    preprocessor = PreprocessorNliBertTokeniserFast(max_feature_len=max_seq_len, pad_to_max=False,
+                                                    tokeniser=transformers.BertTokenizerFast(vocab_file))
+    config = transformers.BertConfig(vocab_size=vocab_size, hidden_size=hidden_size, num_hidden_layers=layers,
+                                     num_attention_heads=max(1, hidden_size // 64), intermediate_size=4 * hidden_size,
+                                     num_labels=3)
+    ModelArtifacts.save_metadata(model_dir, config, preprocessor, SnliLabelMapper())
+    ModelArtifacts.save_weights(BertModel(None, None, fine_tune=False, bert_config=config), model_dir)
+    return model_dir, {"bert_config": config.to_dict()}
+
+
+def _time_ms(model, inputs, repeats):
+    timings = []
+    with torch.no_grad():
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model(*inputs)[0]
+            timings.append(1000 * (time.perf_counter() - start))
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", help="The backends to compare", nargs="+",
+                        default=["eager", "torchscript", "onnx"], choices=ModelArtifacts.backends)
+    parser.add_argument("--batchsizes", help="The batch sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--seqlens", help="The sequence lengths", type=int, nargs="+", default=[32, 128, 256])
+    parser.add_argument("--hiddensize", help="The bert hidden size", type=int, default=256)
+    parser.add_argument("--layers", help="The number of bert layers", type=int, default=4)
+    parser.add_argument("--repeats", help="The number of timed runs per shape, the median is reported", type=int,
+                        default=10)
+    parser.add_argument("--log-level", help="Log level", default="WARN", choices={"INFO", "WARN", "DEBUG", "ERROR"})
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.getLevelName(args.log_level), handlers=[logging.StreamHandler(sys.stdout)],
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    model_dir, config = _build_model_dir(args.hiddensize, args.layers, max(args.seqlens))
+    models = []
+    for backend in args.backends:
+        if backend != "eager":
+            ModelArtifacts.export(model_dir, backend)
+        models.append(ModelArtifacts.load(model_dir, backend=backend)[1])
+
+    print("{:>6} {:>8} ".format("batch", "seq len") +
+          " ".join("{:>14} {:>8}".format(b + " (ms)", "speedup") for b in args.backends))
+    for batch_size in args.batchsizes:
+        for seq_len in args.seqlens:
+            inputs = ModelArtifacts.example_inputs(config, batch_size=batch_size, seq_len=seq_len)
+            timings = []
+            for model in models:
+                # Warm up the model on the shape
+                _time_ms(model, inputs, 2)
+                timings.append(_time_ms(model, inputs, args.repeats))
+
+            print("{:>6} {:>8} ".format(batch_size, seq_len) +
+                  " ".join("{:>14.2f} {:>8.2f}".format(t, timings[0] / t) for t in timings))
+
+
+if "__main__" == __name__:
+    main()
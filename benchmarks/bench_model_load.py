@@ -0,0 +1,111 @@
+"""
+Benchmarks the endpoint cold start, i.e. serve.model_fn followed by the first prediction, comparing
+    pickle    : the whole pickled model, preprocessor.pkl and label_mapper.pkl
+    artifacts : safetensors weights, config, vocab and labels, see ModelArtifacts
+
+Each mode runs in a fresh process, and reports the time taken and the resident memory. The anonymous memory is private to the
+process, whereas the file backed memory includes the memory mapped weights that are shared by the worker processes.
+
+Usage:
+    export PYTHONPATH=./src
+    python benchmarks/bench_model_load.py --hiddensize 768 --layers 12
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+
+def _rss_mb():
+    rss = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("RssAnon", "RssFile"):
+                rss[key] = int(value.split()[0]) / 1024
+    return rss.get("RssAnon", 0), rss.get("RssFile", 0)
+
+
+def _run(model_dir, queue):
+    import serve
+
+    baseline_anon, baseline_file = _rss_mb()
+    start = time.perf_counter()
+    model_artifacts = serve.model_fn(model_dir)
+    load_time = time.perf_counter() - start
+    serve.predict_fn([{"premise": "w1 w2 w3", "hypothesis": "w4 w5"}], model_artifacts)
+    first_prediction_time = time.perf_counter() - start
+
+    anon, file = _rss_mb()
+    queue.put((load_time, first_prediction_time, anon - baseline_anon, file - baseline_file))
+
+
+def _build_model_dirs(root_dir, hidden_size, layers, vocab_size):
+    import torch
+    import transformers
+
+    from bert_model import BertModel
+    from model_artifacts import ModelArtifacts
+    from preprocessor_nli_bert_tokeniser_fast import PreprocessorNliBertTokeniserFast
+    from snli_dataset_label_mapper import SnliLabelMapper
+
+    vocab_file = os.path.join(root_dir, "vocab.txt")
+    with open(vocab_file, "w") as f:
+        f.write("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]"] + ["w{}".format(i) for i in range(vocab_size - 4)]))
+
+    preprocessor = PreprocessorNliBertTokeniserFast(max_feature_len=256,
+                                                    tokeniser=transformers.BertTokenizerFast(vocab_file))
+    label_mapper = SnliLabelMapper()
+    config = transformers.BertConfig(vocab_size=vocab_size, hidden_size=hidden_size, num_hidden_layers=layers,
+                                     num_attention_heads=max(1, hidden_size // 64), intermediate_size=4 * hidden_size,
+                                     num_labels=label_mapper.num_classes)
+    model = BertModel(None, None, fine_tune=False, bert_config=config)
+
+    pickle_dir = os.path.join(root_dir, "pickle")
+    os.makedirs(pickle_dir)
+    torch.save(model, os.path.join(pickle_dir, "best_snaphsotmodel.pt"))
+    with open(os.path.join(pickle_dir, "label_mapper.pkl"), "wb") as f:
+        pickle.dump(label_mapper, f)
+    with open(os.path.join(pickle_dir, "preprocessor.pkl"), "wb") as f:
+        pickle.dump(preprocessor, f)
+
+    artifacts_dir = os.path.join(root_dir, "artifacts")
+    ModelArtifacts.save_metadata(artifacts_dir, config, preprocessor, label_mapper)
+    ModelArtifacts.save_weights(model, artifacts_dir)
+
+    return [("pickle", pickle_dir), ("artifacts", artifacts_dir)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hiddensize", help="The bert hidden size", type=int, default=768)
+    parser.add_argument("--layers", help="The number of bert layers", type=int, default=12)
+    parser.add_argument("--vocabsize", help="The vocab size", type=int, default=30522)
+    parser.add_argument("--runs", help="The number of cold starts per mode", type=int, default=3)
+    parser.add_argument("--log-level", help="Log level", default="WARN", choices={"INFO", "WARN", "DEBUG", "ERROR"})
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.getLevelName(args.log_level), handlers=[logging.StreamHandler(sys.stdout)],
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    model_dirs = _build_model_dirs(tempfile.mkdtemp(), args.hiddensize, args.layers, args.vocabsize)
+
+    ctx = multiprocessing.get_context("spawn")
+    print("{:>10} {:>14} {:>22} {:>14} {:>14}".format("mode", "model_fn (s)", "first prediction (s)",
+                                                       "anon rss (MB)", "file rss (MB)"))
+    for mode, model_dir in model_dirs:
+        for _ in range(args.runs):
+            queue = ctx.Queue()
+            p = ctx.Process(target=_run, args=(model_dir, queue))
+            p.start()
+            result = queue.get()
+            p.join()
+            print("{:>10} {:>14.3f} {:>22.3f} {:>14.1f} {:>14.1f}".format(mode, *result))
+
+
+if "__main__" == __name__:
+    main()
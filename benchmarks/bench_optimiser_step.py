@@ -0,0 +1,77 @@
+"""
+Benchmarks the optimiser step time over the BertModel parameters for each optimiser configuration, see OptimiserFactory
+    adam                : the default torch.optim.Adam as previously used by BuilderNli
+    adamw for-loop      : AdamW updating each parameter in turn (foreach=False)
+    adamw foreach       : AdamW updating the parameters using multi tensor kernels
+    adamw fused         : AdamW updating the parameters using a fused kernel, when supported by the installed torch
+Each configuration uses weight decay with the biases and LayerNorm weights in a group without decay.
+
+Usage:
+    export PYTHONPATH=./src
+    python benchmarks/bench_optimiser_step.py --layers 12 --hiddensize 768 --steps 10
+"""
+import argparse
+import logging
+import sys
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--layers", help="The number of encoder layers, 12 for bert base", type=int, default=12)
+    parser.add_argument("--hiddensize", help="The hidden size, 768 for bert base", type=int, default=768)
+    parser.add_argument("--steps", help="The number of timed optimiser steps", type=int, default=10)
+    parser.add_argument("--device", help="The device", default=None)
+    parser.add_argument("--log-level", help="Log level", default="WARN", choices={"INFO", "WARN", "DEBUG", "ERROR"})
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.getLevelName(args.log_level), handlers=[logging.StreamHandler(sys.stdout)],
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    import torch
+    import transformers
+
+    from bert_model import BertModel
+    from optimiser_factory import OptimiserFactory
+
+    device = args.device or ("cuda:0" if torch.cuda.is_available() else "cpu")
+    config = transformers.BertConfig(hidden_size=args.hiddensize, num_hidden_layers=args.layers,
+                                     num_attention_heads=max(1, args.hiddensize // 64),
+                                     intermediate_size=4 * args.hiddensize, num_labels=3)
+    model = BertModel(None, None, fine_tune=False, bert_config=config).to(device)
+    for p in model.parameters():
+        p.grad = torch.randn_like(p)
+    print("{} parameter tensors, {:.1f}M parameters on {}".format(len(list(model.parameters())),
+                                                                 sum(p.numel() for p in model.parameters()) / 1e6,
+                                                                 device))
+
+    def for_loop(m):
+        factory = OptimiserFactory(optimiser="adamw", weight_decay=0.01)
+        named_parameters = list(m.named_parameters())
+        return torch.optim.AdamW(factory.param_groups(named_parameters), lr=1e-5, foreach=False)
+
+    configurations = [
+        ("adam", lambda m: OptimiserFactory().create(m)),
+        ("adamw for-loop", for_loop),
+        ("adamw foreach", lambda m: OptimiserFactory("adamw", weight_decay=0.01, implementation="foreach").create(m)),
+        ("adamw fused", lambda m: OptimiserFactory("adamw", weight_decay=0.01, implementation="fused").create(m)),
+    ]
+
+    print("{:<16} {:>14}".format("optimiser", "step (ms)"))
+    for name, create in configurations:
+        optimiser = create(model)
+        # The first step allocates the optimiser state
+        optimiser.step()
+        if device.startswith("cuda"):
+            torch.cuda.synchronize(device)
+
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            optimiser.step()
+        if device.startswith("cuda"):
+            torch.cuda.synchronize(device)
+        print("{:<16} {:>14.1f}".format(name, 1000 * (time.perf_counter() - start) / args.steps))
+
+
+if "__main__" == __name__:
+    main()
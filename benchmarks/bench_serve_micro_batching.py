@@ -0,0 +1,144 @@
+"""
+Load generator for the inference server, reports the p50 / p99 latency and throughput of concurrent clients.
+When --url is not set, starts a local server with a small randomly initialised bert model and compares
+    per_request : each request predicted on its own, as in serve.predict_fn
+    micro_batch : concurrent requests coalesced into micro batches, see main_serve.py
+
+Usage:
+    export PYTHONPATH=./src
+    python benchmarks/bench_serve_micro_batching.py --clients 16 --requests 20
+    python benchmarks/bench_serve_micro_batching.py --url http://localhost:8080/invocations
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+import torch
+import transformers
+
+import serve
+from bert_model import BertModel
+from main_serve import InferenceServer
+from preprocessor_nli_bert_tokeniser_fast import PreprocessorNliBertTokeniserFast
+from snli_dataset_label_mapper import SnliLabelMapper
+
+_WORDS = ["a", "person", "on", "horse", "is", "outdoors", "the", "man", "woman", "dog", "runs", "in", "park",
+          "sitting", "with", "cat", "children", "are", "playing", "."]
+
+
+def _random_records(num_records, seed=42):
+    rnd = random.Random(seed)
+    return [{"premise": " ".join(rnd.choices(_WORDS, k=rnd.randint(5, 30))),
+             "hypothesis": " ".join(rnd.choices(_WORDS, k=rnd.randint(3, 15)))} for _ in range(num_records)]
+
+
+def _build_model_artifacts(max_seq_len, hidden_size, layers):
+    vocab_file = os.path.join(tempfile.mkdtemp(), "vocab.txt")
+    with open(vocab_file, "w") as f:
+        f.write("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]"] + _WORDS))
+
+    preprocessor = PreprocessorNliBertTokeniserFast(max_feature_len=max_seq_len,
+                                                    tokeniser=transformers.BertTokenizerFast(vocab_file))
+    label_mapper = SnliLabelMapper()
+
+    torch.manual_seed(42)
+    config = transformers.BertConfig(vocab_size=len(_WORDS) + 4, hidden_size=hidden_size, num_hidden_layers=layers,
+                                     num_attention_heads=4, intermediate_size=4 * hidden_size,
+                                     num_labels=label_mapper.num_classes)
+    model = BertModel(None, None, bert_config=config).to(device=serve.get_device())
+    return preprocessor, model, label_mapper
+
+
+def run_load(url, records, clients, requests_per_client, records_per_request):
+    """
+    Sends requests from concurrent clients
+    :return: a tuple (list of request latencies in seconds, elapsed seconds)
+    """
+    latencies = []
+    lock = threading.Lock()
+
+    def client(client_id):
+        rnd = random.Random(client_id)
+        for _ in range(requests_per_client):
+            body = json.dumps(rnd.sample(records, records_per_request)).encode("utf-8")
+            request = urllib.request.Request(url, data=body, headers={"Content-Type": serve.JSON_CONTENT_TYPE,
+                                                                      "Accept": serve.JSON_CONTENT_TYPE})
+            start = time.perf_counter()
+            with urllib.request.urlopen(request) as response:
+                predictions = json.loads(response.read().decode("utf-8"))
+            latency = time.perf_counter() - start
+
+            assert len(predictions) == records_per_request
+            with lock:
+                latencies.append(latency)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return latencies, time.perf_counter() - start
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="The invocations url of a running server. By default starts local servers",
+                        default=None)
+    parser.add_argument("--clients", help="The number of concurrent clients", type=int, default=16)
+    parser.add_argument("--requests", help="The number of requests per client", type=int, default=20)
+    parser.add_argument("--recordsperrequest", help="The number of records per request", type=int, default=5)
+    parser.add_argument("--maxbatchsize", help="The max micro batch size of the local server", type=int, default=64)
+    parser.add_argument("--maxwaitms", help="The max wait of the local server", type=float, default=5)
+    parser.add_argument("--maxseqlen", help="The max sequence length of the local model", type=int, default=256)
+    parser.add_argument("--hiddensize", help="The bert hidden size of the local model", type=int, default=256)
+    parser.add_argument("--layers", help="The number of bert layers of the local model", type=int, default=4)
+    parser.add_argument("--log-level", help="Log level", default="WARN", choices={"INFO", "WARN", "DEBUG", "ERROR"})
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.getLevelName(args.log_level), handlers=[logging.StreamHandler(sys.stdout)],
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    records = _random_records(1000)
+
+    if args.url is not None:
+        targets = [("server", args.url, None)]
+    else:
+        model_artifacts = _build_model_artifacts(args.maxseqlen, args.hiddensize, args.layers)
+        predict = lambda r: serve.predict_fn(r, model_artifacts)
+        targets = []
+        for mode, max_batch_size in [("per_request", 0), ("micro_batch", args.maxbatchsize)]:
+            server = InferenceServer(("127.0.0.1", 0), predict, max_batch_size=max_batch_size,
+                                     max_wait_ms=args.maxwaitms)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            targets.append((mode, "http://127.0.0.1:{}/invocations".format(server.server_address[1]), server))
+
+    print("{:>12} {:>10} {:>10} {:>16}".format("mode", "p50 (ms)", "p99 (ms)", "records / sec"))
+    for mode, url, server in targets:
+        # Warm up
+        run_load(url, records, 1, 2, args.recordsperrequest)
+
+        latencies, elapsed = run_load(url, records, args.clients, args.requests, args.recordsperrequest)
+        print("{:>12} {:>10.1f} {:>10.1f} {:>16.1f}".format(mode, 1000 * _percentile(latencies, 50),
+                                                           1000 * _percentile(latencies, 99),
+                                                           len(latencies) * args.recordsperrequest / elapsed))
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+
+if "__main__" == __name__:
+    main()
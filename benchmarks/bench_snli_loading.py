@@ -0,0 +1,98 @@
+"""
+Benchmarks the peak memory and time to first batch of loading an SNLI jsonl file, comparing
+    dicts      : the original list of dicts per record
+    columnar   : SnliDataset, backed by NliColumnarRecords
+    streaming  : SnliIterableDataset
+
+Usage:
+    export PYTHONPATH=./src
+    python benchmarks/bench_snli_loading.py --records 550000
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+
+def _load_dicts(json_file):
+    items = []
+    with open(json_file) as f:
+        for l in f:
+            data = json.loads(l)
+            items.append({"premise": data["sentence1"], "hypothesis": data["sentence2"], "label": data["gold_label"]})
+    return items
+
+
+def _run(mode, json_file, batch_size, queue):
+    from torch.utils.data import DataLoader
+
+    from snli_dataset import SnliDataset
+    from snli_iterable_dataset import SnliIterableDataset
+
+    baseline_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+
+    if mode == "dicts":
+        items = _load_dicts(json_file)
+        first_batch = items[:batch_size]
+    elif mode == "columnar":
+        items = SnliDataset(json_file)
+        first_batch = next(iter(DataLoader(items, batch_size=batch_size, shuffle=True)))
+    else:
+        items = SnliIterableDataset(json_file)
+        first_batch = next(iter(DataLoader(items, batch_size=batch_size)))
+
+    time_to_first_batch = time.perf_counter() - start
+    assert len(first_batch) > 0
+
+    peak_rss_mb = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_rss_kb) / 1024
+    queue.put((mode, time_to_first_batch, peak_rss_mb))
+
+
+def generate_file(json_file, num_records):
+    labels = ["neutral", "entailment", "contradiction", "-"]
+    with open(json_file, "w") as f:
+        for i in range(num_records):
+            premise = "A person on a horse jumps over a broken down airplane number {}.".format(i // 3)
+            hypothesis = "A person is training his horse for competition number {}.".format(i)
+            f.write(json.dumps({"sentence1": premise, "sentence2": hypothesis, "gold_label": labels[i % 4],
+                                "captionID": str(i)}) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jsonfile", help="The SNLI jsonl file, if not set a synthetic file is generated", default=None)
+    parser.add_argument("--records", help="The number of records in the synthetic file", type=int, default=100000)
+    parser.add_argument("--batch", help="The batch size", type=int, default=32)
+    parser.add_argument("--log-level", help="Log level", default="WARN", choices={"INFO", "WARN", "DEBUG", "ERROR"})
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.getLevelName(args.log_level), handlers=[logging.StreamHandler(sys.stdout)],
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    json_file = args.jsonfile
+    if json_file is None:
+        json_file = os.path.join(tempfile.mkdtemp(), "snli_synthetic.jsonl")
+        generate_file(json_file, args.records)
+
+    print("File {} size {:.1f} MB".format(json_file, os.path.getsize(json_file) / 1024 / 1024))
+    print("{:<10} {:>24} {:>18}".format("mode", "time to first batch (s)", "peak rss (MB)"))
+
+    # Each mode runs in a fresh process, so that the peak memory of one mode does not affect the other
+    context = multiprocessing.get_context("spawn")
+    for mode in ["dicts", "columnar", "streaming"]:
+        queue = context.Queue()
+        p = context.Process(target=_run, args=(mode, json_file, args.batch, queue))
+        p.start()
+        mode, time_to_first_batch, peak_rss_mb = queue.get()
+        p.join()
+        print("{:<10} {:>24.3f} {:>18.1f}".format(mode, time_to_first_batch, peak_rss_mb))
+
+
+if "__main__" == __name__:
+    main()
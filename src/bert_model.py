@@ -1,11 +1,22 @@
 
+import functools
+
+import torch
+import torch.utils.checkpoint
 from torch import nn
 from transformers import BertForSequenceClassification
+from transformers.models.bert.modeling_bert import BertLayer
 
 
 class BertModel(nn.Module):
 
-    def __init__(self, model_name_or_dir, num_classes, fine_tune=True, state_dict=None, bert_config=None):
+    def __init__(self, model_name_or_dir, num_classes, fine_tune=True, state_dict=None, bert_config=None,
+                 freeze_layers=None, gradient_checkpointing=False):
+        """
+        :param fine_tune: Freezes the entire base model, and only trains the classifier
+        :param freeze_layers: Only applies when not fine_tune. Freezes the embeddings and the bottom n encoder layers, see freeze_layers
+        :param gradient_checkpointing: Only keeps the input of each encoder layer for the backward pass, and recomputes the activations within the layer during the backward pass. Trades about a third more compute for activation memory that no longer grows with the number of layers, allowing a longer max sequence length or a larger batch. The frozen layers are not checkpointed, see freeze_layers
+        """
         super().__init__()
         assert model_name_or_dir is not None or bert_config is not None, "Either a name or directory containing a pretrained model or a custom bert config must be provided"
         if bert_config is None:
@@ -14,13 +25,104 @@ class BertModel(nn.Module):
         else:
             self.model = BertForSequenceClassification(config=bert_config)
 
+        # The number of frozen encoder layers, -1 when nothing is frozen and 0 when only the embeddings are frozen
+        self.frozen_layers = -1
+        self._base_frozen = False
+
         # Fine tune, freeze all other weights except classifier
         if fine_tune:
             self._freeze_base_weights()
+        elif freeze_layers is not None:
+            self.freeze_layers(freeze_layers)
+
+        if gradient_checkpointing:
+            # Checkpoints each trainable layer within its own forward, rather than using the transformers encoder
+            # checkpointing, so that the frozen layers are neither checkpointed nor recomputed
+            for index, layer in enumerate(self.model.base_model.encoder.layer):
+                # Swaps the class rather than the bound forward, so that the data parallel replicas of the layer
+                # checkpoint themselves and not the original layer
+                layer.__class__ = _CheckpointedBertLayer
+                layer.register_forward_pre_hook(functools.partial(self._first_trainable_layer_input, index))
+
+    @property
+    def num_layers(self):
+        return len(self.model.base_model.encoder.layer)
 
     def _freeze_base_weights(self):
         for param in self.model.base_model.parameters():
             param.requires_grad = False
+        self.frozen_layers = self.num_layers
+        self._base_frozen = True
+
+    def freeze_layers(self, num_layers):
+        """
+        Freezes the embeddings and the bottom encoder layers, and unfreezes the layers above them.
+        No graph is recorded for the frozen layers, as neither their inputs nor their weights require a gradient, so their activations are not kept and the backward pass stops at the lowest trainable layer
+        :param num_layers: The number of encoder layers to freeze, 0 freezes the embeddings only and -1 unfreezes all
+        """
+        assert -1 <= num_layers <= self.num_layers, "Expected -1 to {} frozen layers, got {}".format(self.num_layers,
+                                                                                                   num_layers)
+        base_model = self.model.base_model
+        for param in base_model.parameters():
+            param.requires_grad = True
+        if num_layers >= 0:
+            for param in base_model.embeddings.parameters():
+                param.requires_grad = False
+        for layer in base_model.encoder.layer[:max(num_layers, 0)]:
+            for param in layer.parameters():
+                param.requires_grad = False
+
+        self.frozen_layers = num_layers
+        self._base_frozen = False
+
+    def _first_trainable_layer_input(self, index, module, inputs):
+        # A checkpointed layer only back propagates to its weights when its input requires a gradient, which is not the case for the input of the lowest trainable layer.
+        # Only that input is marked, so that the frozen layers below still record no graph
+        if index == self.frozen_layers and torch.is_grad_enabled() and not inputs[0].requires_grad:
+            return (inputs[0].detach().requires_grad_(True),) + tuple(inputs[1:])
+        return None
+
+    def forward(self, input_ids, attention_mask=None, token_type_ids=None):
+        if self._base_frozen and torch.is_grad_enabled():
+            # Only the classifier is trained, so the encoder runs without recording the graph
+            with torch.no_grad():
+                pooled_output = self.pooled_output(input_ids, attention_mask, token_type_ids)
+            return self.model.classifier(self.model.dropout(pooled_output)),
+
+        return self.model(input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids)
+
+    def pooled_output(self, input_ids, attention_mask=None, token_type_ids=None):
+        """
+        Runs the encoder only
+        :return: the pooled output that is the input to the classifier, of shape [batch, hidden size]
+        """
+        return self.model.base_model(input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids)[1]
+
+
+class BertClassifierHead(nn.Module):
+    """
+    The classifier of a BertModel, applied to the pooled output of the encoder, e.g. as cached by NliFeatureCache.
+    Shares the weights with the BertModel, and has the same state dict keys, so that the snapshots and checkpoints are interchangeable with the BertModel
+    """
+
+    def __init__(self, bert_model):
+        """
+        :param bert_model: The BertModel with the frozen encoder
+        """
+        super().__init__()
+        self.model = bert_model.model
+
+    def forward(self, pooled_output):
+        return self.model.classifier(self.model.dropout(pooled_output)),
+
+
+class _CheckpointedBertLayer(BertLayer):
+    """
+    A BertLayer that checkpoints itself when training its weights, see BertModel gradient_checkpointing
+    """
 
-    def forward(self, *input):
-        return self.model(*input)
+    def forward(self, *inputs):
+        trainable = any(p.requires_grad for p in self.parameters())
+        if not (self.training and trainable and torch.is_grad_enabled()):
+            return super().forward(*inputs)
+        return torch.utils.checkpoint.checkpoint(super().forward, *inputs, use_reentrant=True)
@@ -1,34 +1,66 @@
 
+import contextlib
 import datetime
 import glob
 import logging
 import os
+import random
+import time
 
 import torch
 import torch.nn as nn
 import torch.utils.data
-from sklearn.metrics import accuracy_score
+
+from checkpoint_writer import CheckpointWriter
+from device_prefetcher import DevicePrefetcher
+from training_profiler import TrainingProfiler
 
 
 class Train:
     """
-    Trains on GPU / CPU
+    Trains on GPU / CPU.
+    When the torch distributed process group is initialised, e.g. using torchrun, trains using DistributedDataParallel with a process per device
     """
 
     def __init__(self, model_dir, device=None, epochs=10, early_stopping_patience=20, checkpoint_frequency=1,
                  checkpoint_dir=None,
-                 accumulation_steps=1):
+                 accumulation_steps=1, mixed_precision=None, log_interval=None, checkpoint_steps=None,
+                 checkpoint_keep=3, snapshotter=None, metrics_file=None, profile_steps=None, trace_dir=None,
+                 on_epoch_start=None):
+        """
+        :param on_epoch_start: Optional function (model, optimizer, epoch) called before each train epoch, and replayed for the epochs up to the checkpoint before restoring the optimiser from it, e.g. GradualUnfreezer to change the trainable parameters
+        :param metrics_file: Optionally, the jsonl file to write the per step stage timings, throughput and peak memory to, see TrainingProfiler. Only written by the main process
+        :param profile_steps: Optionally, a tuple (start step, end step) of the train steps to trace using torch.profiler into the trace_dir
+        :param snapshotter: Optional function (model, model_dir) that writes the best model, e.g. ModelArtifacts.save_weights. By default the whole model is pickled using torch.save
+        :param checkpoint_dir: When set, checkpoints the model, optimiser and training progress to this dir, and resumes from the latest checkpoint in it
+        :param checkpoint_frequency: Checkpoints at the end of every n epochs
+        :param checkpoint_steps: Optionally, also checkpoints within an epoch every n optimiser steps
+        :param checkpoint_keep: The number of most recent checkpoints to retain
+        :param log_interval: Logs the running train loss and accuracy every n batches. The metrics are accumulated on the device and are only copied to the host when logged or at the end of the epoch
+        :param mixed_precision: Runs the forward pass in mixed precision using torch.autocast, None (fp32), "bf16" or "fp16". fp16 is only supported on cuda and uses a grad scaler. The weights and so the snapshots remain fp32
+        """
+        assert mixed_precision in (None, "bf16", "fp16"), "Unexpected mixed precision {}".format(mixed_precision)
         self.model_dir = model_dir
+        self.mixed_precision = mixed_precision
+        self.log_interval = log_interval
         self.accumulation_steps = accumulation_steps
         self.checkpoint_dir = checkpoint_dir
         self.checkpoint_frequency = checkpoint_frequency
+        self.checkpoint_steps = checkpoint_steps
+        self.checkpoint_keep = checkpoint_keep
+        self._checkpoint_writer = None
         self.early_stopping_patience = early_stopping_patience
         self.epochs = epochs
-        self.snapshotter = None
+        self.snapshotter = snapshotter
+        self.on_epoch_start = on_epoch_start
+        self._wrapped_trainable = None
 
         # Set up device is not set
         available_device = "cuda:0" if torch.cuda.is_available() else "cpu"
-        if torch.cuda.device_count() > 1:
+        if self._is_distributed and torch.cuda.is_available():
+            # Each distributed process uses a single device
+            available_device = "cuda:{}".format(int(os.environ.get("LOCAL_RANK", 0)))
+        elif torch.cuda.device_count() > 1:
             available_device = [f"cuda:{i}" for i in range(torch.cuda.device_count())]
 
         self.device = device or available_device
@@ -38,25 +70,54 @@ class Train:
 
         self._default_device = self.device[0] if self._is_multigpu else self.device
 
+        self._device_type = "cuda" if str(self._default_device).startswith("cuda") else "cpu"
+        assert not (self.mixed_precision == "fp16" and self._device_type == "cpu"), \
+            "Mixed precision fp16 is only supported on cuda, use bf16 on cpu"
+
+        self._profiler = TrainingProfiler(metrics_file=metrics_file if self._is_main_process else None,
+                                          profile_steps=profile_steps, trace_dir=trace_dir,
+                                          device=self._default_device)
+
     @property
     def _logger(self):
         return logging.getLogger(__name__)
 
+    @property
+    def default_device(self):
+        """
+        The device the model runs on, the first device when using multiple gpus
+        """
+        return self._default_device
+
+    @property
+    def _is_distributed(self):
+        return torch.distributed.is_available() and torch.distributed.is_initialized()
+
+    @property
+    def _is_main_process(self):
+        return not self._is_distributed or torch.distributed.get_rank() == 0
+
     def snapshot(self, model, model_dir, prefix="best_snaphsot"):
+        # If nn.dataparallel, get the underlying module
+        model = self._unwrap(model)
+
+        if self.snapshotter is not None:
+            self._logger.info("Snapshot model to {}".format(model_dir))
+            self.snapshotter(model, model_dir)
+            return
+
         snapshot_prefix = os.path.join(model_dir, prefix)
         snapshot_path = snapshot_prefix + 'model.pt'
 
         self._logger.info("Snapshot model to {}".format(snapshot_path))
 
-        # If nn.dataparallel, get the underlying module
-        if isinstance(model, torch.nn.DataParallel):
-            model = model.module
-
         torch.save(model, snapshot_path)
 
-    def run_train(self, train_iter, validation_iter, model_network, loss_function, optimizer, pos_label):
+    def run_train(self, train_iter, validation_iter, model_network, loss_function, optimizer, pos_label,
+                  scheduler=None):
         """
     Runs train...
+        :param scheduler: Optional learning rate schedule, stepped once per optimiser step, i.e. every accumulation_steps batches
         :param pos_label:
         :param validation_iter: Validation set
         :param train_iter: Train Data
@@ -65,93 +126,230 @@ class Train:
         :param optimizer: Optimiser
         """
         best_results = None
-        start = datetime.datetime.now()
         iterations = 0
-        val_log_template = ' '.join(
-            '{:>6.0f},{:>5.0f},{:>9.0f},{:>5.0f}/{:<5.0f} {:>7.0f}%,{:>8.6f},{:8.6f},{:12.4f},{:12.4f}'.split(','))
-        val_log_template = "Run {}".format(val_log_template)
 
         best_score = None
 
         no_improvement_epochs = 0
 
-        if self._is_multigpu:
+        model_network = self._wrap(model_network)
+
+        # Scales the fp16 loss to prevent gradient underflow. Not required for bf16, as it has the same range as fp32
+        scaler = torch.cuda.amp.GradScaler(enabled=self.mixed_precision == "fp16")
+
+        # Resume from the latest checkpoint
+        start_epoch, resume_batches, resume_metrics = 0, 0, None
+        update_steps = 0
+        training_state = self._load_training_state(model_network, optimizer, scaler, scheduler)
+        if training_state is not None:
+            start_epoch, resume_batches = training_state["epoch"], training_state["batch_idx"]
+            iterations, update_steps = training_state["iterations"], training_state["update_steps"]
+            best_score, best_results = training_state["best_score"], training_state["best_results"]
+            no_improvement_epochs = training_state["no_improvement_epochs"]
+            resume_metrics = training_state["train_metrics"]
+            self._set_rng_state(training_state["rng_state"])
+            self._logger.info("Resuming from epoch {} batch {}, best score {}".format(start_epoch, resume_batches,
+                                                                                     best_score))
+
+            if no_improvement_epochs > self.early_stopping_patience:
+                self._logger.info("Early stopping.. with no improvement in {}".format(no_improvement_epochs))
+                return best_results
+
+        self._profiler.start()
+        try:
+            best_results = self._run_epochs(train_iter, validation_iter, model_network, loss_function, optimizer,
+                                            scheduler, scaler, start_epoch, resume_batches, resume_metrics, iterations,
+                                            update_steps, best_score, best_results, no_improvement_epochs)
+        finally:
+            # Wait for the pending checkpoint, so that the checkpoint is complete when training returns
+            if self._checkpoint_writer is not None:
+                self._checkpoint_writer.close()
+            self._profiler.close()
+
+        return best_results
+
+    def _wrap(self, model_network):
+        """
+        Wraps the model in DistributedDataParallel or DataParallel when training on multiple devices, and moves it to the device
+        """
+        if self._is_distributed:
+            model_network.to(device=self._default_device)
+            device_ids = [self._default_device] if self._device_type == "cuda" else None
+            model_network = nn.parallel.DistributedDataParallel(model_network, device_ids=device_ids)
+            self._logger.info("Using distributed data parallel, rank {} of {} with device {}".format(
+                torch.distributed.get_rank(), torch.distributed.get_world_size(), self._default_device))
+        elif self._is_multigpu:
             model_network = nn.DataParallel(model_network, device_ids=self.device, output_device=self._default_device)
             self._logger.info("Using multi gpu with devices {}, default {} ".format(self.device, self._default_device))
 
         model_network.to(device=self._default_device)
+        self._wrapped_trainable = self._trainable_parameters(model_network)
+        return model_network
+
+    def _apply_epoch_start(self, model_network, optimizer, epoch):
+        if self.on_epoch_start is None:
+            return model_network
+
+        self.on_epoch_start(self._unwrap(model_network), optimizer, epoch)
 
-        for epoch in range(self.epochs):
-            losses_train = []
-            actual_train = []
-            predicted_train = []
+        # Distributed data parallel only reduces the gradients of the parameters that were trainable when it was wrapped
+        if isinstance(model_network, nn.parallel.DistributedDataParallel) \
+                and self._trainable_parameters(model_network) != self._wrapped_trainable:
+            model_network = self._wrap(self._unwrap(model_network))
+        return model_network
 
-            self._logger.debug("Running epoch {}".format(self.epochs))
-            
+    @staticmethod
+    def _trainable_parameters(model_network):
+        return [id(p) for p in model_network.parameters() if p.requires_grad]
+
+    def _run_epochs(self, train_iter, validation_iter, model_network, loss_function, optimizer, scheduler, scaler,
+                    start_epoch,
+                    resume_batches, resume_metrics, iterations, update_steps, best_score, best_results,
+                    no_improvement_epochs):
+        start = datetime.datetime.now()
+        val_log_template = ' '.join(
+            '{:>6.0f},{:>5.0f},{:>9.0f},{:>5.0f}/{:<5.0f} {:>7.0f}%,{:>8.6f},{:8.6f},{:12.4f},{:12.4f}'.split(','))
+        val_log_template = "Run {}".format(val_log_template)
+
+        logger = self._logger
+        for epoch in range(start_epoch, self.epochs):
+            # Captured before the data loader draws from the rng to shuffle, so that resuming from a checkpoint
+            # within the epoch replays the same order of batches
+            epoch_rng_state = self._get_rng_state()
+
+            # Running metrics are accumulated on the device, to avoid a device to host sync per batch
+            loss_train = torch.zeros((), device=self._default_device)
+            correct_train = torch.zeros((), dtype=torch.long, device=self._default_device)
+            num_train = 0
+            batch_size = 0
+            if resume_metrics is not None:
+                loss_train += resume_metrics[0]
+                correct_train += resume_metrics[1]
+                num_train = int(resume_metrics[2])
+
+            logger.debug("Running epoch %s", epoch)
+            self._set_sampler_epoch(train_iter, epoch)
+            model_network = self._apply_epoch_start(model_network, optimizer, epoch)
+
+            # Step 1. train
+            model_network.train()
             model_network.zero_grad()
-            for idx, batch in enumerate(train_iter):
-                self._logger.debug("Running batch {}".format(idx))
-                batch_x = batch[0].to(device=self._default_device)
-                batch_y = batch[1].to(device=self._default_device)
-
-                self._logger.debug("batch x shape is {}".format(batch_x.shape))
-
-                iterations += 1
-
-                # Step 1. train
-                model_network.train()
-               
-                # Step 2. Run the forward pass
-                # words
-                self._logger.debug("Running forward")
-                predicted = model_network(batch_x)[0]
-
-                # Step 3. Compute loss
-                self._logger.debug("Running loss")
-                loss = loss_function(predicted, batch_y) / self.accumulation_steps
-                loss.backward()
-
-                losses_train.append(loss.item())
-                actual_train.extend(batch_y.cpu().tolist())
-                predicted_train.extend(torch.max(predicted, 1)[1].view(-1).cpu().tolist())
-
-                # Step 4. Only update weights after gradients are accumulated for n steps
-                if (idx + 1) % self.accumulation_steps == 0:
-                    self._logger.debug("Running optimiser")
-                    optimizer.step()
-                    model_network.zero_grad()
+            # Copies the next batch to the device while training on the current batch
+            train_batches = DevicePrefetcher(train_iter, self._default_device)
+            train_start = time.perf_counter()
+            # Join allows the distributed processes to have an uneven number of batches
+            with self._join(model_network):
+                for idx, batch in enumerate(train_batches):
+                    # Skip the batches completed before the checkpoint that training resumed from
+                    if idx < resume_batches:
+                        continue
+
+                    logger.debug("Running batch %s", idx)
+                    batch_x, batch_y = batch[0], batch[1]
+                    # The data wait of this batch, read before the next batch is loaded
+                    data_wait_seconds, copy_seconds = train_batches.last_wait_seconds, train_batches.last_copy_seconds
+
+                    iterations += 1
+                    is_update_step = (idx + 1) % self.accumulation_steps == 0
+
+                    # Only synchronise the gradients across the distributed processes when updating the weights
+                    with self._no_sync(model_network, skip_sync=not is_update_step):
+                        # Step 2. Run the forward pass
+                        # words
+                        with self._profiler.stage("forward"), self._autocast():
+                            predicted = self._forward(model_network, batch_x)[0]
+
+                            # Step 3. Compute loss
+                            loss = loss_function(predicted, batch_y) / self.accumulation_steps
+                        with self._profiler.stage("backward"):
+                            scaler.scale(loss).backward()
+
+                    loss_train += loss.detach()
+                    correct_train += (torch.max(predicted, 1)[1].view(-1) == batch_y).sum()
+                    num_train += len(batch_y)
+                    batch_size = len(batch_y)
+
+                    # Step 4. Only update weights after gradients are accumulated for n steps
+                    if is_update_step:
+                        logger.debug("Running optimiser")
+                        with self._profiler.stage("optimizer"):
+                            scaler.step(optimizer)
+                            scaler.update()
+                            model_network.zero_grad()
+                            if scheduler is not None:
+                                scheduler.step()
+                        update_steps += 1
+
+                        if self.checkpoint_dir and self.checkpoint_steps and update_steps % self.checkpoint_steps == 0 \
+                                and self._is_main_process:
+                            self.create_checkpoint(model_network, self.checkpoint_dir, iterations, optimizer, scaler,
+                                                   scheduler, training_state={
+                                                       "epoch": epoch, "batch_idx": idx + 1,
+                                                       "unfrozen_epoch": epoch,
+                                                       "iterations": iterations, "update_steps": update_steps,
+                                                       "best_score": best_score, "best_results": best_results,
+                                                       "no_improvement_epochs": no_improvement_epochs,
+                                                       "rng_state": epoch_rng_state,
+                                                       "train_metrics": [loss_train, correct_train, num_train]})
+
+                    if self.log_interval and (idx + 1) % self.log_interval == 0:
+                        logger.info("Epoch {} batch {}, running train loss {:.6f}, accuracy {:.4f}".format(
+                            epoch, idx + 1, loss_train.item() / (idx + 1), correct_train.item() / num_train))
+
+                    self._profiler.step(epoch, iterations, batch_x, batch_y, data_wait_seconds, copy_seconds)
+
+            resume_batches, resume_metrics = 0, None
+            self._logger.info("Epoch {} data wait {:.2f} ms / step over {} steps, {:.1f}% of the train time".format(
+                epoch, train_batches.mean_wait_ms, train_batches.steps,
+                100 * train_batches.wait_seconds / max(time.perf_counter() - train_start, 1e-9)))
+            self._profiler.epoch_end(epoch, trainable_params=sum(
+                p.numel() for p in model_network.parameters() if p.requires_grad))
 
             # Print training set results
             self._logger.info("Train set result details:")
-            train_loss = sum(losses_train) / len(losses_train)
-            train_score = accuracy_score(actual_train, predicted_train)
+            loss_train, correct_train, num_train, num_batches = self._sum_across_processes(loss_train, correct_train,
+                                                                                           num_train, idx + 1)
+            train_loss = loss_train / num_batches
+            train_score = correct_train / num_train
             self._logger.info("Train set result details: {}".format(train_score))
 
             # Print validation set results
             self._logger.info("Validation set result details:")
-            val_actuals, val_predicted, val_loss = self.validate(loss_function, model_network, validation_iter)
-            val_score = accuracy_score(val_actuals, val_predicted)
+            val_actuals, val_predicted, val_loss = self._validate(loss_function, model_network, validation_iter)
+            val_loss, val_correct, num_val = self._sum_across_processes(val_loss, (val_actuals == val_predicted).sum(),
+                                                                        len(val_actuals))
+            val_loss = val_loss / num_val
+            val_score = val_correct / num_val
             self._logger.info("Validation set result details: {} ".format(val_score))
 
             # Snapshot best score
             if best_score is None or val_score > best_score:
-                best_results = (val_score, val_actuals, val_predicted)
+                best_results = (val_score, val_actuals.cpu().tolist(), val_predicted.cpu().tolist())
                 self._logger.info(
                     "Snapshotting because the current score {} is greater than {} ".format(val_score, best_score))
-                self.snapshot(model_network, model_dir=self.model_dir)
+                if self._is_main_process:
+                    self.snapshot(model_network, model_dir=self.model_dir)
                 best_score = val_score
                 no_improvement_epochs = 0
             else:
                 no_improvement_epochs += 1
 
             # Checkpoint
-            if self.checkpoint_dir and (epoch % self.checkpoint_frequency == 0):
-                self.create_checkpoint(model_network, self.checkpoint_dir)
+            if self.checkpoint_dir and (epoch % self.checkpoint_frequency == 0) and self._is_main_process:
+                self.create_checkpoint(model_network, self.checkpoint_dir, iterations, optimizer, scaler, scheduler,
+                                       training_state={
+                                           "epoch": epoch + 1, "batch_idx": 0,
+                                           "unfrozen_epoch": epoch,
+                                           "iterations": iterations, "update_steps": update_steps,
+                                           "best_score": best_score, "best_results": best_results,
+                                           "no_improvement_epochs": no_improvement_epochs,
+                                           "rng_state": self._get_rng_state(),
+                                           "train_metrics": None})
 
             # evaluate performance on validation set periodically
             self._logger.info(val_log_template.format((datetime.datetime.now() - start).seconds,
-                                                      epoch, iterations, 1 + len(batch_x), len(train_iter),
-                                                      100. * (1 + len(batch_x)) / len(train_iter), train_loss,
+                                                      epoch, iterations, 1 + batch_size, idx + 1,
+                                                      100. * (1 + batch_size) / (idx + 1), train_loss,
                                                       val_loss, train_score,
                                                       val_score))
 
@@ -167,54 +365,184 @@ class Train:
         return best_results
 
     def validate(self, loss_function, model_network, val_iter):
+        actuals, predicted, val_loss = self._validate(loss_function, model_network, val_iter)
+
+        # Average loss
+        val_loss = val_loss.item() / len(actuals)
+        return actuals.cpu().tolist(), predicted.cpu().tolist(), val_loss
+
+    def _validate(self, loss_function, model_network, val_iter):
+        """
+        Runs validation, keeping the actuals and predictions on the device
+        :return: a tuple (actuals tensor, predicted tensor, total loss tensor)
+        """
+        # Validate using the underlying module, as the distributed processes validate independently
+        model_network = self._unwrap(model_network)
+
         # switch model to evaluation mode
         model_network.eval()
 
         # total loss
-        val_loss = 0
+        val_loss = torch.zeros((), device=self._default_device)
 
-        actuals = torch.tensor([], dtype=torch.long).to(device=self._default_device)
-        predicted = torch.tensor([], dtype=torch.long).to(device=self._default_device)
+        # Concatenated once at the end, as concatenating per batch is quadratic
+        actuals = []
+        predicted = []
 
         with torch.no_grad():
-            for idx, val in enumerate(val_iter):
-                val_batch_idx = val[0].to(device=self._default_device)
-                val_y = val[1].to(device=self._default_device)
+            for idx, val in enumerate(DevicePrefetcher(val_iter, self._default_device)):
+                val_batch_idx, val_y = val[0], val[1]
 
-                pred_batch_y = model_network(val_batch_idx)[0]
+                with self._autocast():
+                    pred_batch_y = self._forward(model_network, val_batch_idx)[0]
 
-                # compute loss
-                val_loss += loss_function(pred_batch_y, val_y).item()
+                    # compute loss
+                    val_loss += loss_function(pred_batch_y, val_y).detach()
 
-                actuals = torch.cat([actuals, val_y])
-                pred_flat = torch.max(pred_batch_y, dim=1)[1].view(-1)
-                predicted = torch.cat([predicted, pred_flat])
+                actuals.append(val_y)
+                predicted.append(torch.max(pred_batch_y, dim=1)[1].view(-1))
 
-        # Average loss
-        val_loss = val_loss / len(actuals)
-        return actuals.cpu().tolist(), predicted.cpu().tolist(), val_loss
+        actuals = torch.cat(actuals) if len(actuals) > 0 else torch.tensor([], dtype=torch.long)
+        predicted = torch.cat(predicted) if len(predicted) > 0 else torch.tensor([], dtype=torch.long)
 
-    def create_checkpoint(self, model, checkpoint_dir):
-        checkpoint_path = os.path.join(checkpoint_dir, 'checkpoint.pt')
+        return actuals, predicted, val_loss
 
-        self._logger.info("Checkpoint model to {}".format(checkpoint_path))
+    def _autocast(self):
+        dtype = torch.float16 if self.mixed_precision == "fp16" else torch.bfloat16
+        return torch.autocast(device_type=self._device_type, dtype=dtype, enabled=self.mixed_precision is not None)
 
+    def _sum_across_processes(self, *values):
+        """
+        Sums the values across the distributed processes, and copies the result to the host in a single sync
+        :param values: Scalar tensors or numbers
+        :return: a list of floats
+        """
+        result = torch.stack([torch.as_tensor(v, device=self._default_device).double() for v in values])
+        if self._is_distributed:
+            torch.distributed.all_reduce(result)
+        return result.tolist()
+
+    @staticmethod
+    def _set_sampler_epoch(data_iter, epoch):
+        # Distributed samplers use the epoch to shuffle differently in each epoch
+        for sampler in (getattr(data_iter, "sampler", None), getattr(data_iter, "batch_sampler", None)):
+            if hasattr(sampler, "set_epoch"):
+                sampler.set_epoch(epoch)
+
+    @staticmethod
+    def _join(model_network):
+        if isinstance(model_network, nn.parallel.DistributedDataParallel):
+            return model_network.join()
+        return contextlib.nullcontext()
+
+    @staticmethod
+    def _no_sync(model_network, skip_sync):
+        if skip_sync and isinstance(model_network, nn.parallel.DistributedDataParallel):
+            return model_network.no_sync()
+        return contextlib.nullcontext()
+
+    @staticmethod
+    def _unwrap(model_network):
+        if isinstance(model_network, (nn.DataParallel, nn.parallel.DistributedDataParallel)):
+            return model_network.module
+        return model_network
+
+    @staticmethod
+    def _forward(model_network, x):
+        if isinstance(x, (tuple, list)):
+            return model_network(*x)
+        return model_network(x)
+
+    def create_checkpoint(self, model, checkpoint_dir, step=0, optimizer=None, scaler=None, scheduler=None,
+                          training_state=None):
+        """
+        Checkpoints the model weights, and optionally the optimiser, grad scaler and training progress so that training can resume where it left off.
+        The state is copied to the cpu and written on a background thread
+        :param step: The global step, the latest step is resumed from
+        :param training_state: A dict of the training progress, e.g. epoch, batch and rng state
+        """
         # If nn.dataparallel, get the underlying module
-        if isinstance(model, torch.nn.DataParallel):
-            model = model.module
-
-        torch.save({
-            'model_state_dict': model.state_dict(),
-        }, checkpoint_path)
+        model = self._unwrap(model)
+
+        checkpoint = {'model_state_dict': model.state_dict()}
+        if optimizer is not None:
+            checkpoint['optimizer_state_dict'] = optimizer.state_dict()
+        if scaler is not None:
+            checkpoint['scaler_state_dict'] = scaler.state_dict()
+        if scheduler is not None:
+            checkpoint['scheduler_state_dict'] = scheduler.state_dict()
+        if training_state is not None:
+            checkpoint['training_state'] = training_state
+
+        if self._checkpoint_writer is None or self._checkpoint_writer.checkpoint_dir != checkpoint_dir:
+            self._checkpoint_writer = CheckpointWriter(checkpoint_dir, keep_last=self.checkpoint_keep)
+
+        checkpoint_path = self._checkpoint_writer.save(checkpoint, step)
+        self._logger.info("Checkpoint model to {}".format(checkpoint_path))
+        return checkpoint_path
 
     def try_load_statedict_from_checkpoint(self):
         loaded_weights = None
-        if self.checkpoint_dir is not None:
-            model_files = list(glob.glob("{}/*.pt".format(self.checkpoint_dir)))
-            if len(model_files) > 0:
-                model_file = model_files[0]
-                self._logger.info(
-                    "Loading checkpoint {} , found {} checkpoint files".format(model_file, len(model_files)))
-                checkpoint = torch.load(model_file)
-                loaded_weights = checkpoint['model_state_dict']
+        checkpoint = self._load_checkpoint()
+        if checkpoint is not None:
+            loaded_weights = checkpoint['model_state_dict']
         return loaded_weights
+
+    def _load_checkpoint(self):
+        """
+        Loads the latest checkpoint from the checkpoint dir
+        :return: The checkpoint dict, or None when there is no checkpoint
+        """
+        if self.checkpoint_dir is None:
+            return None
+
+        model_file = CheckpointWriter.latest_checkpoint(self.checkpoint_dir)
+        if model_file is None:
+            # Checkpoint written by an earlier version, containing the model weights only
+            model_files = sorted(glob.glob("{}/*.pt".format(self.checkpoint_dir)), key=os.path.getmtime)
+            if len(model_files) == 0:
+                return None
+            model_file = model_files[-1]
+
+        self._logger.info("Loading checkpoint {}".format(model_file))
+        return torch.load(model_file, map_location="cpu")
+
+    def _load_training_state(self, model_network, optimizer, scaler, scheduler=None):
+        """
+        Restores the model, optimiser, grad scaler and learning rate schedule from the latest checkpoint
+        :return: The training progress dict of the checkpoint, or None when there is no checkpoint to resume from
+        """
+        checkpoint = self._load_checkpoint()
+        if checkpoint is None or 'training_state' not in checkpoint:
+            return None
+
+        self._unwrap(model_network).load_state_dict(checkpoint['model_state_dict'])
+        if self.on_epoch_start is not None:
+            # Replays the epochs up to the one the optimiser was saved in, so that the optimiser param groups match
+            # the checkpoint. The epoch end checkpoints are saved before the next epoch changes the param groups
+            training_state = checkpoint['training_state']
+            unfrozen_epoch = training_state.get('unfrozen_epoch', training_state['epoch'])
+            for epoch in range(unfrozen_epoch + 1):
+                self.on_epoch_start(self._unwrap(model_network), optimizer, epoch)
+        if 'optimizer_state_dict' in checkpoint:
+            optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
+        if 'scaler_state_dict' in checkpoint:
+            scaler.load_state_dict(checkpoint['scaler_state_dict'])
+        if scheduler is not None and 'scheduler_state_dict' in checkpoint:
+            scheduler.load_state_dict(checkpoint['scheduler_state_dict'])
+
+        return checkpoint['training_state']
+
+    @staticmethod
+    def _get_rng_state():
+        state = {"python": random.getstate(), "torch": torch.get_rng_state()}
+        if torch.cuda.is_available():
+            state["cuda"] = torch.cuda.get_rng_state_all()
+        return state
+
+    @staticmethod
+    def _set_rng_state(state):
+        random.setstate(state["python"])
+        torch.set_rng_state(state["torch"])
+        if torch.cuda.is_available() and "cuda" in state:
+            torch.cuda.set_rng_state_all(state["cuda"])
@@ -0,0 +1,79 @@
+import torch
+from torch.utils.data import Sampler
+
+
+class BucketBatchSampler(Sampler):
+    """
+    Batch sampler that groups items of similar length into the same batch, so that dynamically padded batches contain few pad tokens.
+    When shuffled, the items are randomly permuted and split into buckets of batch_size * bucket_size_multiplier items.
+    Each bucket is sorted by length and split into batches, and then the order of the batches is shuffled.
+    When distributed, each replica gets every num_replicas th batch of the same permutation, similar to DistributedSampler.
+    """
+
+    def __init__(self, lengths, batch_size, shuffle=True, bucket_size_multiplier=100, num_replicas=None, rank=None,
+                 seed=0):
+        """
+        :param lengths: The length of each item in the dataset
+        :param batch_size: The batch size
+        :param shuffle: If False, the items are sorted by length across the entire dataset, e.g. for validation
+        :param bucket_size_multiplier: The number of batches in a bucket, a larger bucket results in less padding but less randomness
+        :param num_replicas: The number of distributed processes, if set the permutation is seeded by the seed and the epoch so that all the replicas use the same permutation
+        :param rank: The rank of the current distributed process
+        :param seed: The seed used when distributed
+        """
+        self.lengths = torch.as_tensor(lengths)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.bucket_size_multiplier = bucket_size_multiplier
+        self.num_replicas = num_replicas or 1
+        self.rank = rank or 0
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __iter__(self):
+        batches = self._batches()
+        return iter(batches[self.rank::self.num_replicas])
+
+    def _batches(self):
+        num_items = len(self.lengths)
+        if not self.shuffle:
+            return self._split(self._sort_by_length(torch.arange(num_items)))
+
+        generator = torch.Generator()
+        if self.num_replicas > 1:
+            generator.manual_seed(self.seed + self.epoch)
+        else:
+            # Seed from the torch global random state similar to RandomSampler, so that the torch seed makes the order reproducible
+            generator.manual_seed(int(torch.empty((), dtype=torch.int64).random_().item()))
+
+        indices = torch.randperm(num_items, generator=generator)
+        bucket_size = self.batch_size * self.bucket_size_multiplier
+        batches = []
+        for start in range(0, num_items, bucket_size):
+            batches.extend(self._split(self._sort_by_length(indices[start: start + bucket_size])))
+
+        batch_order = torch.randperm(len(batches), generator=generator).tolist()
+        return [batches[i] for i in batch_order]
+
+    def _sort_by_length(self, indices):
+        _, order = torch.sort(self.lengths[indices], stable=True)
+        return indices[order].tolist()
+
+    def _split(self, indices):
+        return [indices[i: i + self.batch_size] for i in range(0, len(indices), self.batch_size)]
+
+    def __len__(self):
+        num_items = len(self.lengths)
+        bucket_size = self.batch_size * self.bucket_size_multiplier
+        if not self.shuffle:
+            num_batches = (num_items + self.batch_size - 1) // self.batch_size
+        else:
+            # Each bucket, including the last partial bucket, may end with a partial batch
+            full_buckets, remainder = divmod(num_items, bucket_size)
+            num_batches = full_buckets * self.bucket_size_multiplier + (remainder + self.batch_size - 1) // self.batch_size
+
+        # The number of batches assigned to this rank
+        return (num_batches - self.rank + self.num_replicas - 1) // self.num_replicas
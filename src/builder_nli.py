@@ -1,24 +1,83 @@
 import logging
 import os
 
+import torch.distributed
 from torch import nn
-from torch.optim import Adam
-from torch.utils.data import DataLoader
-from transformers import BertTokenizer
+from torch.utils.data import DataLoader, DistributedSampler
+from transformers import BertTokenizerFast, PreTrainedTokenizerFast
 
-from bert_model import BertModel
+from bert_model import BertClassifierHead, BertModel
 from bert_train import Train
+from bucket_batch_sampler import BucketBatchSampler
+from dynamic_padding_collator import DynamicPaddingCollator
+from gradual_unfreezer import GradualUnfreezer
+from model_artifacts import ModelArtifacts
+from nli_feature_cache import NliFeatureCache
+from nli_mixture_dataset import NliMixtureDataset
+from optimiser_factory import OptimiserFactory
 from preprocessor_nli_bert_tokeniser import PreprocessorNliBertTokeniser
+from preprocessor_nli_bert_tokeniser_fast import PreprocessorNliBertTokeniserFast
 from snli_dataset import SnliDataset
 from snli_dataset_label_mapper import SnliLabelMapper
+from snli_iterable_dataset import SnliIterableDataset
+from weighted_mixture_sampler import WeightedMixtureSampler
 
 
 class BuilderNli:
 
     def __init__(self, train_data, val_data, model_dir, num_workers=None, checkpoint_dir=None, epochs=10,
                  early_stopping_patience=10, checkpoint_frequency=1, grad_accumulation_steps=8, batch_size=8,
-                 max_seq_len=512, learning_rate=0.00001, fine_tune=True):
+                 max_seq_len=512, learning_rate=0.00001, fine_tune=True, token_cache_dir=None,
+                 dynamic_padding=False, streaming=False, mixed_precision=None, log_interval=None, checkpoint_steps=None,
+                 checkpoint_keep=3, pin_memory=None, prefetch_factor=2, persistent_workers=True, metrics_file=None,
+                 profile_steps=None, trace_dir=None, feature_cache_dir=None, freeze_layers=None, unfreeze_every=None,
+                 gradient_checkpointing=False, optimiser="adam", weight_decay=0.0, optimiser_implementation=None,
+                 warmup_steps=0, lr_schedule="constant", train_mixture=None, val_mixture=None):
+        assert train_mixture is None or not streaming, "A train mixture does not support streaming"
+        assert (train_mixture is None and val_mixture is None) or not feature_cache_dir, \
+            "The feature cache does not support mixtures"
         self.model_dir = model_dir
+        # Optionally, trains on a mixture of sources instead of the train data, a list of tuples (source name, jsonl file, weight), see WeightedMixtureSampler
+        self.train_mixture = train_mixture
+        # Optionally, validates on the sources instead of the val data, a list of tuples (source name, jsonl file)
+        self.val_mixture = val_mixture
+        # See OptimiserFactory. The biases and LayerNorm weights are excluded from the weight decay
+        self.optimiser = optimiser
+        self.weight_decay = weight_decay
+        # None, "foreach" or "fused"
+        self.optimiser_implementation = optimiser_implementation
+        # The learning rate schedule is stepped per optimiser step, i.e. every grad_accumulation_steps batches
+        self.warmup_steps = warmup_steps
+        self.lr_schedule = lr_schedule
+        # Recomputes the activations of each encoder layer in the backward pass instead of keeping them, to fit a longer max_seq_len or a larger batch
+        self.gradient_checkpointing = gradient_checkpointing
+        # Only applies when not fine_tune. Freezes the embeddings and the bottom n encoder layers, 0 freezes the embeddings only
+        self.freeze_layers = freeze_layers
+        # Unfreezes one more of the frozen layers, top down, every n epochs
+        self.unfreeze_every = unfreeze_every
+        # When only the classifier is trained (fine_tune), runs the frozen encoder once and trains the classifier on the pooled output cached in this dir
+        self.feature_cache_dir = feature_cache_dir
+        # Writes the per step stage timings and throughput to the metrics file, and traces the profile steps using torch.profiler
+        self.metrics_file = metrics_file
+        self.profile_steps = profile_steps
+        self.trace_dir = trace_dir
+        # Pins the batches in page locked memory, so that the copy to the gpu is asynchronous. Defaults to True on cuda
+        self.pin_memory = torch.cuda.is_available() if pin_memory is None else pin_memory
+        # The number of batches loaded in advance by each worker
+        self.prefetch_factor = prefetch_factor
+        # Keeps the workers, and so their copy of the dataset, alive across epochs instead of respawning them every epoch
+        self.persistent_workers = persistent_workers
+        # Checkpoints within an epoch every n optimiser steps, in addition to the end of epoch checkpoints
+        self.checkpoint_steps = checkpoint_steps
+        self.checkpoint_keep = checkpoint_keep
+        self.log_interval = log_interval
+        # None (fp32), "bf16" or "fp16"
+        self.mixed_precision = mixed_precision
+        # Streams the train and val files instead of loading them into memory, the train data is not shuffled
+        self.streaming = streaming
+        # Pads each batch to its longest sequence, and groups sequences of similar length into the same batch
+        self.dynamic_padding = dynamic_padding
+        self.token_cache_dir = token_cache_dir
         self.fine_tune = fine_tune
         self.learning_rate = learning_rate
         self.checkpoint_frequency = checkpoint_frequency
@@ -30,7 +89,7 @@ class BuilderNli:
         self.val_data = val_data
         self.batch_size = batch_size
         # Note: Since the max seq len for pos embedding is 512 , in the pretrained  bert this must be less than eq to 512
-        # Also note increasing the length greater also will create GPU out of mememory error
+        # Also note increasing the length greater also will create GPU out of mememory error, see gradient_checkpointing
         self._max_seq_len = max_seq_len
         if num_workers is None:
             self.num_workers = os.cpu_count() - 1
@@ -41,6 +100,7 @@ class BuilderNli:
             self.num_workers = 0
 
         self._network = None
+        self._train_network = None
         self._train_dataloader = None
         self._train_dataset = None
         self._val_dataset = None
@@ -48,6 +108,8 @@ class BuilderNli:
         self._trainer = None
         self._lossfunc = None
         self._optimiser = None
+        self._optimiser_factory = None
+        self._scheduler = None
         self._label_mapper = None
 
         self._bert_model_name = "bert-base-cased"
@@ -70,9 +132,16 @@ class BuilderNli:
         self._logger.info("Retrieving Tokeniser")
 
         if self._tokenisor is None:
-            self._tokenisor = BertTokenizer.from_pretrained(self._bert_model_name, do_lower_case=self._token_lower_case)
+            self._tokenisor = BertTokenizerFast.from_pretrained(self._bert_model_name,
+                                                                do_lower_case=self._token_lower_case)
 
-        preprocessor = PreprocessorNliBertTokeniser(max_feature_len=self._max_seq_len, tokeniser=self._tokenisor)
+        # Use the batch oriented preprocessor when the tokeniser is the Rust backed fast tokeniser
+        preprocessor_class = PreprocessorNliBertTokeniser
+        if isinstance(self._tokenisor, PreTrainedTokenizerFast):
+            preprocessor_class = PreprocessorNliBertTokeniserFast
+
+        preprocessor = preprocessor_class(max_feature_len=self._max_seq_len, tokeniser=self._tokenisor,
+                                          pad_to_max=not self.dynamic_padding)
         self._logger.info("Completed retrieving Tokeniser")
 
         return preprocessor
@@ -87,7 +156,9 @@ class BuilderNli:
         state_dict = self.get_trainer().try_load_statedict_from_checkpoint()
 
         self._network = BertModel(self._bert_model_name, self.get_label_mapper().num_classes,
-                                  fine_tune=self.fine_tune, bert_config=self._bert_config)
+                                  fine_tune=self.fine_tune, bert_config=self._bert_config,
+                                  freeze_layers=self.freeze_layers,
+                                  gradient_checkpointing=self.gradient_checkpointing)
 
         if state_dict is not None:
             # Only load from BERT pretrained when no checkpoint is available
@@ -98,15 +169,47 @@ class BuilderNli:
 
         return self._network
 
+    def get_train_network(self):
+        """
+        :return: the network to train, the classifier head when training on the cached encoder features, else the network
+        """
+        if self._train_network is None:
+            self._train_network = self.get_network()
+            if self._use_feature_cache:
+                self._train_network = BertClassifierHead(self.get_network())
+
+        return self._train_network
+
+    @property
+    def _use_feature_cache(self):
+        return self.feature_cache_dir is not None and self.fine_tune
+
     def get_train_dataset(self):
+        if self._train_dataset is None and self.train_mixture is not None:
+            self._train_dataset = NliMixtureDataset([(name, file) for name, file, _ in self.train_mixture],
+                                                    preprocessor=self.get_preprocessor(),
+                                                    token_cache_dir=self.token_cache_dir)
+
+        if self._train_dataset is None and self.streaming:
+            self._train_dataset = SnliIterableDataset(self.train_data, preprocessor=self.get_preprocessor())
+
         if self._train_dataset is None:
-            self._train_dataset = SnliDataset(self.train_data, preprocessor=self.get_preprocessor())
+            self._train_dataset = SnliDataset(self.train_data, preprocessor=self.get_preprocessor(),
+                                              token_cache_dir=self.token_cache_dir)
 
         return self._train_dataset
 
     def get_val_dataset(self):
+        if self._val_dataset is None and self.val_mixture is not None:
+            self._val_dataset = NliMixtureDataset(self.val_mixture, preprocessor=self.get_preprocessor(),
+                                                  token_cache_dir=self.token_cache_dir)
+
+        if self._val_dataset is None and self.streaming:
+            self._val_dataset = SnliIterableDataset(self.val_data, preprocessor=self.get_preprocessor())
+
         if self._val_dataset is None:
-            self._val_dataset = SnliDataset(self.val_data, preprocessor=self.get_preprocessor())
+            self._val_dataset = SnliDataset(self.val_data, preprocessor=self.get_preprocessor(),
+                                            token_cache_dir=self.token_cache_dir)
 
         return self._val_dataset
 
@@ -120,32 +223,212 @@ class BuilderNli:
         return self.get_label_mapper().positive_label_index
 
     def get_train_val_dataloader(self):
+        if self._use_feature_cache:
+            return self._get_feature_cache_train_val_dataloader()
+
+        if self.train_mixture is not None:
+            return self._get_mixture_train_val_dataloader()
+
+        # Length bucketing requires random access to the dataset, and so does not apply to streaming
+        if self.dynamic_padding and not self.streaming:
+            return self._get_dynamic_padding_train_val_dataloader()
+
+        collate_fn = None
+        if self.dynamic_padding:
+            collate_fn = DynamicPaddingCollator(pad_index=self.get_preprocessor().pad_index)
+
+        if self._train_dataloader is None:
+            # Iterable datasets cannot be shuffled by the data loader, and are sharded across the distributed processes by the dataset
+            train_dataset = self.get_train_dataset()
+            sampler = self._get_distributed_sampler(train_dataset, shuffle=True)
+            self._train_dataloader = DataLoader(dataset=train_dataset, batch_size=self.batch_size,
+                                                shuffle=not self.streaming and sampler is None,
+                                                sampler=sampler, collate_fn=collate_fn,
+                                                **self._get_dataloader_worker_kwargs())
+
+        if self._val_dataloader is None:
+            val_dataset = self.get_val_dataset()
+            sampler = self._get_distributed_sampler(val_dataset, shuffle=False)
+            self._val_dataloader = DataLoader(dataset=val_dataset, batch_size=self.batch_size, shuffle=False,
+                                              sampler=sampler, collate_fn=collate_fn,
+                                              **self._get_dataloader_worker_kwargs())
+
+        return self._train_dataloader, self._val_dataloader
+
+    def _get_dynamic_padding_train_val_dataloader(self):
+        collate_fn = DynamicPaddingCollator(pad_index=self.get_preprocessor().pad_index)
+
+        num_replicas, rank = self._get_distributed_rank()
+
+        if self._train_dataloader is None:
+            train_dataset = self.get_train_dataset()
+            batch_sampler = BucketBatchSampler(train_dataset.lengths, batch_size=self.batch_size, shuffle=True,
+                                               num_replicas=num_replicas, rank=rank)
+            self._train_dataloader = DataLoader(dataset=train_dataset, batch_sampler=batch_sampler,
+                                                collate_fn=collate_fn, **self._get_dataloader_worker_kwargs())
+
+        if self._val_dataloader is None:
+            val_dataset = self.get_val_dataset()
+            batch_sampler = BucketBatchSampler(val_dataset.lengths, batch_size=self.batch_size, shuffle=False,
+                                               num_replicas=num_replicas, rank=rank)
+            self._val_dataloader = DataLoader(dataset=val_dataset, batch_sampler=batch_sampler,
+                                              collate_fn=collate_fn, **self._get_dataloader_worker_kwargs())
+
+        return self._train_dataloader, self._val_dataloader
+
+    def _get_mixture_train_val_dataloader(self):
+        # The sources are mixed by the sampler, and so the items are not bucketed by length
+        collate_fn = None
+        if self.dynamic_padding:
+            collate_fn = DynamicPaddingCollator(pad_index=self.get_preprocessor().pad_index)
+
+        num_replicas, rank = self._get_distributed_rank()
+
         if self._train_dataloader is None:
-            self._train_dataloader = DataLoader(dataset=self.get_train_dataset(), num_workers=self.num_workers,
-                                                batch_size=self.batch_size, shuffle=True)
+            train_dataset = self.get_train_dataset()
+            sampler = WeightedMixtureSampler(train_dataset.source_sizes, [w for _, _, w in self.train_mixture],
+                                             num_replicas=num_replicas, rank=rank)
+            self._train_dataloader = DataLoader(dataset=train_dataset, batch_size=self.batch_size, sampler=sampler,
+                                                collate_fn=collate_fn, **self._get_dataloader_worker_kwargs())
 
         if self._val_dataloader is None:
-            self._val_dataloader = DataLoader(dataset=self.get_val_dataset(), num_workers=self.num_workers,
-                                              batch_size=self.batch_size, shuffle=False)
+            val_dataset = self.get_val_dataset()
+            if self.dynamic_padding and not self.streaming:
+                batch_sampler = BucketBatchSampler(val_dataset.lengths, batch_size=self.batch_size, shuffle=False,
+                                                   num_replicas=num_replicas, rank=rank)
+                self._val_dataloader = DataLoader(dataset=val_dataset, batch_sampler=batch_sampler,
+                                                  collate_fn=collate_fn, **self._get_dataloader_worker_kwargs())
+            else:
+                sampler = self._get_distributed_sampler(val_dataset, shuffle=False)
+                self._val_dataloader = DataLoader(dataset=val_dataset, batch_size=self.batch_size, shuffle=False,
+                                                  sampler=sampler, collate_fn=collate_fn,
+                                                  **self._get_dataloader_worker_kwargs())
 
         return self._train_dataloader, self._val_dataloader
 
+    def _get_dataloader_worker_kwargs(self):
+        """
+        :return: the data loader kwargs for the worker processes and pinning
+        """
+        kwargs = {"num_workers": self.num_workers, "pin_memory": self.pin_memory}
+        # Only applies to worker processes, the data loader rejects these when loading in the main process
+        if self.num_workers > 0:
+            kwargs["prefetch_factor"] = self.prefetch_factor
+            kwargs["persistent_workers"] = self.persistent_workers
+        return kwargs
+
+    def _get_feature_cache_train_val_dataloader(self):
+        if self._train_dataloader is None:
+            train_features = self._get_feature_cache(self.train_data, self.get_train_dataset)
+            sampler = self._get_distributed_sampler(train_features, shuffle=True)
+            self._train_dataloader = DataLoader(dataset=train_features, batch_size=self.batch_size,
+                                                shuffle=sampler is None, sampler=sampler,
+                                                **self._get_dataloader_worker_kwargs())
+
+        if self._val_dataloader is None:
+            val_features = self._get_feature_cache(self.val_data, self.get_val_dataset)
+            sampler = self._get_distributed_sampler(val_features, shuffle=False)
+            self._val_dataloader = DataLoader(dataset=val_features, batch_size=self.batch_size, shuffle=False,
+                                              sampler=sampler, **self._get_dataloader_worker_kwargs())
+
+        return self._train_dataloader, self._val_dataloader
+
+    def _get_feature_cache(self, source_file, get_dataset):
+        """
+        :param get_dataset: The function returning the dataset to build the cache from, only called when the cache does not exist, so that an existing cache does not load the source file.
+        When distributed, must be called by all the processes
+        """
+        feature_cache = NliFeatureCache(self.feature_cache_dir, source_file, self.get_preprocessor(),
+                                        self.get_network())
+        num_replicas, rank = self._get_distributed_rank()
+
+        # Only the main process builds the cache, on its own device, and the other processes wait for it
+        if feature_cache.exists():
+            self._logger.info("Using feature cache {}".format(feature_cache.path))
+        elif rank is None or rank == 0:
+            collate_fn = DynamicPaddingCollator(
+                pad_index=self.get_preprocessor().pad_index) if self.dynamic_padding else None
+            data_loader = DataLoader(dataset=get_dataset(), batch_size=self.batch_size, shuffle=False,
+                                     collate_fn=collate_fn, **self._get_dataloader_worker_kwargs())
+            feature_cache.build(data_loader, device=self.get_trainer().default_device)
+
+        if num_replicas is not None:
+            torch.distributed.barrier()
+        return feature_cache
+
+    @staticmethod
+    def _get_distributed_rank():
+        """
+        :return: a tuple (world size, rank) when the distributed process group is initialised, else (None, None)
+        """
+        if torch.distributed.is_available() and torch.distributed.is_initialized():
+            return torch.distributed.get_world_size(), torch.distributed.get_rank()
+        return None, None
+
+    def _get_distributed_sampler(self, dataset, shuffle):
+        num_replicas, rank = self._get_distributed_rank()
+        if num_replicas is None or self.streaming:
+            return None
+
+        # Note: The sampler pads the dataset with repeated items, so that every process gets the same number of items
+        return DistributedSampler(dataset, num_replicas=num_replicas, rank=rank, shuffle=shuffle)
+
     def get_loss_function(self):
         if self._lossfunc is None:
             self._lossfunc = nn.CrossEntropyLoss()
         return self._lossfunc
 
+    def get_optimiser_factory(self):
+        if self._optimiser_factory is None:
+            self._optimiser_factory = OptimiserFactory(optimiser=self.optimiser, learning_rate=self.learning_rate,
+                                                       weight_decay=self.weight_decay,
+                                                       implementation=self.optimiser_implementation,
+                                                       warmup_steps=self.warmup_steps, schedule=self.lr_schedule)
+        return self._optimiser_factory
+
     def get_optimiser(self):
         if self._optimiser is None:
-            self._optimiser = Adam(params=self.get_network().parameters(), lr=self.learning_rate)
+            # Only the trainable parameters, the gradual unfreezer adds the parameters as they are unfrozen
+            self._optimiser = self.get_optimiser_factory().create(self.get_network())
         return self._optimiser
 
+    def get_scheduler(self):
+        """
+        :return: The learning rate schedule, or None when the learning rate is constant
+        """
+        if self._scheduler is None:
+            total_steps = None
+            if self.lr_schedule == "linear":
+                assert not self.streaming or self._use_feature_cache, \
+                    "The linear schedule requires the number of train batches, which is unknown when streaming"
+                # The trainer only steps the optimiser after a full grad_accumulation_steps batches
+                train_dataloader, _ = self.get_train_val_dataloader()
+                total_steps = self.epochs * (len(train_dataloader) // self.grad_accumulation_steps)
+            self._scheduler = self.get_optimiser_factory().create_scheduler(self.get_optimiser(),
+                                                                            total_steps=total_steps)
+        return self._scheduler
+
+    def _get_unfreezer(self):
+        if self.fine_tune or self.freeze_layers is None or not self.unfreeze_every:
+            return None
+        return GradualUnfreezer(self.freeze_layers, unfreeze_every=self.unfreeze_every,
+                                param_groups=self.get_optimiser_factory().param_groups)
+
     def get_trainer(self):
         if self._trainer is None:
             self._trainer = Train(model_dir=self.model_dir, epochs=self.epochs,
                                   early_stopping_patience=self.early_stopping_patience,
                                   checkpoint_frequency=self.checkpoint_frequency,
                                   checkpoint_dir=self.checkpoint_dir,
-                                  accumulation_steps=self.grad_accumulation_steps)
+                                  accumulation_steps=self.grad_accumulation_steps,
+                                  mixed_precision=self.mixed_precision,
+                                  log_interval=self.log_interval,
+                                  checkpoint_steps=self.checkpoint_steps,
+                                  checkpoint_keep=self.checkpoint_keep,
+                                  snapshotter=ModelArtifacts.save_weights,
+                                  metrics_file=self.metrics_file,
+                                  profile_steps=self.profile_steps,
+                                  trace_dir=self.trace_dir,
+                                  on_epoch_start=self._get_unfreezer())
 
         return self._trainer
@@ -0,0 +1,123 @@
+import glob
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+
+class CheckpointWriter:
+    """
+    Writes training checkpoints on a background thread, so that the training loop does not stall on disk or network IO.
+    The tensors are copied to the cpu before returning, so the training loop can continue to update the weights and optimiser state in place.
+    Each checkpoint is written to a temp file and renamed, so that a partially written checkpoint is never picked up when resuming, and only the last n checkpoints are retained.
+    """
+
+    _prefix = "checkpoint_"
+    _suffix = ".pt"
+
+    def __init__(self, checkpoint_dir, keep_last=3, async_write=True):
+        """
+        :param checkpoint_dir: The directory to write the checkpoints to
+        :param keep_last: The number of most recent checkpoints to retain, the older checkpoints are deleted
+        :param async_write: Writes on a background thread when true, else writes in the calling thread
+        """
+        assert keep_last is None or keep_last > 0, "keep_last must be greater than 0, found {}".format(keep_last)
+        self.checkpoint_dir = checkpoint_dir
+        self.keep_last = keep_last
+        self.async_write = async_write
+        self._executor = None
+        self._pending = None
+
+    @property
+    def _logger(self):
+        return logging.getLogger(__name__)
+
+    def save(self, state, step):
+        """
+        Copies the state to the cpu and writes it as the checkpoint for the step.
+        At most one write is pending at a time, so if the previous write has not completed this waits for it.
+        :param state: The checkpoint dict, containing tensors, numbers, strings and nested lists / tuples / dicts of them
+        :param step: The global step, used to order the checkpoints
+        :return: The path of the checkpoint
+        """
+        checkpoint_path = os.path.join(self.checkpoint_dir, "{}{:010d}{}".format(self._prefix, step, self._suffix))
+        cpu_state = self.to_cpu(state)
+
+        # Raises any error from the previous write
+        self.wait()
+
+        if not self.async_write:
+            self._write(cpu_state, checkpoint_path)
+            return checkpoint_path
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint_writer")
+        self._pending = self._executor.submit(self._write, cpu_state, checkpoint_path)
+        return checkpoint_path
+
+    def wait(self):
+        """
+        Waits for the pending write to complete, raising the error if the write failed
+        """
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            pending.result()
+
+    def close(self):
+        try:
+            self.wait()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def _write(self, state, checkpoint_path):
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        tmp_path = "{}.tmp".format(checkpoint_path)
+
+        self._logger.info("Writing checkpoint {}".format(checkpoint_path))
+        torch.save(state, tmp_path)
+        # Atomic on posix, the checkpoint either exists completely or not at all
+        os.replace(tmp_path, checkpoint_path)
+
+        self._remove_old_checkpoints()
+
+    def _remove_old_checkpoints(self):
+        if self.keep_last is None:
+            return
+
+        for checkpoint_path in self.list_checkpoints(self.checkpoint_dir)[:-self.keep_last]:
+            self._logger.debug("Removing checkpoint {}".format(checkpoint_path))
+            os.remove(checkpoint_path)
+
+    @classmethod
+    def list_checkpoints(cls, checkpoint_dir):
+        """
+        :return: The checkpoint files in the directory, ordered from the oldest to the latest step
+        """
+        pattern = re.compile(r"^{}(\d+){}$".format(re.escape(cls._prefix), re.escape(cls._suffix)))
+        matches = [(pattern.match(os.path.basename(p)), p) for p in glob.glob(os.path.join(checkpoint_dir, "*"))]
+        return [p for _, p in sorted((int(m.group(1)), p) for m, p in matches if m is not None)]
+
+    @classmethod
+    def latest_checkpoint(cls, checkpoint_dir):
+        """
+        :return: The path of the latest checkpoint in the directory, or None when there are no checkpoints
+        """
+        checkpoints = cls.list_checkpoints(checkpoint_dir)
+        return checkpoints[-1] if len(checkpoints) > 0 else None
+
+    @classmethod
+    def to_cpu(cls, value):
+        """
+        Returns a copy of the value with all the tensors copied to the cpu
+        """
+        if isinstance(value, torch.Tensor):
+            return value.detach().to(device="cpu", copy=True)
+        if isinstance(value, dict):
+            return {k: cls.to_cpu(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return type(value)(cls.to_cpu(v) for v in value)
+        return value
@@ -0,0 +1,86 @@
+import time
+
+import torch
+
+
+class DevicePrefetcher:
+    """
+    Iterates a data loader, copying the next batch to the device while the current batch is being trained on.
+    On cuda the copy runs on a side stream, and so overlaps with the compute when the data loader pins the batches.
+    Measures the data wait, i.e. the time the training loop is blocked waiting for the next batch
+    """
+
+    def __init__(self, data_loader, device):
+        """
+        :param data_loader: The data loader returning batches (x, y), where x is either a tensor or a tuple of tensors
+        :param device: The device to copy the batches to
+        """
+        self.data_loader = data_loader
+        self.device = torch.device(device)
+        self._stream = torch.cuda.Stream(device=self.device) if self.device.type == "cuda" else None
+        self.wait_seconds = 0.0
+        self.steps = 0
+        # The time blocked loading the last returned batch, and the part of it spent issuing the copy to the device.
+        # As the batches are loaded one ahead, this is read when the batch is returned, before the next batch is loaded
+        self.last_wait_seconds = 0.0
+        self.last_copy_seconds = 0.0
+
+    @property
+    def mean_wait_ms(self):
+        return 1000 * self.wait_seconds / self.steps if self.steps else 0.0
+
+    def __len__(self):
+        return len(self.data_loader)
+
+    def __iter__(self):
+        self.wait_seconds, self.steps = 0.0, 0
+
+        data_iter = iter(self.data_loader)
+        start = time.perf_counter()
+        next_batch, next_load_seconds, next_copy_seconds = self._load(data_iter)
+        while next_batch is not None:
+            if self._stream is not None:
+                # The compute stream waits for the copy, and the copied tensors are not freed until the compute completes
+                torch.cuda.current_stream(self.device).wait_stream(self._stream)
+                self._record_stream(next_batch)
+            batch, self.last_wait_seconds, self.last_copy_seconds = next_batch, next_load_seconds, next_copy_seconds
+
+            # Starts loading the batch after, before the current batch is trained on
+            next_batch, next_load_seconds, next_copy_seconds = self._load(data_iter)
+            self.wait_seconds += time.perf_counter() - start
+            self.steps += 1
+
+            yield batch
+            start = time.perf_counter()
+
+    def _load(self, data_iter):
+        """
+        :return: a tuple (batch on the device or None when done, load seconds including the copy, copy seconds)
+        """
+        start = time.perf_counter()
+        try:
+            batch = next(data_iter)
+        except StopIteration:
+            return None, 0.0, 0.0
+
+        # On cuda this is the time to issue the asynchronous copy, rather than the time of the copy itself
+        copy_start = time.perf_counter()
+        if self._stream is None:
+            batch = self._to_device(batch, non_blocking=False)
+        else:
+            with torch.cuda.stream(self._stream):
+                batch = self._to_device(batch, non_blocking=True)
+        end = time.perf_counter()
+        return batch, end - start, end - copy_start
+
+    def _to_device(self, item, non_blocking):
+        if isinstance(item, (tuple, list)):
+            return type(item)(self._to_device(t, non_blocking) for t in item)
+        return item.to(device=self.device, non_blocking=non_blocking)
+
+    def _record_stream(self, item):
+        if isinstance(item, (tuple, list)):
+            for t in item:
+                self._record_stream(t)
+        else:
+            item.record_stream(torch.cuda.current_stream(self.device))
@@ -0,0 +1,47 @@
+import torch
+
+
+class DynamicPaddingCollator:
+    """
+    Collates a batch of variable length sequences, padding each sequence only to the longest sequence in the batch rather than to the max sequence length
+    """
+
+    def __init__(self, pad_index):
+        """
+        :param pad_index: The index of the pad token, e.g. the index of [PAD] in the BERT vocab
+        """
+        self.pad_index = pad_index
+
+    def __call__(self, batch):
+        """
+        :param batch: A list of (x, y) where x is either a 1D tensor of token indices or a tuple of 1D tensors (input_ids, attention_mask, token_type_ids)
+        :return: (x, y), x is a long tensor or a tuple of long tensors of shape [batch, longest sequence] and y is a tensor of labels
+        """
+        x, y = zip(*batch)
+
+        if isinstance(x[0], (tuple, list)):
+            x = self.pad_structured(x, self.pad_index)
+        else:
+            x = self.pad(x, self.pad_index)
+
+        return x, torch.tensor(y)
+
+    @staticmethod
+    def pad(sequences, pad_index):
+        max_len = max(len(s) for s in sequences)
+        result = torch.full((len(sequences), max_len), pad_index, dtype=torch.long)
+        for i, s in enumerate(sequences):
+            result[i, :len(s)] = s
+
+        return result
+
+    @staticmethod
+    def pad_structured(items, pad_index):
+        """
+        Pads a list of (input_ids, attention_mask, token_type_ids)
+        :return: a tuple of stacked tensors (input_ids, attention_mask, token_type_ids), the attention mask and token types are padded with 0
+        """
+        input_ids, attention_mask, token_type_ids = zip(*items)
+        return DynamicPaddingCollator.pad(input_ids, pad_index), \
+               DynamicPaddingCollator.pad(attention_mask, 0), \
+               DynamicPaddingCollator.pad(token_type_ids, 0)
@@ -0,0 +1,56 @@
+import logging
+
+
+class GradualUnfreezer:
+    """
+    Gradually unfreezes a BertModel top down during training, starting with the embeddings and the bottom freeze_layers encoder layers frozen, and unfreezing one more layer every n epochs until the whole model is trained.
+    The optimiser only holds the trainable parameters, and the parameters are added to it as a new param group as they are unfrozen.
+    Pass to Train as the on_epoch_start callback
+    """
+
+    def __init__(self, freeze_layers, unfreeze_every=1, param_groups=None):
+        """
+        :param freeze_layers: The number of encoder layers frozen in the first epoch, 0 freezes the embeddings only
+        :param unfreeze_every: The number of epochs between unfreezing each layer
+        :param param_groups: Optional function that splits a list of (name, parameter) into param groups, e.g. OptimiserFactory.param_groups. By default the parameters are added as a single group
+        """
+        assert unfreeze_every > 0, "unfreeze_every must be positive"
+        self.freeze_layers = freeze_layers
+        self.unfreeze_every = unfreeze_every
+        self.param_groups = param_groups or (lambda named_parameters: [{"params": [p for _, p in named_parameters]}])
+
+    @property
+    def _logger(self):
+        return logging.getLogger(__name__)
+
+    def frozen_layers(self, epoch):
+        """
+        :return: The number of encoder layers frozen in the epoch, -1 when nothing is frozen
+        """
+        return max(self.freeze_layers - epoch // self.unfreeze_every, -1)
+
+    def __call__(self, model, optimizer, epoch):
+        """
+        Freezes the layers of the epoch
+        :param model: The BertModel
+        :param optimizer: The optimiser over the trainable parameters of the model
+        :return: True when the trainable parameters changed
+        """
+        frozen_layers = self.frozen_layers(epoch)
+        if frozen_layers == model.frozen_layers:
+            return False
+
+        model.freeze_layers(frozen_layers)
+
+        optimised = {id(p) for group in optimizer.param_groups for p in group["params"]}
+        unfrozen = [(n, p) for n, p in model.named_parameters() if p.requires_grad and id(p) not in optimised]
+        if unfrozen:
+            # The new groups follow the current learning rate of the first group, including its schedule
+            lr_options = {k: v for k, v in optimizer.param_groups[0].items() if k in ("lr", "initial_lr")}
+            for group in self.param_groups(unfrozen):
+                group.update(lr_options)
+                optimizer.add_param_group(group)
+
+        self._logger.info("Epoch {} frozen layers {}, {} trainable parameters".format(
+            epoch, frozen_layers, sum(p.numel() for p in model.parameters() if p.requires_grad)))
+        return True
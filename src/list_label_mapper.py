@@ -0,0 +1,36 @@
+from label_mapper_base import LabelMapperBase
+
+
+class ListLabelMapper(LabelMapperBase):
+    """
+    Maps string labels to integers using the position of the label in a list, e.g. the label list saved with the model artifacts.
+    """
+
+    def __init__(self, raw_labels, positive_label=None):
+        """
+        :param raw_labels: The raw labels ordered by their zero indexed integer
+        :param positive_label: The raw positive label, defaults to the label at index 1 as in SnliLabelMapper
+        """
+        self.raw_labels = list(raw_labels)
+        self._map = {v: i for i, v in enumerate(self.raw_labels)}
+
+        self._reverse_map = {i: v for i, v in enumerate(self.raw_labels)}
+        self._positive_label = positive_label if positive_label is not None else self.reverse_map(1)
+
+    def map(self, item) -> int:
+        return self._map[item]
+
+    def reverse_map(self, item: int):
+        return self._reverse_map[item]
+
+    @property
+    def num_classes(self) -> int:
+        return len(self._reverse_map)
+
+    @property
+    def positive_label(self):
+        return self._positive_label
+
+    @property
+    def positive_label_index(self) -> int:
+        return self.map(self.positive_label)
@@ -2,31 +2,55 @@
 import argparse
 import logging
 import os
-import pickle
 import sys
 
+import torch
+import torch.distributed
+
 from builder_nli import BuilderNli
+from model_artifacts import ModelArtifacts
+from nli_source_registry import parse_mixture, source_names
+
+
+def _parse_mixture(parser, option, spec):
+    try:
+        return parse_mixture(spec)
+    except ValueError as e:
+        parser.error("{}: {}".format(option, e))
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--trainfile",
-                        help="The input train file wrt to train  dir", required=True)
+                        help="The input train file wrt to train  dir, required unless --trainmixture is set", default=None)
     parser.add_argument("--traindir",
                         help="The input train  dir", default=os.environ.get("SM_CHANNEL_TRAIN", "."))
 
     parser.add_argument("--valfile",
-                        help="The input val file wrt to val  dir", required=True)
+                        help="The input val file wrt to val  dir, required unless --valmixture is set", default=None)
     parser.add_argument("--valdir",
                         help="The input val dir", default=os.environ.get("SM_CHANNEL_VAL", "."))
 
+    parser.add_argument("--trainmixture",
+                        help="Optionally, trains on a weighted mixture of sources instead of the train file. A comma separated list of source:file wrt to train dir:weight, e.g. snli:snli_1.0_train.jsonl:1,mnli:multinli_1.0_train.jsonl:1,anli:train.jsonl:3. The sources are {}. The weight is the number of passes over the source per epoch".format(
+                            ", ".join(source_names())),
+                        default=None)
+    parser.add_argument("--valmixture",
+                        help="Optionally, validates on the sources instead of the val file. A comma separated list of source:file wrt to val dir, e.g. snli:snli_1.0_dev.jsonl,mnli:multinli_1.0_dev_matched.jsonl",
+                        default=None)
+
 
 
     parser.add_argument("--outdir", help="The output dir", default=os.environ.get("SM_OUTPUT_DATA_DIR", "."))
     parser.add_argument("--modeldir", help="The model dir", default=os.environ.get("SM_MODEL_DIR", "."))
     parser.add_argument("--checkpointdir", help="The checkpoint dir", default=None)
     parser.add_argument("--checkpointfreq",
-                        help="The checkpoint frequency, only applies if the checkpoint dir is set", default=1)
+                        help="The checkpoint frequency, only applies if the checkpoint dir is set", type=int, default=1)
+    parser.add_argument("--checkpointsteps",
+                        help="Also checkpoints within an epoch every n optimiser steps, only applies if the checkpoint dir is set. Training resumes from the latest checkpoint",
+                        type=int, default=None)
+    parser.add_argument("--checkpointkeep",
+                        help="The number of most recent checkpoints to retain", type=int, default=3)
 
     parser.add_argument("--earlystoppingpatience", help="The number of patience epochs", type=int,
                         default=10)
@@ -35,14 +59,90 @@ def main():
     parser.add_argument("--batch", help="The batchsize", type=int, default=32)
 
     parser.add_argument("--lr", help="The learning rate", type=float, default=0.0001)
+    parser.add_argument("--optimiser", help="The optimiser", default="adam", choices={"adam", "adamw"})
+    parser.add_argument("--weightdecay", help="The weight decay, the biases and LayerNorm weights are not decayed",
+                        type=float, default=0.0)
+    parser.add_argument("--optimiserimpl",
+                        help="Optionally, updates the parameters using multi tensor (foreach) or fused kernels, when supported by the installed torch",
+                        default=None, choices={"foreach", "fused"})
+    parser.add_argument("--warmupsteps", help="The number of optimiser steps to linearly warm up the learning rate over",
+                        type=int, default=0)
+    parser.add_argument("--lrschedule",
+                        help="The learning rate after the warmup, constant or linearly decayed to 0 by the last optimiser step",
+                        default="constant", choices={"constant", "linear"})
     parser.add_argument("--finetune", help="Fine tunes the final layer (classifier) model instead of the entire model",
                         type=int, default=0, choices={1, 0})
     parser.add_argument("--maxseqlen",
                         help="The max sequence len, any input that is greater than this will be truncated and fed into the network. If too large, the the bert model will not support it or you will end up Cuda OOM error! ",
                         type=int, default=256)
 
+    parser.add_argument("--tokencachedir",
+                        help="The directory to cache the tokenised train and val data in. The cache is built on first use, see main_build_token_cache.py to build it offline",
+                        default=None)
+
+    parser.add_argument("--dynamicpadding",
+                        help="Pads each batch only to its longest sequence instead of maxseqlen, and batches sequences of similar length together",
+                        type=int, default=0, choices={1, 0})
+
+    parser.add_argument("--streaming",
+                        help="Streams the train and val files instead of loading them into memory. Note: the train data is not shuffled",
+                        type=int, default=0, choices={1, 0})
+
+    parser.add_argument("--mixedprecision",
+                        help="Trains in mixed precision using autocast, bf16 (cpu or cuda) or fp16 (cuda only). By default trains in fp32",
+                        default=None, choices={"bf16", "fp16"})
+
+    parser.add_argument("--loginterval",
+                        help="Logs the running train loss and accuracy every n batches. By default only logs at the end of each epoch",
+                        type=int, default=None)
+
+    parser.add_argument("--prefetchfactor",
+                        help="The number of batches loaded in advance by each data loader worker", type=int, default=2)
+
+    parser.add_argument("--persistentworkers",
+                        help="Keeps the data loader workers alive across epochs instead of respawning them every epoch",
+                        type=int, default=1, choices={1, 0})
+
+    parser.add_argument("--metricsfile",
+                        help="Optionally, the jsonl file to write the per step data wait, host to device, forward, backward and optimiser timings, throughput and peak memory to. Synchronises the device per stage, and so slows down training",
+                        default=None)
+
+    parser.add_argument("--profilesteps",
+                        help="Optionally, the start and end (exclusive) train step to trace using torch.profiler, e.g. 10 15. The steps are 1-based, the same as the step in the metrics file",
+                        nargs=2, type=int, default=None)
+
+    parser.add_argument("--profiledir", help="The directory to write the torch.profiler trace to",
+                        default=os.path.join(os.environ.get("SM_OUTPUT_DATA_DIR", "."), "profiler_trace"))
+
+    parser.add_argument("--freezelayers",
+                        help="Only applies with --finetune 0. Freezes the embeddings and the bottom n encoder layers, 0 freezes the embeddings only",
+                        type=int, default=None)
+    parser.add_argument("--unfreezeevery",
+                        help="Gradually unfreezes the layers frozen using --freezelayers, one layer every n epochs from the top down",
+                        type=int, default=None)
+
+    parser.add_argument("--gradientcheckpointing",
+                        help="Recomputes the activations of each encoder layer in the backward pass instead of keeping them, to fit a longer --maxseqlen or a larger --batch at the cost of about a third more compute",
+                        type=int, default=0, choices={1, 0})
+
+    parser.add_argument("--featurecachedir",
+                        help="Only applies with --finetune 1. Runs the frozen encoder once over the train and val data, caching the pooled output in this dir, and trains the classifier on the cached features",
+                        default=None)
+
+    parser.add_argument("--distbackend",
+                        help="The torch distributed backend, only applies when launched using torchrun. Defaults to nccl on cuda and gloo on cpu",
+                        default=None, choices={"nccl", "gloo"})
+
+    parser.add_argument("--exportformats",
+                        help="The optimised inference variants to export into the model dir at the end of training, see main_export.py",
+                        nargs="*", default=[], choices={"int8", "torchscript", "onnx"})
+
     parser.add_argument("--log-level", help="Log level", default="INFO", choices={"INFO", "WARN", "DEBUG", "ERROR"})
     args = parser.parse_args()
+    if args.trainfile is None and args.trainmixture is None:
+        parser.error("Either --trainfile or --trainmixture is required")
+    if args.valfile is None and args.valmixture is None:
+        parser.error("Either --valfile or --valmixture is required")
 
     # Set up logging
     logging.basicConfig(level=logging.getLevelName(args.log_level), handlers=[logging.StreamHandler(sys.stdout)],
@@ -50,34 +150,69 @@ def main():
 
     print(args.__dict__)
 
-    train_data_file = os.path.join(args.traindir, args.trainfile)
-    val_data_file = os.path.join(args.valdir, args.valfile)
+    # When launched using torchrun, train using a process per device
+    is_distributed = int(os.environ.get("WORLD_SIZE", 1)) > 1
+    if is_distributed:
+        backend = args.distbackend or ("nccl" if torch.cuda.is_available() else "gloo")
+        torch.distributed.init_process_group(backend=backend)
+        if torch.cuda.is_available():
+            torch.cuda.set_device(int(os.environ.get("LOCAL_RANK", 0)))
+        logging.getLogger(__name__).info("Initialised distributed rank {} of {} using backend {}".format(
+            torch.distributed.get_rank(), torch.distributed.get_world_size(), backend))
+    is_main_process = not is_distributed or torch.distributed.get_rank() == 0
+
+    train_data_file = os.path.join(args.traindir, args.trainfile) if args.trainfile else None
+    val_data_file = os.path.join(args.valdir, args.valfile) if args.valfile else None
+    train_mixture = None
+    if args.trainmixture:
+        train_mixture = [(name, os.path.join(args.traindir, file), weight) for name, file, weight in
+                         _parse_mixture(parser, "--trainmixture", args.trainmixture)]
+        if any(weight is None for _, _, weight in train_mixture):
+            parser.error("--trainmixture requires a weight for each source, source:file:weight")
+    val_mixture = None
+    if args.valmixture:
+        val_mixture = [(name, os.path.join(args.valdir, file)) for name, file, _ in
+                       _parse_mixture(parser, "--valmixture", args.valmixture)]
 
     b = BuilderNli(train_data=train_data_file, val_data=val_data_file,
-                   checkpoint_dir=args.checkpointdir, epochs=args.epochs,
+                   checkpoint_dir=args.checkpointdir, checkpoint_frequency=args.checkpointfreq,
+                   checkpoint_steps=args.checkpointsteps, checkpoint_keep=args.checkpointkeep, epochs=args.epochs,
                    early_stopping_patience=args.earlystoppingpatience, batch_size=args.batch,
                    max_seq_len=args.maxseqlen,
-                   learning_rate=args.lr, fine_tune=args.finetune, model_dir=args.modeldir)
+                   learning_rate=args.lr, fine_tune=args.finetune, model_dir=args.modeldir,
+                   token_cache_dir=args.tokencachedir, dynamic_padding=args.dynamicpadding,
+                   streaming=args.streaming, mixed_precision=args.mixedprecision,
+                   log_interval=args.loginterval, prefetch_factor=args.prefetchfactor,
+                   persistent_workers=bool(args.persistentworkers), metrics_file=args.metricsfile,
+                   profile_steps=args.profilesteps, trace_dir=args.profiledir,
+                   feature_cache_dir=args.featurecachedir, freeze_layers=args.freezelayers,
+                   unfreeze_every=args.unfreezeevery, gradient_checkpointing=bool(args.gradientcheckpointing),
+                   optimiser=args.optimiser, weight_decay=args.weightdecay,
+                   optimiser_implementation=args.optimiserimpl, warmup_steps=args.warmupsteps,
+                   lr_schedule=args.lrschedule, train_mixture=train_mixture, val_mixture=val_mixture)
 
     trainer = b.get_trainer()
 
-    # Persist mapper so it case be used in inference
-    label_mapper_pickle_file = os.path.join(args.modeldir, "label_mapper.pkl")
-    with open(label_mapper_pickle_file, "wb") as f:
-        pickle.dump(b.get_label_mapper(), f)
-
-    # Persist tokenisor
-    preprocessor_pickle_file = os.path.join(args.modeldir, "preprocessor.pkl")
-    with open(preprocessor_pickle_file, "wb") as f:
-        pickle.dump(b.get_preprocessor(), f)
+    if is_main_process:
+        # Persist the config, vocab and labels so they can be used in inference. The weights are written on snapshot
+        ModelArtifacts.save_metadata(args.modeldir, b.get_network().model.config, b.get_preprocessor(),
+                                     b.get_label_mapper())
 
     # Run training
     train_dataloader, val_dataloader = b.get_train_val_dataloader()
     trainer.run_train(train_iter=train_dataloader,
                       validation_iter=val_dataloader,
-                      model_network=b.get_network(),
+                      model_network=b.get_train_network(),
                       loss_function=b.get_loss_function(),
-                      optimizer=b.get_optimiser(), pos_label=b.get_pos_label_index())
+                      optimizer=b.get_optimiser(), pos_label=b.get_pos_label_index(),
+                      scheduler=b.get_scheduler())
+
+    if is_main_process:
+        for export_format in args.exportformats:
+            ModelArtifacts.export(args.modeldir, export_format)
+
+    if is_distributed:
+        torch.distributed.destroy_process_group()
 
 
 if "__main__" == __name__:
@@ -0,0 +1,172 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+from torch.utils.data import DataLoader, IterableDataset, get_worker_info
+
+import serve
+
+
+class BatchTransform:
+    """
+    Scores a SNLI jsonl file locally using the serving model artifacts, without an endpoint.
+    The data loader workers tokenise chunks of the file into length sorted batches, while the main process runs the model.
+    A prediction is written for every line, incrementally in the order of the input file. The accuracy and confusion matrix are computed against the gold labels, excluding the lines without one of the labels of the model, e.g. "-"
+    """
+
+    def __init__(self, model_artifacts, batch_size=256, num_workers=2, chunk_size=4096):
+        """
+        :param model_artifacts: The tuple (preprocessor, model, label mapper) returned by serve.model_fn
+        :param batch_size: The max number of records per forward pass
+        :param num_workers: The number of data loader worker processes tokenising the records, 0 tokenises in the main process
+        :param chunk_size: The number of lines of the file that are sorted by length and split into batches together. The memory is bounded by the chunk size
+        """
+        self.model_artifacts = model_artifacts
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.chunk_size = chunk_size
+
+    @property
+    def _logger(self):
+        return logging.getLogger(__name__)
+
+    def run(self, json_file, output_dir):
+        """
+        Writes the predictions to <output_dir>/<file name>_predictions.jsonl and the metrics to <output_dir>/<file name>_metrics.json
+        :return: a dict containing the accuracy, the confusion matrix and the throughput
+        """
+        preprocessor, model, label_mapper = self.model_artifacts
+        labels = [label_mapper.reverse_map(i) for i in range(label_mapper.num_classes)]
+        label_index = {l: i for i, l in enumerate(labels)}
+        # The rows are the gold labels and the columns the predicted labels
+        confusion_matrix = [[0] * len(labels) for _ in labels]
+
+        os.makedirs(output_dir, exist_ok=True)
+        output_file_prefix = os.path.splitext(os.path.basename(json_file))[0]
+        output_file = os.path.join(output_dir, "{}_predictions.jsonl".format(output_file_prefix))
+        self._logger.info("Writing predictions to {}".format(output_file))
+
+        dataset = _LengthBucketedChunks(json_file, preprocessor, self.batch_size, self.chunk_size)
+        # Each item is a whole chunk, already batched by the worker
+        data_loader = DataLoader(dataset, batch_size=None, num_workers=self.num_workers)
+
+        completed, labelled = 0, 0
+        start = time.perf_counter()
+        with open(output_file, "w") as f:
+            for records, batches in data_loader:
+                predictions = [None] * len(records)
+                for indices, input_tensor in batches:
+                    for i, p in zip(indices, serve.predict_tensors(input_tensor, model, label_mapper)):
+                        predictions[i] = p
+
+                for (premise, hypothesis, label), (predicted_label, confidence) in zip(records, predictions):
+                    f.write(json.dumps({"premise": premise, "hypothesis": hypothesis, "label": label,
+                                        "predicted_label": predicted_label,
+                                        "predicted_confidence": confidence}) + "\n")
+                    # The unlabelled records are predicted, but not scored
+                    if label in label_index:
+                        confusion_matrix[label_index[label]][label_index[predicted_label]] += 1
+                        labelled += 1
+
+                completed += len(records)
+                self._logger.info("Completed {} records, {:.1f} records / sec".format(
+                    completed, completed / (time.perf_counter() - start)))
+        elapsed = time.perf_counter() - start
+
+        correct = sum(confusion_matrix[i][i] for i in range(len(labels)))
+        metrics = {
+            "accuracy": 100 * correct / labelled if labelled else 0.0,
+            "records": completed,
+            "labelled_records": labelled,
+            "elapsed_sec": elapsed,
+            "records_per_sec": completed / elapsed if elapsed else 0.0,
+            "labels": labels,
+            "confusion_matrix": confusion_matrix
+        }
+        with open(os.path.join(output_dir, "{}_metrics.json".format(output_file_prefix)), "w") as f:
+            json.dump(metrics, f, indent=2)
+
+        self._logger.info("% Accuracy == {}".format(metrics["accuracy"]))
+        self._logger.info("Confusion matrix, rows are the gold labels {}: {}".format(labels, confusion_matrix))
+        return metrics
+
+
+class _LengthBucketedChunks(IterableDataset):
+    """
+    Splits the file into chunks of lines. Each data loader worker tokenises every num_workers th chunk, sorted by length into batches.
+    The data loader returns the items of the workers in turn, so the chunks are returned in the order of the file
+    """
+
+    def __init__(self, json_file, preprocessor, batch_size, chunk_size):
+        self.json_file = json_file
+        self.preprocessor = preprocessor
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        worker_info = get_worker_info()
+        worker_id, num_workers = (0, 1) if worker_info is None else (worker_info.id, worker_info.num_workers)
+
+        chunk = []
+        with open(self.json_file) as f:
+            lines = (l for l in f if l.strip())
+            for i, line in enumerate(lines):
+                # Only the lines of this worker's chunks are kept
+                if (i // self.chunk_size) % num_workers == worker_id:
+                    chunk.append(line)
+                if chunk and (i + 1) % self.chunk_size == 0:
+                    yield self._batch_chunk(chunk)
+                    chunk = []
+        if chunk:
+            yield self._batch_chunk(chunk)
+
+    def _batch_chunk(self, lines):
+        """
+        :return: a tuple (records, batches). The records are a list of (premise, hypothesis, gold label) in the order of the file, the gold label is None when the line has none.
+        Each batch is a tuple (indices of the records, (input_ids, attention_mask, token_type_ids)), padded to its longest record
+        """
+        # Every line is predicted, including the lines without a gold label
+        records = [(data["sentence1"], data["sentence2"], data.get("gold_label")) for data in map(json.loads, lines)]
+
+        order = sorted(range(len(records)),
+                       key=lambda i: serve.approximate_length({"premise": records[i][0], "hypothesis": records[i][1]}))
+        batches = []
+        for start in range(0, len(order), self.batch_size):
+            indices = order[start:start + self.batch_size]
+            input_tensor = self.preprocessor.batch([records[i][:2] for i in indices])
+            batches.append((indices, input_tensor))
+
+        return records, batches
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Scores a SNLI jsonl file locally using the model artifacts, reporting the accuracy and confusion matrix")
+    parser.add_argument("testjson", help="The SNLI jsonl file to score")
+    parser.add_argument("outputdir", help="The output directory to write the predictions and metrics to")
+    parser.add_argument("--modeldir", help="The directory containing the model artifacts. The backend is selected using the {} environment variable".format(serve.BACKEND_ENV),
+                        required=True)
+    parser.add_argument("--batch", help="The max number of records per forward pass", type=int, default=256)
+    parser.add_argument("--numworkers", help="The number of worker processes tokenising the records", type=int,
+                        default=2)
+    parser.add_argument("--chunksize", help="The number of lines sorted by length together", type=int, default=4096)
+
+    parser.add_argument("--log-level", help="Log level", default="INFO", choices={"INFO", "WARN", "DEBUG", "ERROR"})
+    args = parser.parse_args()
+
+    # Set up logging
+    logging.basicConfig(level=logging.getLevelName(args.log_level), handlers=[logging.StreamHandler(sys.stdout)],
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    print(args.__dict__)
+
+    model_artifacts = serve.model_fn(args.modeldir)
+    BatchTransform(model_artifacts, batch_size=args.batch, num_workers=args.numworkers,
+                   chunk_size=args.chunksize).run(args.testjson, args.outputdir)
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,51 @@
+import argparse
+import logging
+import sys
+
+from builder_nli import BuilderNli
+from nli_mixture_dataset import NliMixtureDataset
+from nli_source_registry import parse_mixture
+from snli_dataset import SnliDataset
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Tokenises the SNLI files once and writes them into the memory mapped token cache used in training")
+    parser.add_argument("jsonfiles", help="The SNLI jsonl files to tokenise", nargs="*")
+    parser.add_argument("--mixture",
+                        help="Optionally, also tokenises a mixture of sources into a single deduplicated token cache, a comma separated list of source:file in the same order as the --trainmixture or --valmixture used in training, e.g. snli:snli_1.0_train.jsonl,mnli:multinli_1.0_train.jsonl. The weights, if any, are ignored",
+                        default=None)
+    parser.add_argument("--tokencachedir", help="The directory to write the token cache to", required=True)
+    parser.add_argument("--maxseqlen",
+                        help="The max sequence len, this must match the max sequence len used in training",
+                        type=int, default=256)
+
+    parser.add_argument("--log-level", help="Log level", default="INFO", choices={"INFO", "WARN", "DEBUG", "ERROR"})
+    args = parser.parse_args()
+
+    sources = None
+    if args.mixture:
+        try:
+            sources = [(name, file) for name, file, _ in parse_mixture(args.mixture)]
+        except ValueError as e:
+            parser.error("--mixture: {}".format(e))
+
+    # Set up logging
+    logging.basicConfig(level=logging.getLevelName(args.log_level), handlers=[logging.StreamHandler(sys.stdout)],
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    print(args.__dict__)
+
+    b = BuilderNli(train_data=None, val_data=None, model_dir=None, max_seq_len=args.maxseqlen,
+                   token_cache_dir=args.tokencachedir)
+
+    preprocessor = b.get_preprocessor()
+    for json_file in args.jsonfiles:
+        SnliDataset(json_file, preprocessor=preprocessor, token_cache_dir=args.tokencachedir)
+
+    if sources:
+        NliMixtureDataset(sources, preprocessor=preprocessor, token_cache_dir=args.tokencachedir)
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,126 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import serve
+from model_artifacts import ModelArtifacts
+from snli_dataset import SnliDataset
+from snli_dataset_label_mapper import SnliLabelMapper
+
+
+class CompareBackends:
+    """
+    Compares the accuracy and latency of the inference backends on a held out SNLI file, so that the accuracy cost of an optimised backend can be weighed against its speedup
+    """
+
+    def __init__(self, model_dir, batch_size=8, max_records=None):
+        """
+        :param model_dir: The model dir containing the model artifacts
+        :param batch_size: The number of records per prediction, i.e. per request
+        :param max_records: Optionally, only evaluates the first n records
+        """
+        self.model_dir = model_dir
+        self.batch_size = batch_size
+        self.max_records = max_records
+        self._label_mapper = SnliLabelMapper()
+
+    @property
+    def _logger(self):
+        return logging.getLogger(__name__)
+
+    def run(self, json_file, backends):
+        """
+        :return: a list of dicts, one per backend, containing the accuracy, agreement with the first backend and latency
+        """
+        records = self._parse_json_file(json_file)
+        self._logger.info("Comparing backends {} on {} records".format(backends, len(records)))
+
+        results = []
+        baseline_predictions = None
+        for backend in backends:
+            start = time.perf_counter()
+            model_artifacts = serve.load_model(self.model_dir, backend=backend)
+            load_time = time.perf_counter() - start
+
+            # Warm up
+            serve.predict_fn(records[:self.batch_size], model_artifacts)
+
+            predictions, latencies = [], []
+            start = time.perf_counter()
+            for i in range(0, len(records), self.batch_size):
+                batch_start = time.perf_counter()
+                predictions.extend(p["label"] for p in serve.predict_fn(records[i:i + self.batch_size],
+                                                                        model_artifacts))
+                latencies.append(time.perf_counter() - batch_start)
+            elapsed = time.perf_counter() - start
+
+            if baseline_predictions is None:
+                baseline_predictions = predictions
+
+            latencies.sort()
+            results.append({
+                "backend": backend,
+                "accuracy": sum(p == r["label"] for p, r in zip(predictions, records)) / len(records),
+                "agreement": sum(p == b for p, b in zip(predictions, baseline_predictions)) / len(records),
+                "p50_ms": 1000 * latencies[len(latencies) // 2],
+                "p99_ms": 1000 * latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))],
+                "records_per_sec": len(records) / elapsed,
+                "load_sec": load_time
+            })
+            self._logger.info("Result {}".format(results[-1]))
+
+        return results
+
+    def _parse_json_file(self, json_file):
+        records = []
+        with open(json_file) as f:
+            for premise, hypothesis, label in SnliDataset.parse_lines(f, self._label_mapper):
+                records.append({"premise": premise, "hypothesis": hypothesis,
+                                "label": self._label_mapper.reverse_map(label)})
+                if self.max_records is not None and len(records) == self.max_records:
+                    break
+        return records
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Reports the accuracy vs latency of the inference backends on a held out SNLI file")
+    parser.add_argument("testjson", help="The held out SNLI jsonl file")
+    parser.add_argument("--modeldir", help="The model dir containing the model artifacts", required=True)
+    parser.add_argument("--backends", help="The backends to compare, the first is the baseline for the agreement",
+                        nargs="+", default=["eager", "int8"], choices=ModelArtifacts.backends)
+    parser.add_argument("--batch", help="The number of records per prediction", type=int, default=8)
+    parser.add_argument("--maxrecords", help="Only evaluates the first n records", type=int, default=None)
+    parser.add_argument("--outputdir", help="Optionally, the directory to write the report to", default=None)
+
+    parser.add_argument("--log-level", help="Log level", default="INFO", choices={"INFO", "WARN", "DEBUG", "ERROR"})
+    args = parser.parse_args()
+
+    # Set up logging
+    logging.basicConfig(level=logging.getLevelName(args.log_level), handlers=[logging.StreamHandler(sys.stdout)],
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    print(args.__dict__)
+
+    results = CompareBackends(args.modeldir, batch_size=args.batch, max_records=args.maxrecords).run(args.testjson,
+                                                                                                   args.backends)
+
+    print("{:>10} {:>10} {:>10} {:>10} {:>10} {:>16} {:>10}".format("backend", "accuracy", "agreement", "p50 (ms)",
+                                                                    "p99 (ms)", "records / sec", "load (s)"))
+    for r in results:
+        print("{:>10} {:>10.4f} {:>10.4f} {:>10.1f} {:>10.1f} {:>16.1f} {:>10.3f}".format(
+            r["backend"], r["accuracy"], r["agreement"], r["p50_ms"], r["p99_ms"], r["records_per_sec"],
+            r["load_sec"]))
+
+    if args.outputdir:
+        os.makedirs(args.outputdir, exist_ok=True)
+        output_file = os.path.join(args.outputdir, "backend_comparison.json")
+        with open(output_file, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if "__main__" == __name__:
+    main()
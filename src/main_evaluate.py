@@ -1,78 +1,189 @@
 import argparse
+import collections
 import json
 import logging
 import os
+import random
 import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
+from botocore.config import Config
 
+from nli_columnar_records import NliColumnarRecords
 
-class Evaluate:
 
-    def __init__(self):
-        self.client = boto3.client('sagemaker-runtime')
+class Evaluate:
+    """
+    Evaluates an endpoint on an SNLI file, keeping a bounded number of requests in flight.
+    The predictions are streamed to the output file in the input order as the requests complete, so that the memory is bounded by the number of requests in flight
+    """
+
+    def __init__(self, client=None, batch_size=5, max_concurrency=8, max_retries=3, backoff_seconds=0.5):
+        """
+        :param client: The client to invoke the endpoint with, defaults to the boto3 sagemaker-runtime client. Pass a HttpEndpointClient to evaluate a local endpoint, see main_serve
+        :param batch_size: The number of records per request
+        :param max_concurrency: The max number of requests in flight
+        :param max_retries: The number of times a failed request is retried
+        :param backoff_seconds: The wait before the first retry, doubled for each further retry
+        """
+        self.client = client or boto3.client('sagemaker-runtime',
+                                             config=Config(max_pool_connections=max(10, max_concurrency)))
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self._labels = []
 
     def run(self, json_file, model_endpoint, output_dir):
+        """
+        :return: a dict containing the accuracy and the throughput stats
+        """
         items = self._parse_json_file(json_file)
 
-        batch_size = 5
-        result = []
-
-        correct_predictions = 0
-        for i in range(0, len(items), batch_size):
-
-            batch = items[i: i + batch_size]
-
-            response = self.client.invoke_endpoint(
-                EndpointName=model_endpoint,
-                Body=json.dumps(batch).encode("utf-8"),
-                ContentType='text/json',
-                Accept='text/json'
-            )
-
-            predictions = json.loads(response["Body"].read().decode("utf-8"))
-
-            for bi, p in zip(batch, predictions):
-                bi["predicted_label"] = p["label"]
-                bi["predicted_confidence"] = p["confidence"]
-                if bi["predicted_label"] == bi["label"]: correct_predictions += 1
-
-            result.extend(batch)
-            self._logger.info("Completed {} out {}".format(len(result), len(items)))
-
-        accuracy = 100 * correct_predictions / len(result)
-        self._logger.info(f"% Accuracy == {accuracy}")
-
-        # Dump predictions
         os.makedirs(output_dir, exist_ok=True)
         output_file_prefix = os.path.splitext(os.path.basename(json_file))[0]
         output_file = os.path.join(output_dir, f"{output_file_prefix}_predictions.json")
         self._logger.info(f"Writing output to {output_file}")
-        with open(output_file, "w") as f:
-            json.dump(result, f)
+
+        correct_predictions, completed, retries = 0, 0, 0
+        latencies = []
+        start = time.perf_counter()
+        with open(output_file, "w") as f, ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            f.write("[")
+            in_flight = collections.deque()
+            batch_starts = iter(range(0, len(items), self.batch_size))
+            while True:
+                # Keep max_concurrency requests in flight, and write the results of the oldest request once it completes
+                for i in batch_starts:
+                    batch = [self._to_record(items[j]) for j in range(i, min(i + self.batch_size, len(items)))]
+                    in_flight.append((batch, executor.submit(self._invoke, model_endpoint, batch)))
+                    if len(in_flight) == self.max_concurrency:
+                        break
+                if not in_flight:
+                    break
+
+                batch, future = in_flight.popleft()
+                predictions, latency, attempts = future.result()
+                latencies.append(latency)
+                retries += attempts - 1
+
+                for bi, p in zip(batch, predictions):
+                    bi["predicted_label"] = p["label"]
+                    bi["predicted_confidence"] = p["confidence"]
+                    if bi["predicted_label"] == bi["label"]: correct_predictions += 1
+                    f.write(", " if completed else "")
+                    json.dump(bi, f)
+                    completed += 1
+
+                self._logger.info("Completed {} out {}".format(completed, len(items)))
+            f.write("]")
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        stats = {
+            "accuracy": 100 * correct_predictions / completed if completed else 0.0,
+            "records": completed,
+            "requests": len(latencies),
+            "retries": retries,
+            "elapsed_sec": elapsed,
+            "records_per_sec": completed / elapsed if elapsed else 0.0,
+            "p50_ms": 1000 * latencies[len(latencies) // 2] if latencies else 0.0,
+            "p99_ms": 1000 * latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] if latencies else 0.0
+        }
+        self._logger.info(f"% Accuracy == {stats['accuracy']}")
+        self._logger.info("Throughput stats {}".format(stats))
+        return stats
+
+    def _invoke(self, model_endpoint, batch):
+        """
+        Invokes the endpoint, retrying with an exponential backoff on failure
+        :return: a tuple (predictions, latency of the successful attempt in seconds, number of attempts)
+        """
+        body = json.dumps(batch).encode("utf-8")
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                response = self.client.invoke_endpoint(
+                    EndpointName=model_endpoint,
+                    Body=body,
+                    ContentType='text/json',
+                    Accept='text/json'
+                )
+                predictions = json.loads(response["Body"].read().decode("utf-8"))
+                return predictions, time.perf_counter() - start, attempt + 1
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                # Full jitter, so that the concurrent requests that failed together do not retry together
+                backoff = random.uniform(0, self.backoff_seconds * 2 ** attempt)
+                self._logger.warning("Request failed on attempt {}, retrying in {:.2f}s: {}".format(
+                    attempt + 1, backoff, e))
+                time.sleep(backoff)
 
     def _parse_json_file(self, json_file):
-        items = []
+        # Only the records without a gold label are skipped, any other label is compared with the predictions as is.
+        # The labels are stored in the columnar records as an index into the distinct labels of the file
+        items = NliColumnarRecords()
+        label_index = {}
         with open(json_file) as f:
             for i, l in enumerate(f):
                 data = json.loads(l)
-                item = {"premise": data["sentence1"],
-                        "hypothesis": data["sentence2"],
-                        "label": data["gold_label"]
-                        }
-
-                if item["label"] == "-":
+                if data["gold_label"] == "-":
                     self._logger.info(f"Missing label in idx {i}.. hence skipping")
                     continue
 
-                items.append(item)
+                items.append(data["sentence1"], data["sentence2"],
+                             label_index.setdefault(data["gold_label"], len(label_index)))
+        self._labels = list(label_index)
         return items
 
+    def _to_record(self, item):
+        premise, hypothesis, label = item
+        return {"premise": premise,
+                "hypothesis": hypothesis,
+                "label": self._labels[label]
+                }
+
     @property
     def _logger(self):
         return logging.getLogger(__name__)
 
 
+class HttpEndpointClient:
+    """
+    Invokes a local endpoint over http with the same interface as the boto3 sagemaker-runtime client, e.g. main_serve
+    """
+
+    def __init__(self, url, timeout=60):
+        """
+        :param url: The base url of the endpoint, e.g. http://localhost:8080
+        :param timeout: The request timeout in seconds
+        """
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def invoke_endpoint(self, EndpointName, Body, ContentType, Accept):
+        request = urllib.request.Request("{}/invocations".format(self.url), data=Body,
+                                         headers={"Content-Type": ContentType, "Accept": Accept})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return {"Body": _Body(response.read()), "ContentType": response.headers.get("Content-Type")}
+
+
+class _Body:
+    """
+    The response body, read once as with the botocore streaming body
+    """
+
+    def __init__(self, content):
+        self._content = content
+
+    def read(self):
+        return self._content
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("testjson",
@@ -84,6 +195,13 @@ def main():
     parser.add_argument("modelendpoint",
                         help="The name of the endpoint")
 
+    parser.add_argument("--batch", help="The number of records per request", type=int, default=5)
+    parser.add_argument("--concurrency", help="The max number of requests in flight", type=int, default=8)
+    parser.add_argument("--maxretries", help="The number of times a failed request is retried", type=int, default=3)
+    parser.add_argument("--endpointurl",
+                        help="Optionally, the url of a local endpoint to evaluate instead of the sagemaker endpoint, e.g. http://localhost:8080 started using main_serve",
+                        default=None)
+
     parser.add_argument("--log-level", help="Log level", default="INFO", choices={"INFO", "WARN", "DEBUG", "ERROR"})
     args = parser.parse_args()
 
@@ -93,7 +211,9 @@ def main():
 
     print(args.__dict__)
 
-    Evaluate().run(args.testjson, args.modelendpoint, args.outputdir)
+    client = HttpEndpointClient(args.endpointurl) if args.endpointurl else None
+    Evaluate(client=client, batch_size=args.batch, max_concurrency=args.concurrency,
+             max_retries=args.maxretries).run(args.testjson, args.modelendpoint, args.outputdir)
 
 
 if "__main__" == __name__:
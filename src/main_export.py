@@ -0,0 +1,30 @@
+import argparse
+import logging
+import sys
+
+from model_artifacts import ModelArtifacts
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Exports an optimised variant of the trained model into the model dir, which serve.py loads when the SERVE_BACKEND environment variable is set to the format")
+    parser.add_argument("--modeldir", help="The model dir containing the model artifacts written in training",
+                        required=True)
+    parser.add_argument("--format", help="The format to export", default="int8",
+                        choices={"int8", "torchscript", "onnx"})
+
+    parser.add_argument("--log-level", help="Log level", default="INFO", choices={"INFO", "WARN", "DEBUG", "ERROR"})
+    args = parser.parse_args()
+
+    # Set up logging
+    logging.basicConfig(level=logging.getLevelName(args.log_level), handlers=[logging.StreamHandler(sys.stdout)],
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    print(args.__dict__)
+
+    export_path = ModelArtifacts.export(args.modeldir, args.format)
+    logging.getLogger(__name__).info("Exported {} to {}".format(args.format, export_path))
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,141 @@
+import argparse
+import json
+import logging
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import serve
+from micro_batcher import MicroBatcher
+
+
+def _validate_records(records):
+    """
+    :raises ValueError: when the records are not a list of dicts with a string premise and hypothesis
+    """
+    if not isinstance(records, list):
+        raise ValueError("Expected a list of records, found {}".format(type(records).__name__))
+    for i, record in enumerate(records):
+        if not isinstance(record, dict) or not all(isinstance(record.get(k), str) for k in ("premise", "hypothesis")):
+            raise ValueError("Record {} must be an object with a string premise and hypothesis".format(i))
+
+
+class _InvocationsHandler(BaseHTTPRequestHandler):
+    """
+    Implements the sagemaker inference container contract, POST /invocations and GET /ping, and GET /metrics returning the cache counters
+    """
+
+    def do_GET(self):
+        if self.path == "/ping":
+            self._send(200, b"", serve.JSON_CONTENT_TYPE)
+        elif self.path == "/metrics" and self.server.stats is not None:
+            self._send(200, json.dumps(self.server.stats()).encode("utf-8"), serve.JSON_CONTENT_TYPE)
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        if self.path != "/invocations":
+            self.send_error(404)
+            return
+
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            records = serve.input_fn(body, self.headers.get("Content-Type", serve.JSON_CONTENT_TYPE))
+            # Reject a malformed request before it is batched with the requests of other clients
+            _validate_records(records)
+            result = self.server.predict(records)
+            response, content_type = serve.output_fn(result, self.headers.get("Accept", serve.JSON_CONTENT_TYPE))
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        except Exception as e:
+            logging.getLogger(__name__).exception("Prediction failed")
+            self.send_error(500, str(e))
+            return
+
+        self._send(200, response.encode("utf-8"), content_type)
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.getLogger(__name__).debug(format, *args)
+
+
+class InferenceServer(ThreadingHTTPServer):
+    """
+    Local HTTP inference server. Each connection is handled in its own thread, and when micro batching is enabled the concurrent requests are coalesced into a single forward pass.
+    """
+    daemon_threads = True
+    # The default backlog of 5 drops connections from concurrent clients, which then retry after a second
+    request_queue_size = 128
+
+    def __init__(self, server_address, predict, max_batch_size=32, max_wait_ms=5, stats=None):
+        """
+        :param server_address: The (host, port) to listen on, port 0 picks a free port
+        :param predict: The function that predicts a list of records, e.g. serve.predict_fn bound to the model artifacts
+        :param max_batch_size: The max number of records in a micro batch. When 0, each request is predicted on its own, one at a time
+        :param max_wait_ms: The max time a request waits for other requests to batch with
+        :param stats: Optionally, the function returning the dict served by GET /metrics, e.g. serve.cache_stats bound to the model artifacts
+        """
+        super().__init__(server_address, _InvocationsHandler)
+        self.stats = stats
+        self._batcher = None
+        if max_batch_size > 0:
+            self._batcher = MicroBatcher(predict, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+            self.predict = self._batcher
+        else:
+            # A single model worker, as in the per request path
+            lock = threading.Lock()
+
+            def predict_one_at_a_time(records):
+                with lock:
+                    return predict(records)
+
+            self.predict = predict_one_at_a_time
+
+    def server_close(self):
+        super().server_close()
+        if self._batcher is not None:
+            self._batcher.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Runs a local inference server using the model artifacts, coalescing concurrent requests into micro batches")
+    parser.add_argument("--modeldir", help="The directory containing the model artifacts", required=True)
+    parser.add_argument("--host", help="The host to listen on", default="0.0.0.0")
+    parser.add_argument("--port", help="The port to listen on", type=int, default=8080)
+    parser.add_argument("--maxbatchsize",
+                        help="The max number of records in a micro batch. Set to 0 to predict each request on its own",
+                        type=int, default=32)
+    parser.add_argument("--maxwaitms", help="The max time in milliseconds a request waits for other requests to batch with",
+                        type=float, default=5)
+
+    parser.add_argument("--log-level", help="Log level", default="INFO", choices={"INFO", "WARN", "DEBUG", "ERROR"})
+    args = parser.parse_args()
+
+    # Set up logging
+    logging.basicConfig(level=logging.getLevelName(args.log_level), handlers=[logging.StreamHandler(sys.stdout)],
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    print(args.__dict__)
+
+    model_artifacts = serve.model_fn(args.modeldir)
+
+    server = InferenceServer((args.host, args.port), lambda records: serve.predict_fn(records, model_artifacts),
+                             max_batch_size=args.maxbatchsize, max_wait_ms=args.maxwaitms,
+                             stats=lambda: serve.cache_stats(model_artifacts))
+    logging.getLogger(__name__).info("Listening on {}:{}".format(*server.server_address))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if "__main__" == __name__:
+    main()
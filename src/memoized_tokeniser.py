@@ -0,0 +1,49 @@
+import collections
+
+
+class MemoizedTokeniser:
+    """
+    Wraps a tokeniser, memoizing the tokens of each text, so that a premise or hypothesis repeated across requests is tokenised once.
+    Memoizes tokenize(text), used by PreprocessorNliBertTokeniser, and the batch call tokeniser(texts, ..), used by PreprocessorNliBertTokeniserFast.
+    All the other attributes are delegated to the wrapped tokeniser
+    """
+
+    def __init__(self, tokeniser, cache):
+        """
+        :param tokeniser: The tokeniser to wrap
+        :param cache: The LruCache to memoize the tokens in
+        """
+        self.tokeniser = tokeniser
+        self.cache = cache
+
+    def tokenize(self, text):
+        key = ("tokenize", text)
+        tokens = self.cache.get(key)
+        if tokens is None:
+            tokens = self.tokeniser.tokenize(text)
+            self.cache.put(key, tokens)
+        return list(tokens)
+
+    def __call__(self, text, **kwargs):
+        # Only a list of texts returning python lists is memoized, e.g. not tensors
+        if not isinstance(text, list) or not text or "return_tensors" in kwargs or "text_pair" in kwargs:
+            return self.tokeniser(text, **kwargs)
+
+        options = tuple(sorted(kwargs.items()))
+        encodings = {t: self.cache.get(("call", options, t)) for t in collections.OrderedDict.fromkeys(text)}
+
+        # Tokenises the distinct texts that are not memoized in a single call
+        misses = [t for t, e in encodings.items() if e is None]
+        if misses:
+            tokenised = self.tokeniser(misses, **kwargs)
+            for j, t in enumerate(misses):
+                encodings[t] = {name: values[j] for name, values in tokenised.items()}
+                self.cache.put(("call", options, t), encodings[t])
+
+        return {name: [list(encodings[t][name]) for t in text] for name in encodings[text[0]]}
+
+    def __getattr__(self, name):
+        # Only called for attributes that are not set on the memoized tokeniser itself
+        if name.startswith("__") or name in ("tokeniser", "cache"):
+            raise AttributeError(name)
+        return getattr(self.tokeniser, name)
@@ -0,0 +1,114 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent prediction requests into a single batch, so that the model runs one forward pass for many small requests.
+    A batch is cut when it reaches the max batch size, or when the oldest request in it has waited for the max wait time.
+    Each caller blocks until the batch containing its request completes, and receives only the results for its own records.
+    When a batch fails, each of its requests is retried on its own, so that a bad request only fails its own caller.
+    """
+
+    def __init__(self, predict, max_batch_size=32, max_wait_ms=5):
+        """
+        :param predict: The function that runs the prediction for a list of records, returning a result per record in the same order
+        :param max_batch_size: The max number of records in a batch. A single request larger than this is run as a batch on its own
+        :param max_wait_ms: The max time to wait for more requests, after the first request of a batch arrives
+        """
+        self.predict = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._worker = threading.Thread(target=self._run, name="micro_batcher", daemon=True)
+        self._worker.start()
+
+    @property
+    def _logger(self):
+        return logging.getLogger(__name__)
+
+    def submit(self, records):
+        """
+        Queues the records to be predicted in the next batch
+        :param records: A list of records
+        :return: A future of the list of results for the records
+        """
+        future = Future()
+        if self._stopped.is_set():
+            future.set_exception(RuntimeError("The micro batcher is stopped"))
+            return future
+
+        self._queue.put((records, future))
+        return future
+
+    def __call__(self, records):
+        """
+        Predicts the records as part of a batch, blocking until the results are available
+        """
+        return self.submit(records).result()
+
+    def stop(self):
+        self._stopped.set()
+        self._queue.put(None)
+        self._worker.join()
+
+    def _run(self):
+        pending = None
+        while True:
+            # The request that did not fit into the previous batch starts the next batch
+            request = pending if pending is not None else self._queue.get()
+            pending = None
+            if request is None:
+                break
+
+            batch = [request]
+            batch_size = len(request[0])
+            deadline = time.monotonic() + self.max_wait_ms / 1000
+
+            while batch_size < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    request = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                if request is None or batch_size + len(request[0]) > self.max_batch_size:
+                    pending = request
+                    break
+
+                batch.append(request)
+                batch_size += len(request[0])
+
+            self._predict_batch(batch)
+
+        # Fail any request that arrived after the stop
+        while not self._queue.empty():
+            request = self._queue.get_nowait()
+            if request is not None:
+                request[1].set_exception(RuntimeError("The micro batcher is stopped"))
+
+    def _predict_batch(self, batch):
+        records = [r for request_records, _ in batch for r in request_records]
+        self._logger.debug("Predicting a batch of {} records from {} requests".format(len(records), len(batch)))
+
+        try:
+            results = self.predict(records)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            # Retry each request on its own, so that only the requests that fail are failed
+            self._logger.warning("Batch of {} requests failed, retrying each request: {}".format(len(batch), e))
+            for request in batch:
+                self._predict_batch([request])
+            return
+
+        # Route the results back to each request
+        start = 0
+        for request_records, future in batch:
+            future.set_result(results[start:start + len(request_records)])
+            start += len(request_records)
@@ -0,0 +1,457 @@
+import contextlib
+import inspect
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+
+import torch
+import transformers
+from safetensors.torch import save_file
+from torch import nn
+from transformers.modeling_utils import no_init_weights
+
+from bert_model import BertModel
+from list_label_mapper import ListLabelMapper
+from preprocessor_nli_bert_tokeniser import PreprocessorNliBertTokeniser
+from preprocessor_nli_bert_tokeniser_fast import PreprocessorNliBertTokeniserFast
+
+
+class ModelArtifacts:
+    """
+    Saves and loads the model artifacts used in inference, without pickling python objects:
+        model.safetensors   the model weights
+        config.json         the bert config and the preprocessor settings
+        vocab.txt           the tokeniser vocab
+        labels.json         the raw labels, ordered by their zero indexed integer
+        model_int8.pt       optional, the dynamically quantized int8 weights, see export_int8
+        model_torchscript.pt    optional, the traced torchscript graph, see export_torchscript
+        model.onnx          optional, the onnx graph with dynamic batch and sequence axes, see export_onnx
+
+    On cpu the weights are memory mapped instead of being read into memory, so multiple worker processes serving the same model share the weight pages.
+    """
+
+    _format_version = 1
+
+    weights_file = "model.safetensors"
+    config_file = "config.json"
+    vocab_file = "vocab.txt"
+    labels_file = "labels.json"
+    int8_weights_file = "model_int8.pt"
+    torchscript_file = "model_torchscript.pt"
+    onnx_file = "model.onnx"
+
+    # eager: the fp32 model, int8: the linear layers dynamically quantized to int8, cpu only,
+    # torchscript: the traced graph, onnx: the onnx graph run in onnx runtime, cpu only
+    backends = ["eager", "int8", "torchscript", "onnx"]
+
+    _onnx_input_names = ["input_ids", "attention_mask", "token_type_ids"]
+
+    _warmup_iterations = 3
+
+    # The safetensors dtype names
+    _dtypes = {
+        "F64": torch.float64, "F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16,
+        "I64": torch.int64, "I32": torch.int32, "I16": torch.int16, "I8": torch.int8, "U8": torch.uint8,
+        "BOOL": torch.bool
+    }
+
+    _preprocessors = {
+        PreprocessorNliBertTokeniser.__name__: (PreprocessorNliBertTokeniser, transformers.BertTokenizer),
+        PreprocessorNliBertTokeniserFast.__name__: (PreprocessorNliBertTokeniserFast, transformers.BertTokenizerFast)
+    }
+
+    @classmethod
+    def exists(cls, model_dir):
+        return all(os.path.isfile(os.path.join(model_dir, f)) for f in
+                   [cls.weights_file, cls.config_file, cls.vocab_file, cls.labels_file])
+
+    @classmethod
+    def save_metadata(cls, model_dir, bert_config, preprocessor, label_mapper):
+        """
+        Writes the config, tokeniser vocab and labels. These do not change during training, and so are written once
+        :param bert_config: The transformers BertConfig of the model
+        :param preprocessor: The PreprocessorNliBertTokeniser or PreprocessorNliBertTokeniserFast
+        :param label_mapper: The label mapper
+        """
+        assert type(preprocessor).__name__ in cls._preprocessors, \
+            "Unsupported preprocessor {}".format(type(preprocessor))
+        os.makedirs(model_dir, exist_ok=True)
+
+        tokeniser = preprocessor.tokeniser
+        config = {
+            "format_version": cls._format_version,
+            "bert_config": bert_config.to_dict(),
+            "preprocessor": type(preprocessor).__name__,
+            "max_feature_len": preprocessor.max_feature_len,
+            "pad_to_max": getattr(preprocessor, "pad_to_max", True),
+            "do_lower_case": bool(getattr(tokeniser, "do_lower_case", True))
+        }
+        with open(os.path.join(model_dir, cls.config_file), "w") as f:
+            json.dump(config, f, indent=2)
+
+        tokeniser.save_vocabulary(model_dir)
+
+        labels = {"labels": [label_mapper.reverse_map(i) for i in range(label_mapper.num_classes)],
+                  "positive_label": label_mapper.positive_label}
+        with open(os.path.join(model_dir, cls.labels_file), "w") as f:
+            json.dump(labels, f)
+
+    @classmethod
+    def save_weights(cls, model, model_dir):
+        """
+        Writes the model weights in the safetensors format
+        :param model: The BertModel
+        """
+        os.makedirs(model_dir, exist_ok=True)
+        weights_path = os.path.join(model_dir, cls.weights_file)
+        state_dict = {k: v.detach().contiguous().cpu() for k, v in model.state_dict().items()}
+
+        # Write to a temp file and rename, so that a partially written snapshot is never served
+        tmp_path = "{}.tmp".format(weights_path)
+        save_file(state_dict, tmp_path)
+        os.replace(tmp_path, weights_path)
+
+    @classmethod
+    def export_int8(cls, model_dir):
+        """
+        Quantizes the weights of the linear layers to int8, and writes the quantized weights alongside the fp32 weights
+        :return: The path of the int8 weights
+        """
+        _, model, _ = cls.load(model_dir)
+        quantized_model = cls.quantize_int8(model, inplace=False)
+
+        int8_weights_path = os.path.join(model_dir, cls.int8_weights_file)
+        tmp_path = "{}.tmp".format(int8_weights_path)
+        torch.save(quantized_model.state_dict(), tmp_path)
+        os.replace(tmp_path, int8_weights_path)
+
+        return int8_weights_path
+
+    @staticmethod
+    def quantize_int8(model, inplace=True):
+        """
+        Dynamically quantizes the linear layers, i.e. the weights are stored in int8 and the activations are quantized on the fly.
+        Only supported on cpu
+        """
+        return torch.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8, inplace=inplace)
+
+    @classmethod
+    def load(cls, model_dir, device="cpu", backend="eager"):
+        """
+        Loads the model artifacts, logging the time taken by each step
+        :param backend: One of backends, eager for the fp32 model, int8 for the quantized model or torchscript for the traced graph
+        :return: a tuple (preprocessor, model, label mapper), in the same format as serve.model_fn
+        """
+        assert backend in cls.backends, "Unsupported backend {}, expected one of {}".format(backend, cls.backends)
+        assert backend not in ("int8", "onnx") or str(device) == "cpu", \
+            "The {} backend only supports cpu".format(backend)
+        logger = logging.getLogger(__name__)
+        start = time.perf_counter()
+
+        config, preprocessor, label_mapper = cls._load_metadata(model_dir)
+        metadata_time = time.perf_counter()
+
+        if backend == "torchscript":
+            model = cls._load_torchscript(model_dir, device, config)
+        elif backend == "onnx":
+            model = cls._load_onnx(model_dir, config)
+        else:
+            model = cls._load_model(model_dir, device, backend, config)
+        end = time.perf_counter()
+
+        logger.info(
+            "Loaded {} model artifacts in {:.3f}s: config, labels and preprocessor {:.3f}s, model {:.3f}s".format(
+                backend, end - start, metadata_time - start, end - metadata_time))
+
+        return preprocessor, model, label_mapper
+
+    @classmethod
+    def _load_metadata(cls, model_dir):
+        with open(os.path.join(model_dir, cls.config_file)) as f:
+            config = json.load(f)
+        assert config["format_version"] == cls._format_version, \
+            "Unsupported model artifact format version {}".format(config["format_version"])
+
+        with open(os.path.join(model_dir, cls.labels_file)) as f:
+            labels = json.load(f)
+        label_mapper = ListLabelMapper(labels["labels"], positive_label=labels["positive_label"])
+
+        preprocessor_class, tokeniser_class = cls._preprocessors[config["preprocessor"]]
+        tokeniser = _LazyTokeniser(tokeniser_class, os.path.join(model_dir, cls.vocab_file), config["do_lower_case"])
+        preprocessor = preprocessor_class(max_feature_len=config["max_feature_len"], tokeniser=tokeniser,
+                                          pad_to_max=config["pad_to_max"])
+
+        return config, preprocessor, label_mapper
+
+    @classmethod
+    def _load_model(cls, model_dir, device, backend, config):
+        logger = logging.getLogger(__name__)
+
+        # The weights are loaded from the file, so skip the random initialisation
+        with no_init_weights(), cls._skip_reset_parameters():
+            model = BertModel(None, None, fine_tune=False,
+                              bert_config=transformers.BertConfig.from_dict(config["bert_config"]))
+
+        int8_weights_path = os.path.join(model_dir, cls.int8_weights_file)
+        if backend == "int8" and os.path.isfile(int8_weights_path):
+            # Placeholder weights to quantize, replaced by the exported int8 weights
+            for module in model.modules():
+                if isinstance(module, nn.Linear):
+                    module.weight.data.zero_()
+            model = cls.quantize_int8(model)
+            model.load_state_dict(torch.load(int8_weights_path))
+        elif backend == "int8":
+            logger.warning("The int8 weights have not been exported to {}, quantizing on load".format(int8_weights_path))
+            cls._assign_weights(model, cls.load_weights(os.path.join(model_dir, cls.weights_file)))
+            model = cls.quantize_int8(model)
+        elif str(device) == "cpu":
+            state_dict = cls.load_weights(os.path.join(model_dir, cls.weights_file))
+            # Use the memory mapped tensors as is, instead of copying them into the model
+            cls._assign_weights(model, state_dict)
+        else:
+            model.load_state_dict(cls.load_weights(os.path.join(model_dir, cls.weights_file)))
+            model.to(device=device)
+        model.eval()
+
+        return model
+
+    @classmethod
+    def _load_torchscript(cls, model_dir, device, config):
+        torchscript_path = os.path.join(model_dir, cls.torchscript_file)
+        assert os.path.isfile(torchscript_path), \
+            "The torchscript model has not been exported to {}, see export_torchscript".format(torchscript_path)
+
+        model = torch.jit.load(torchscript_path, map_location=device)
+        model.eval()
+
+        # The jit profiles and optimises the graph in the first few calls, so run these before the first request
+        start = time.perf_counter()
+        seq_lens = [config["max_feature_len"]] if config["pad_to_max"] else [8, config["max_feature_len"]]
+        with torch.no_grad():
+            for _ in range(cls._warmup_iterations):
+                for seq_len in seq_lens:
+                    model(*cls.example_inputs(config, batch_size=2, seq_len=seq_len, device=device))
+        logging.getLogger(__name__).info("Warmed up torchscript model in {:.3f}s".format(time.perf_counter() - start))
+
+        return model
+
+    @classmethod
+    def export_torchscript(cls, model_dir):
+        """
+        Traces the model into a frozen torchscript graph, which runs without the python overhead of the eager model
+        :return: The path of the torchscript model
+        """
+        config, _, _ = cls._load_metadata(model_dir)
+        _, model, _ = cls.load(model_dir)
+
+        example_inputs = cls.example_inputs(config, batch_size=2, seq_len=min(16, config["max_feature_len"]))
+        with torch.no_grad():
+            traced_model = torch.jit.trace(_TupleOutput(model).eval(), example_inputs, check_trace=False)
+            traced_model = torch.jit.freeze(traced_model)
+
+        torchscript_path = os.path.join(model_dir, cls.torchscript_file)
+        tmp_path = "{}.tmp".format(torchscript_path)
+        torch.jit.save(traced_model, tmp_path)
+        os.replace(tmp_path, torchscript_path)
+
+        return torchscript_path
+
+    @classmethod
+    def _load_onnx(cls, model_dir, config):
+        onnx_path = os.path.join(model_dir, cls.onnx_file)
+        assert os.path.isfile(onnx_path), "The onnx model has not been exported to {}, see export_onnx".format(
+            onnx_path)
+
+        model = _OnnxModel(onnx_path)
+
+        # Warm up, as onnx runtime allocates its memory arenas on the first run
+        with torch.no_grad():
+            model(*cls.example_inputs(config, batch_size=2, seq_len=config["max_feature_len"]))
+
+        return model
+
+    @classmethod
+    def export_onnx(cls, model_dir, opset_version=14):
+        """
+        Exports the model to onnx, with dynamic batch and sequence axes so that a single graph serves any batch shape
+        :return: The path of the onnx model
+        """
+        config, _, _ = cls._load_metadata(model_dir)
+        _, model, _ = cls.load(model_dir)
+
+        onnx_path = os.path.join(model_dir, cls.onnx_file)
+        tmp_path = "{}.tmp".format(onnx_path)
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in cls._onnx_input_names}
+        dynamic_axes["logits"] = {0: "batch"}
+
+        # Newer versions of torch default to the dynamo exporter, use the torchscript based exporter as in torch 1.12
+        export_kwargs = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+        with torch.no_grad():
+            torch.onnx.export(_TupleOutput(model).eval(),
+                              cls.example_inputs(config, batch_size=2, seq_len=min(16, config["max_feature_len"])),
+                              tmp_path, input_names=cls._onnx_input_names, output_names=["logits"],
+                              dynamic_axes=dynamic_axes, opset_version=opset_version, do_constant_folding=True,
+                              **export_kwargs)
+        os.replace(tmp_path, onnx_path)
+
+        return onnx_path
+
+    @classmethod
+    def export(cls, model_dir, export_format):
+        """
+        Exports an optimised variant of the model, loaded using the backend with the same name
+        :param export_format: int8, torchscript or onnx
+        """
+        exporters = {"int8": cls.export_int8, "torchscript": cls.export_torchscript, "onnx": cls.export_onnx}
+        assert export_format in exporters, "Unsupported export format {}, expected one of {}".format(
+            export_format, sorted(exporters.keys()))
+        return exporters[export_format](model_dir)
+
+    @staticmethod
+    def example_inputs(config, batch_size, seq_len, device="cpu"):
+        """
+        Random inputs in the format of the preprocessor, used to trace and warm up the model
+        :param config: The config dict, containing the bert config
+        :return: a tuple of tensors (input_ids, attention_mask, token_type_ids)
+        """
+        vocab_size = config["bert_config"]["vocab_size"]
+        input_ids = torch.randint(low=0, high=vocab_size, size=(batch_size, seq_len), device=device)
+        attention_mask = torch.ones_like(input_ids)
+        token_type_ids = torch.cat([torch.zeros_like(input_ids[:, :seq_len // 2]),
+                                    torch.ones_like(input_ids[:, seq_len // 2:])], dim=1)
+        return input_ids, attention_mask, token_type_ids
+
+    @classmethod
+    def load_weights(cls, weights_path):
+        """
+        Memory maps a safetensors file, without copying the weights into memory.
+        The pages are copy on write, so they are shared across the processes that map the same file until written to
+        :return: a dict of parameter name to cpu tensor
+        """
+        with open(weights_path, "rb") as f:
+            header_len = struct.unpack("<Q", f.read(8))[0]
+            header = json.loads(f.read(header_len).decode("utf-8"))
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+        data_start = 8 + header_len
+        state_dict = {}
+        for name, info in header.items():
+            if name == "__metadata__":
+                continue
+
+            dtype = cls._dtypes[info["dtype"]]
+            start, end = info["data_offsets"]
+            if end == start:
+                tensor = torch.empty(info["shape"], dtype=dtype)
+            else:
+                # The tensor keeps a reference to the memory map, so the map stays open as long as the tensor is used
+                item_size = torch.empty(0, dtype=dtype).element_size()
+                tensor = torch.frombuffer(buffer, dtype=dtype, count=(end - start) // item_size,
+                                          offset=data_start + start).view(info["shape"])
+            state_dict[name] = tensor
+
+        return state_dict
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _skip_reset_parameters():
+        # The default initialisation of the torch layers is not covered by no_init_weights
+        layers = [nn.Linear, nn.Embedding, nn.LayerNorm]
+        reset_parameters = [layer.reset_parameters for layer in layers]
+        for layer in layers:
+            layer.reset_parameters = lambda self: None
+        try:
+            yield
+        finally:
+            for layer, reset in zip(layers, reset_parameters):
+                layer.reset_parameters = reset
+
+    @staticmethod
+    def _assign_weights(model, state_dict):
+        expected_keys = set(model.state_dict().keys())
+        missing, unexpected = expected_keys - set(state_dict.keys()), set(state_dict.keys()) - expected_keys
+        if len(missing) > 0 or len(unexpected) > 0:
+            raise KeyError("Weights do not match the model, missing {}, unexpected {}".format(sorted(missing),
+                                                                                           sorted(unexpected)))
+
+        modules = dict(model.named_modules())
+        for name, tensor in state_dict.items():
+            module_name, _, attribute = name.rpartition(".")
+            module = modules[module_name]
+            current = getattr(module, attribute)
+            if current.shape != tensor.shape:
+                raise ValueError(
+                    "Unexpected shape {} for {}, expected {}".format(tuple(tensor.shape), name, tuple(current.shape)))
+
+            if attribute in module._parameters:
+                module._parameters[attribute] = nn.Parameter(tensor, requires_grad=False)
+            else:
+                module._buffers[attribute] = tensor
+
+
+class _TupleOutput(nn.Module):
+    """
+    Returns the logits as a tuple, as in the eager model, instead of the transformers model output which cannot be traced
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask, token_type_ids):
+        return self.model(input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids)[0],
+
+
+class _OnnxModel:
+    """
+    Runs the onnx graph in onnx runtime on cpu, with the same call signature and output as the eager model
+    """
+    device = torch.device("cpu")
+
+    def __init__(self, onnx_path):
+        # Optional dependency, only required for the onnx backend
+        import onnxruntime
+
+        session_options = onnxruntime.SessionOptions()
+        session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self._session = onnxruntime.InferenceSession(onnx_path, session_options,
+                                                     providers=["CPUExecutionProvider"])
+
+    def __call__(self, input_ids, attention_mask, token_type_ids):
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask, "token_type_ids": token_type_ids}
+        logits = self._session.run(["logits"], {k: v.cpu().numpy() for k, v in inputs.items()})[0]
+        return torch.from_numpy(logits),
+
+    def eval(self):
+        return self
+
+
+class _LazyTokeniser:
+    """
+    Constructs the tokeniser from the vocab on first use, so that loading the vocab is not on the endpoint startup path
+    """
+
+    def __init__(self, tokeniser_class, vocab_file, do_lower_case):
+        self._tokeniser_class = tokeniser_class
+        self._vocab_file = vocab_file
+        self._do_lower_case = do_lower_case
+        self._tokeniser = None
+
+    def _get_tokeniser(self):
+        if self._tokeniser is None:
+            start = time.perf_counter()
+            self._tokeniser = self._tokeniser_class(self._vocab_file, do_lower_case=self._do_lower_case)
+            logging.getLogger(__name__).info("Loaded tokeniser in {:.3f}s".format(time.perf_counter() - start))
+        return self._tokeniser
+
+    def __getattr__(self, name):
+        # Only called for attributes that are not set on the lazy tokeniser itself
+        if name.startswith("__") or name == "_tokeniser":
+            raise AttributeError(name)
+        return getattr(self._get_tokeniser(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._get_tokeniser()(*args, **kwargs)
@@ -0,0 +1,57 @@
+from array import array
+
+
+class NliColumnarRecords:
+    """
+    Compact in-memory store of (premise, hypothesis, label) records.
+    Instead of a dict per record, the premises and hypotheses are each concatenated into a single utf-8 string arena with an offset array, and the labels are stored in a uint8 array.
+    This avoids the per object overhead of Python dicts and strings, and pickles to data loader workers as a few flat buffers.
+    """
+
+    def __init__(self):
+        self._premises = bytearray()
+        self._premise_offsets = array("q", [0])
+        self._hypotheses = bytearray()
+        self._hypothesis_offsets = array("q", [0])
+        self._labels = array("B")
+
+    def append(self, premise, hypothesis, label):
+        """
+        Appends a record
+        :param premise: The premise text
+        :param hypothesis: The hypothesis text
+        :param label: The zero indexed label, must be less than 256
+        """
+        self._premises += premise.encode("utf-8")
+        self._premise_offsets.append(len(self._premises))
+        self._hypotheses += hypothesis.encode("utf-8")
+        self._hypothesis_offsets.append(len(self._hypotheses))
+        self._labels.append(label)
+
+    def __len__(self):
+        return len(self._labels)
+
+    def __getitem__(self, idx):
+        """
+        :return: a tuple (premise, hypothesis, label)
+        """
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("Index {} out of range for {} records".format(idx, len(self)))
+
+        return self._decode(self._premises, self._premise_offsets, idx), \
+               self._decode(self._hypotheses, self._hypothesis_offsets, idx), \
+               self._labels[idx]
+
+    @staticmethod
+    def _decode(arena, offsets, idx):
+        return arena[offsets[idx]:offsets[idx + 1]].decode("utf-8")
+
+    @property
+    def nbytes(self):
+        """
+        The approximate memory used by the records
+        """
+        return len(self._premises) + len(self._hypotheses) + len(self._labels) + \
+               (len(self._premise_offsets) + len(self._hypothesis_offsets)) * self._premise_offsets.itemsize
@@ -0,0 +1,244 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from array import array
+
+import numpy as np
+import torch
+
+from nli_source_registry import get_source
+from nli_token_cache import NliTokenCache
+
+
+class NliDedupTokenCache:
+    """
+    On-disk, memory mapped cache of pre-tokenised NLI records from one or more sources, e.g. a mixture of SNLI, MultiNLI and ANLI.
+    Each distinct sentence is tokenised and stored once, and a record references its premise and hypothesis by index.
+    As SNLI pairs each premise with about 3 hypotheses, and sentences repeat across the sources, this tokenises and stores fewer sentences than NliTokenCache.
+    The records are formatted on read, with the same truncation and padding as the preprocessor, [CLS] premise [SEP] hypothesis [PAD].. [SEP]
+
+    The cache is keyed by the tokeniser vocab, the max sequence length and the format and hash of each source file.
+
+    Layout of the cache directory:
+        text_ids.bin        int32, token indices of all the distinct sentences concatenated, each truncated to the longest that is used
+        text_offsets.bin    int64, num_texts + 1 offsets into the text ids
+        pairs.bin           int32, num_records x 2 indices of the premise and the hypothesis sentence
+        labels.bin          int16, zero indexed label of each record
+        meta.json           the cache key details, the special token indices, the number of records of each source
+    """
+
+    _format_version = 1
+
+    _text_ids_file = "text_ids.bin"
+    _text_offsets_file = "text_offsets.bin"
+    _pairs_file = "pairs.bin"
+    _labels_file = "labels.bin"
+    _meta_file = "meta.json"
+
+    def __init__(self, cache_dir, sources, preprocessor, flush_every=10000):
+        """
+        :param sources: A list of tuples (source name, jsonl file), see nli_source_registry
+        :param flush_every: The number of distinct sentences tokenised in a single call
+        """
+        self.cache_dir = cache_dir
+        self.sources = sources
+        self.preprocessor = preprocessor
+        self.flush_every = flush_every
+        self._key = None
+        self._arrays = None
+        self._meta = None
+
+    @property
+    def _logger(self):
+        return logging.getLogger(__name__)
+
+    @property
+    def key(self):
+        if self._key is None:
+            key_details = json.dumps(self._key_details(), sort_keys=True)
+            self._key = hashlib.sha256(key_details.encode("utf-8")).hexdigest()[:24]
+        return self._key
+
+    @property
+    def path(self):
+        return os.path.join(self.cache_dir, self.key)
+
+    def exists(self):
+        return os.path.isfile(os.path.join(self.path, self._meta_file))
+
+    def build(self, label_mapper):
+        """
+        Parses the sources, and tokenises each distinct sentence once
+        :param label_mapper: The label mapper to map the gold labels to zero indexed labels
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Write into a temp dir and rename, so that a partially written cache is never picked up
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp_")
+        self._logger.info("Building dedup token cache {} for {}".format(self.path, self.sources))
+
+        max_text_len = self._max_text_len(self.preprocessor.max_feature_len)
+        text_index = {}
+        pending = []
+        pairs, labels = array("i"), array("h")
+        source_sizes = []
+        num_tokens = 0
+        with open(os.path.join(tmp_dir, self._text_ids_file), "wb") as f_ids, \
+                open(os.path.join(tmp_dir, self._text_offsets_file), "wb") as f_offsets:
+            np.asarray([0], dtype=np.int64).tofile(f_offsets)
+
+            def encode(texts):
+                nonlocal num_tokens
+                text_ids = [ids[:max_text_len] for ids in self.preprocessor.encode_texts(texts)]
+                offsets = num_tokens + np.cumsum([len(ids) for ids in text_ids], dtype=np.int64)
+                np.asarray([i for ids in text_ids for i in ids], dtype=np.int32).tofile(f_ids)
+                offsets.tofile(f_offsets)
+                num_tokens = int(offsets[-1]) if len(offsets) else num_tokens
+
+            for source_name, source_file in self.sources:
+                num_records = len(labels)
+                with open(source_file) as f:
+                    for premise, hypothesis, y in get_source(source_name).parse_lines(f, label_mapper):
+                        for text in (premise, hypothesis):
+                            if text not in text_index:
+                                text_index[text] = len(text_index)
+                                pending.append(text)
+                        pairs.extend((text_index[premise], text_index[hypothesis]))
+                        labels.append(y)
+
+                        if len(pending) >= self.flush_every:
+                            encode(pending)
+                            pending = []
+                source_sizes.append(len(labels) - num_records)
+                self._logger.info("Parsed {} records from {}".format(source_sizes[-1], source_file))
+            if len(pending) > 0:
+                encode(pending)
+
+        np.frombuffer(pairs, dtype=np.int32).tofile(os.path.join(tmp_dir, self._pairs_file))
+        np.frombuffer(labels, dtype=np.int16).tofile(os.path.join(tmp_dir, self._labels_file))
+
+        cls_index, sep_index = self.preprocessor.token_to_index(["[CLS]", "[SEP]"])
+        with open(os.path.join(tmp_dir, self._meta_file), "w") as f:
+            json.dump({"num_records": len(labels), "num_texts": len(text_index), "num_tokens": num_tokens,
+                       "source_sizes": source_sizes, "max_feature_len": self.preprocessor.max_feature_len,
+                       "pad_to_max": getattr(self.preprocessor, "pad_to_max", True),
+                       "cls_index": cls_index, "sep_index": sep_index, "pad_index": self.preprocessor.pad_index,
+                       "key": self._key_details()}, f)
+
+        try:
+            os.rename(tmp_dir, self.path)
+        except OSError:
+            # Another process completed the same cache first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not self.exists(): raise
+
+        self._logger.info("Completed dedup token cache with {} records, {} distinct sentences and {} tokens".format(
+            len(labels), len(text_index), num_tokens))
+        return self
+
+    @property
+    def source_sizes(self):
+        """
+        The number of records of each source, the records are in the order of the sources
+        """
+        return self._get_meta()["source_sizes"]
+
+    def __len__(self):
+        return len(self._get_arrays()["labels"])
+
+    def __getitem__(self, idx):
+        """
+        :return: a tuple (token indices, segment indices, label), the same as NliTokenCache
+        """
+        arrays, meta = self._get_arrays(), self._get_meta()
+        premise_index, hypothesis_index = arrays["pairs"][idx]
+        max_feature_len = meta["max_feature_len"]
+        premise = self._text(premise_index)[:max_feature_len // 2 - 2]
+        hypothesis = self._text(hypothesis_index)[:max_feature_len // 2 - 1]
+        num_pad = max_feature_len - 3 - len(premise) - len(hypothesis) if meta["pad_to_max"] else 0
+
+        input_ids = np.empty(len(premise) + len(hypothesis) + num_pad + 3, dtype=np.int64)
+        input_ids[0] = meta["cls_index"]
+        input_ids[1:len(premise) + 1] = premise
+        input_ids[len(premise) + 1] = meta["sep_index"]
+        input_ids[len(premise) + 2:len(premise) + 2 + len(hypothesis)] = hypothesis
+        input_ids[len(premise) + 2 + len(hypothesis):-1] = meta["pad_index"]
+        input_ids[-1] = meta["sep_index"]
+
+        token_type_ids = np.ones(len(input_ids), dtype=np.int64)
+        token_type_ids[:len(premise) + 2] = 0
+
+        return torch.from_numpy(input_ids), torch.from_numpy(token_type_ids), int(arrays["labels"][idx])
+
+    @property
+    def lengths(self):
+        """
+        The number of tokens in each record
+        """
+        arrays, meta = self._get_arrays(), self._get_meta()
+        max_feature_len = meta["max_feature_len"]
+        if meta["pad_to_max"]:
+            return np.full(len(arrays["labels"]), max_feature_len, dtype=np.int64)
+
+        text_lengths = np.diff(arrays["text_offsets"])
+        return np.minimum(text_lengths[arrays["pairs"][:, 0]], max_feature_len // 2 - 2) + \
+               np.minimum(text_lengths[arrays["pairs"][:, 1]], max_feature_len // 2 - 1) + 3
+
+    @property
+    def nbytes(self):
+        """
+        The size of the cache on disk
+        """
+        return sum(os.path.getsize(os.path.join(self.path, f)) for f in os.listdir(self.path))
+
+    def __getstate__(self):
+        # The memory maps are opened lazily in each data loader worker instead of being pickled
+        state = self.__dict__.copy()
+        state["_arrays"] = None
+        return state
+
+    def _text(self, text_index):
+        offsets = self._get_arrays()["text_offsets"]
+        return self._get_arrays()["text_ids"][offsets[text_index]:offsets[text_index + 1]]
+
+    def _get_meta(self):
+        if self._meta is None:
+            with open(os.path.join(self.path, self._meta_file)) as f:
+                self._meta = json.load(f)
+        return self._meta
+
+    def _get_arrays(self):
+        if self._arrays is None:
+            self._arrays = {
+                "text_ids": self._memmap(self._text_ids_file, np.int32),
+                "text_offsets": self._memmap(self._text_offsets_file, np.int64),
+                "pairs": self._memmap(self._pairs_file, np.int32).reshape(-1, 2),
+                "labels": self._memmap(self._labels_file, np.int16)
+            }
+        return self._arrays
+
+    def _memmap(self, file_name, dtype):
+        file_path = os.path.join(self.path, file_name)
+        # A zero length file cannot be memory mapped
+        if os.path.getsize(file_path) == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(file_path, dtype=dtype, mode="r")
+
+    @staticmethod
+    def _max_text_len(max_feature_len):
+        # The longer of the premise and the hypothesis truncation
+        return max(max_feature_len // 2 - 1, 0)
+
+    def _key_details(self):
+        return {
+            "format_version": self._format_version,
+            "preprocessor": type(self.preprocessor).__name__,
+            "max_feature_len": self.preprocessor.max_feature_len,
+            "pad_to_max": getattr(self.preprocessor, "pad_to_max", True),
+            "vocab_hash": NliTokenCache._vocab_hash(self.preprocessor.tokeniser),
+            "sources": [[source_name, NliTokenCache._file_hash(source_file)] for source_name, source_file in
+                        self.sources]
+        }
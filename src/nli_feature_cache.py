@@ -0,0 +1,151 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+from nli_token_cache import NliTokenCache
+
+
+class NliFeatureCache(Dataset):
+    """
+    On-disk, memory mapped cache of the pooled output of the frozen BERT encoder for each NLI record.
+    When only the classifier is trained, the encoder runs once per source file instead of once per item in every epoch, and the classifier is trained on the cached features, see BertClassifierHead.
+    The cache is keyed by the token cache key, i.e. the tokeniser vocab, max sequence length and the source file, and the hash of the encoder weights.
+
+    Note: The features are computed with the encoder in eval mode, and so without the dropout within the encoder. The dropout before the classifier still applies.
+
+    Layout of the cache directory:
+        features.bin    float32, num_records x hidden size pooled outputs
+        labels.bin      int16, zero indexed label of each record
+        meta.json       the cache key details, the number of records and the hidden size
+    """
+
+    _format_version = 1
+
+    _features_file = "features.bin"
+    _labels_file = "labels.bin"
+    _meta_file = "meta.json"
+
+    def __init__(self, cache_dir, source_file, preprocessor, bert_model):
+        """
+        :param bert_model: The BertModel whose frozen encoder computes the features
+        """
+        self.cache_dir = cache_dir
+        self.source_file = source_file
+        self.preprocessor = preprocessor
+        self.bert_model = bert_model
+        self._key = None
+        self._arrays = None
+
+    @property
+    def _logger(self):
+        return logging.getLogger(__name__)
+
+    @property
+    def key(self):
+        if self._key is None:
+            key_details = json.dumps(self._key_details(), sort_keys=True)
+            self._key = hashlib.sha256(key_details.encode("utf-8")).hexdigest()[:24]
+        return self._key
+
+    @property
+    def path(self):
+        return os.path.join(self.cache_dir, self.key)
+
+    def exists(self):
+        return os.path.isfile(os.path.join(self.path, self._meta_file))
+
+    def build(self, data_loader, device="cpu"):
+        """
+        Runs the encoder over the records and writes the features to the cache
+        :param data_loader: The data loader over the tokenised records of the source file, returning (x, y) where x is a tuple (input_ids, attention_mask, token_type_ids). Must not be shuffled
+        :param device: The device to run the encoder on
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Write into a temp dir and rename, so that a partially written cache is never picked up
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp_")
+        self._logger.info("Building feature cache {} for {}".format(self.path, self.source_file))
+
+        was_training = self.bert_model.training
+        self.bert_model.to(device=device)
+        self.bert_model.eval()
+        num_records, hidden_size = 0, self.bert_model.model.config.hidden_size
+        with open(os.path.join(tmp_dir, self._features_file), "wb") as f_features, \
+                open(os.path.join(tmp_dir, self._labels_file), "wb") as f_labels, torch.no_grad():
+            for x, y in data_loader:
+                features = self.bert_model.pooled_output(*[t.to(device=device) for t in x])
+                features.float().cpu().numpy().astype(np.float32).tofile(f_features)
+                np.asarray(y, dtype=np.int16).tofile(f_labels)
+                num_records += len(y)
+        self.bert_model.train(was_training)
+
+        with open(os.path.join(tmp_dir, self._meta_file), "w") as f:
+            json.dump({"num_records": num_records, "hidden_size": hidden_size, "key": self._key_details()}, f)
+
+        try:
+            os.rename(tmp_dir, self.path)
+        except OSError:
+            # Another process completed the same cache first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not self.exists(): raise
+
+        self._logger.info("Completed feature cache with {} records".format(num_records))
+        return self
+
+    def __len__(self):
+        return len(self._get_arrays()["labels"])
+
+    def __getitem__(self, idx):
+        """
+        :return: a tuple (pooled output, label)
+        """
+        arrays = self._get_arrays()
+        return torch.from_numpy(arrays["features"][idx]), int(arrays["labels"][idx])
+
+    def __getstate__(self):
+        # The memory maps are opened lazily in each data loader worker instead of being pickled, and the workers do not need the model
+        state = self.__dict__.copy()
+        state["_arrays"] = None
+        state["bert_model"] = None
+        return state
+
+    def _get_arrays(self):
+        if self._arrays is None:
+            with open(os.path.join(self.path, self._meta_file)) as f:
+                hidden_size = json.load(f)["hidden_size"]
+            features = self._memmap(self._features_file, np.float32)
+            self._arrays = {
+                "features": features.reshape(-1, hidden_size),
+                "labels": self._memmap(self._labels_file, np.int16)
+            }
+        return self._arrays
+
+    def _memmap(self, file_name, dtype):
+        file_path = os.path.join(self.path, file_name)
+        # A zero length file cannot be memory mapped
+        if os.path.getsize(file_path) == 0:
+            return np.zeros(0, dtype=dtype)
+        # Copy on write mode, so the tensors created from the map are writable without copying the data
+        return np.memmap(file_path, dtype=dtype, mode="c")
+
+    def _key_details(self):
+        return {
+            "format_version": self._format_version,
+            "token_cache_key": NliTokenCache(self.cache_dir, self.source_file, self.preprocessor).key,
+            "encoder_hash": self._encoder_hash(self.bert_model)
+        }
+
+    @staticmethod
+    def _encoder_hash(bert_model):
+        encoder_hash = hashlib.sha256()
+        for name, tensor in bert_model.model.base_model.state_dict().items():
+            encoder_hash.update(name.encode("utf-8"))
+            encoder_hash.update(tensor.detach().float().cpu().contiguous().numpy().tobytes())
+        return encoder_hash.hexdigest()
@@ -0,0 +1,90 @@
+import logging
+
+from torch.utils.data import Dataset
+
+from nli_columnar_records import NliColumnarRecords
+from nli_dedup_token_cache import NliDedupTokenCache
+from nli_source_registry import get_source
+from snli_dataset_label_mapper import SnliLabelMapper
+
+
+class NliMixtureDataset(Dataset):
+    """
+    The records of one or more NLI sources, e.g. SNLI, MultiNLI and ANLI, concatenated in the order of the sources.
+    Use with WeightedMixtureSampler to mix the sources by weight
+    """
+
+    @property
+    def _logger(self):
+        return logging.getLogger(__name__)
+
+    def __init__(self, sources, preprocessor=None, token_cache_dir=None):
+        """
+        :param sources: A list of tuples (source name, jsonl file), the source name is the format of the file, see nli_source_registry
+        :param preprocessor: The preprocessor to apply to the (premise, hypothesis)
+        :param token_cache_dir: Optional directory to cache the preprocessed tokens in, see NliDedupTokenCache. The sentences repeated across the records and the sources are tokenised once
+        """
+        self.sources = sources
+        self.preprocessor = preprocessor
+        self._label_mapper = SnliLabelMapper()
+        self._items = NliColumnarRecords()
+        self._source_sizes = []
+        self._token_cache = None
+
+        if token_cache_dir is not None and preprocessor is not None:
+            self._token_cache = NliDedupTokenCache(token_cache_dir, sources, preprocessor)
+            self._pad_index = preprocessor.pad_index
+            if self._token_cache.exists():
+                self._logger.info("Using dedup token cache {}".format(self._token_cache.path))
+            else:
+                self._token_cache.build(self._label_mapper)
+            self._source_sizes = self._token_cache.source_sizes
+        else:
+            self._load_items()
+
+        self._logger.info("Loaded {} records from the sources {}".format(
+            len(self), list(zip([name for name, _ in sources], self._source_sizes))))
+
+    def _load_items(self):
+        for source_name, source_file in self.sources:
+            num_items = len(self._items)
+            with open(source_file) as f:
+                for premise, hypothesis, label in get_source(source_name).parse_lines(f, self._label_mapper):
+                    self._items.append(premise, hypothesis, label)
+            self._source_sizes.append(len(self._items) - num_items)
+
+    @property
+    def source_sizes(self):
+        """
+        The number of records of each source
+        """
+        return list(self._source_sizes)
+
+    def __len__(self):
+        if self._token_cache is not None:
+            return len(self._token_cache)
+        return len(self._items)
+
+    @property
+    def lengths(self):
+        """
+        The length of each item, see SnliDataset lengths
+        """
+        if self._token_cache is not None:
+            return self._token_cache.lengths.tolist()
+        return [len(premise.split()) + len(hypothesis.split()) for premise, hypothesis, _ in
+                (self._items[i] for i in range(len(self._items)))]
+
+    def __getitem__(self, idx):
+        if self._token_cache is not None:
+            input_ids, token_type_ids, y = self._token_cache[idx]
+            attention_mask = (input_ids != self._pad_index).long()
+            return (input_ids, attention_mask, token_type_ids), y
+
+        x_prem, x_hype, y = self._items[idx]
+
+        x = (x_prem, x_hype)
+        if self.preprocessor:
+            x = self.preprocessor((x_prem, x_hype))
+
+        return x, y
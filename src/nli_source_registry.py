@@ -0,0 +1,103 @@
+import json
+import logging
+
+
+class NliSource:
+    """
+    The field mapping of an NLI jsonl format to (premise, hypothesis, label)
+    """
+
+    def __init__(self, premise_field, hypothesis_field, label_field, label_map=None, missing_labels=("-", "")):
+        """
+        :param label_map: Optional dict mapping the labels of the format to the SNLI labels, e.g. {"e": "entailment"}
+        :param missing_labels: The labels of the records without a gold label, which are skipped
+        """
+        self.premise_field = premise_field
+        self.hypothesis_field = hypothesis_field
+        self.label_field = label_field
+        self.label_map = label_map or {}
+        self.missing_labels = missing_labels
+
+    def parse_lines(self, lines, label_mapper, start_index=0):
+        """
+        Parses the json lines, skipping the lines without a gold label
+        :param lines: An iterable of json lines
+        :param label_mapper: The label mapper to map the gold label to a zero indexed label
+        :param start_index: The index of the first line, used in log messages
+        :return: A generator of (premise, hypothesis, zero indexed label)
+        """
+        logger = logging.getLogger(__name__)
+        for i, l in enumerate(lines, start=start_index):
+            data = json.loads(l)
+            premise, hypothesis = data[self.premise_field], data[self.hypothesis_field]
+            label = data.get(self.label_field)
+
+            if label is None or label in self.missing_labels:
+                logger.info(f"Missing label in idx {i}.. hence skipping")
+                continue
+            label = self.label_map.get(label, label)
+            if label not in label_mapper.raw_labels:
+                raise IndexError(
+                    "Loading Index {}: Label {} unexpected for premise {}".format(i, label, premise))
+
+            yield premise, hypothesis, label_mapper.map(label)
+
+
+# The NLI jsonl formats, by name
+_sources = {
+    # https://nlp.stanford.edu/projects/snli/
+    "snli": NliSource("sentence1", "sentence2", "gold_label"),
+    # https://cims.nyu.edu/~sbowman/multinli/, the same fields as SNLI
+    "mnli": NliSource("sentence1", "sentence2", "gold_label"),
+    # https://github.com/facebookresearch/anli
+    "anli": NliSource("context", "hypothesis", "label",
+                      label_map={"e": "entailment", "n": "neutral", "c": "contradiction"}),
+}
+
+
+def register_source(name, source):
+    """
+    Registers an NLI jsonl format, so that it can be used in a mixture, see NliMixtureDataset
+    """
+    _sources[name] = source
+
+
+def get_source(name):
+    if name not in _sources:
+        raise KeyError("Unknown NLI source {}, expected one of {}".format(name, sorted(_sources)))
+    return _sources[name]
+
+
+def source_names():
+    return sorted(_sources)
+
+
+def parse_mixture(spec):
+    """
+    Parses a comma separated list of source:file or source:file:weight, e.g. snli:snli_1.0_train.jsonl:1,anli:train.jsonl:3.
+    The file may itself contain ":", e.g. a url or a windows drive letter, and so a trailing ":<number>" is always read as the weight
+    :return: A list of tuples (source name, file, weight), the weight is None when not given
+    :raises ValueError: when a source is unknown, or a file or weight is invalid
+    """
+    mixture = []
+    for source in spec.split(","):
+        if ":" not in source:
+            raise ValueError("Expected source:file or source:file:weight, found {}".format(source))
+        name, file = source.split(":", 1)
+        weight = None
+        if ":" in file:
+            head, tail = file.rsplit(":", 1)
+            try:
+                weight = float(tail)
+                file = head
+            except ValueError:
+                pass
+
+        if name not in _sources:
+            raise ValueError("Unknown NLI source {} in {}, expected one of {}".format(name, source, source_names()))
+        if not file:
+            raise ValueError("Missing the file of the source {}".format(source))
+        if weight is not None and weight < 0:
+            raise ValueError("The weight of the source {} must not be negative".format(source))
+        mixture.append((name, file, weight))
+    return mixture
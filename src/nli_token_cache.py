@@ -0,0 +1,194 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import torch
+
+
+class NliTokenCache:
+    """
+    On-disk, memory mapped cache of pre-tokenised NLI records. The tokeniser runs once per source file instead of once per item in every epoch.
+    The cache is keyed by the tokeniser vocab, the max sequence length and the hash of the source file, so a change in any of them results in a new cache.
+
+    Layout of the cache directory:
+        input_ids.bin       int32, token indices of all records concatenated
+        token_type_ids.bin  int16, segment indices of all records concatenated
+        offsets.bin         int64, num_records + 1 offsets into the concatenated arrays
+        labels.bin          int16, zero indexed label of each record
+        meta.json           the cache key details and the number of records
+    """
+
+    _format_version = 1
+
+    _input_ids_file = "input_ids.bin"
+    _token_type_ids_file = "token_type_ids.bin"
+    _offsets_file = "offsets.bin"
+    _labels_file = "labels.bin"
+    _meta_file = "meta.json"
+
+    def __init__(self, cache_dir, source_file, preprocessor, flush_every=10000):
+        self.cache_dir = cache_dir
+        self.source_file = source_file
+        self.preprocessor = preprocessor
+        self.flush_every = flush_every
+        self._key = None
+        self._arrays = None
+
+    @property
+    def _logger(self):
+        return logging.getLogger(__name__)
+
+    @property
+    def key(self):
+        if self._key is None:
+            key_details = json.dumps(self._key_details(), sort_keys=True)
+            self._key = hashlib.sha256(key_details.encode("utf-8")).hexdigest()[:24]
+        return self._key
+
+    @property
+    def path(self):
+        return os.path.join(self.cache_dir, self.key)
+
+    def exists(self):
+        return os.path.isfile(os.path.join(self.path, self._meta_file))
+
+    def build(self, records):
+        """
+        Encodes the records and writes them to the cache
+        :param records: An iterable of ((premise, hypothesis), zero indexed label)
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Write into a temp dir and rename, so that a partially written cache is never picked up
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp_")
+        self._logger.info("Building token cache {} for {}".format(self.path, self.source_file))
+
+        num_records = 0
+        offset = 0
+        buffer_ids, buffer_token_types, buffer_offsets, buffer_labels = [], [], [0], []
+        with open(os.path.join(tmp_dir, self._input_ids_file), "wb") as f_ids, \
+                open(os.path.join(tmp_dir, self._token_type_ids_file), "wb") as f_token_types, \
+                open(os.path.join(tmp_dir, self._offsets_file), "wb") as f_offsets, \
+                open(os.path.join(tmp_dir, self._labels_file), "wb") as f_labels:
+
+            def flush():
+                np.asarray(buffer_ids, dtype=np.int32).tofile(f_ids)
+                np.asarray(buffer_token_types, dtype=np.int16).tofile(f_token_types)
+                np.asarray(buffer_offsets, dtype=np.int64).tofile(f_offsets)
+                np.asarray(buffer_labels, dtype=np.int16).tofile(f_labels)
+                for b in (buffer_ids, buffer_token_types, buffer_offsets, buffer_labels):
+                    b.clear()
+
+            def encode(batch):
+                # Encode in batches, so that batch oriented preprocessors can tokenise a batch in a single call
+                nonlocal num_records, offset
+                encoded = self.preprocessor.encode_batch([x for x, _ in batch])
+                for (input_ids, token_type_ids), (_, y) in zip(encoded, batch):
+                    offset += len(input_ids)
+                    num_records += 1
+                    buffer_ids.extend(input_ids)
+                    buffer_token_types.extend(token_type_ids)
+                    buffer_offsets.append(offset)
+                    buffer_labels.append(y)
+                flush()
+
+            batch = []
+            for record in records:
+                batch.append(record)
+                if len(batch) == self.flush_every:
+                    encode(batch)
+                    batch = []
+                    self._logger.info("Encoded {} records".format(num_records))
+            if len(batch) > 0:
+                encode(batch)
+
+        with open(os.path.join(tmp_dir, self._meta_file), "w") as f:
+            json.dump({"num_records": num_records, "num_tokens": offset, "key": self._key_details()}, f)
+
+        try:
+            os.rename(tmp_dir, self.path)
+        except OSError:
+            # Another process completed the same cache first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not self.exists(): raise
+
+        self._logger.info("Completed token cache with {} records and {} tokens".format(num_records, offset))
+        return self
+
+    def __len__(self):
+        return len(self._get_arrays()["labels"])
+
+    def __getitem__(self, idx):
+        """
+        Returns a zero copy view of the cached record
+        :return: a tuple (token indices, segment indices, label)
+        """
+        arrays = self._get_arrays()
+        start, end = arrays["offsets"][idx], arrays["offsets"][idx + 1]
+
+        return torch.from_numpy(arrays["input_ids"][start:end]), \
+               torch.from_numpy(arrays["token_type_ids"][start:end]), \
+               int(arrays["labels"][idx])
+
+    @property
+    def lengths(self):
+        """
+        The number of tokens in each record
+        """
+        return np.diff(self._get_arrays()["offsets"])
+
+    def __getstate__(self):
+        # The memory maps are opened lazily in each data loader worker instead of being pickled
+        state = self.__dict__.copy()
+        state["_arrays"] = None
+        return state
+
+    def _get_arrays(self):
+        if self._arrays is None:
+            self._arrays = {
+                "input_ids": self._memmap(self._input_ids_file, np.int32),
+                "token_type_ids": self._memmap(self._token_type_ids_file, np.int16),
+                "offsets": self._memmap(self._offsets_file, np.int64),
+                "labels": self._memmap(self._labels_file, np.int16)
+            }
+        return self._arrays
+
+    def _memmap(self, file_name, dtype):
+        file_path = os.path.join(self.path, file_name)
+        # A zero length file cannot be memory mapped
+        if os.path.getsize(file_path) == 0:
+            return np.zeros(0, dtype=dtype)
+        # Copy on write mode, so the tensors created from the map are writable without copying the data
+        return np.memmap(file_path, dtype=dtype, mode="c")
+
+    def _key_details(self):
+        return {
+            "format_version": self._format_version,
+            "preprocessor": type(self.preprocessor).__name__,
+            "max_feature_len": self.preprocessor.max_feature_len,
+            "pad_to_max": getattr(self.preprocessor, "pad_to_max", True),
+            "vocab_hash": self._vocab_hash(self.preprocessor.tokeniser),
+            "source_hash": self._file_hash(self.source_file)
+        }
+
+    @staticmethod
+    def _vocab_hash(tokeniser):
+        vocab = tokeniser.get_vocab() if hasattr(tokeniser, "get_vocab") else getattr(tokeniser, "vocab", None)
+        if not isinstance(vocab, dict):
+            raise ValueError(
+                "Unable to cache tokens, the vocab of tokeniser {} cannot be retrieved".format(type(tokeniser)))
+
+        ordered_vocab = sorted(vocab.items(), key=lambda kv: kv[1])
+        return hashlib.sha256(json.dumps(ordered_vocab).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _file_hash(file_path, chunk_size=1024 * 1024):
+        file_hash = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
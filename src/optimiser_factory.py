@@ -0,0 +1,128 @@
+import inspect
+import logging
+
+import torch
+
+
+class OptimiserFactory:
+    """
+    Creates the optimiser over the trainable parameters of a model, and the learning rate schedule.
+    With weight decay, the biases and the LayerNorm weights are placed in a param group without weight decay
+    """
+
+    optimisers = {"adam": torch.optim.Adam, "adamw": torch.optim.AdamW}
+    implementations = {"foreach", "fused"}
+    schedules = {"constant", "linear"}
+    no_decay = ("bias", "LayerNorm.weight")
+
+    def __init__(self, optimiser="adam", learning_rate=0.00001, weight_decay=0.0, implementation=None, warmup_steps=0,
+                 schedule="constant"):
+        """
+        :param optimiser: One of optimisers
+        :param weight_decay: The weight decay, except for the biases and the LayerNorm weights. For adam the decay is added to the gradient, for adamw the decay is decoupled
+        :param implementation: Optionally, "foreach" updates all the parameters of a group using a few multi tensor kernels instead of a loop over each parameter, "fused" uses a single fused kernel. Ignored with a warning when the installed torch does not support it
+        :param warmup_steps: The number of optimiser steps the learning rate linearly increases from 0 over
+        :param schedule: "constant" keeps the learning rate after the warmup, "linear" linearly decays it to 0 by the last step
+        """
+        assert optimiser in self.optimisers, "Unexpected optimiser {}".format(optimiser)
+        assert implementation is None or implementation in self.implementations, \
+            "Unexpected implementation {}".format(implementation)
+        assert schedule in self.schedules, "Unexpected schedule {}".format(schedule)
+        self.optimiser = optimiser
+        self.learning_rate = learning_rate
+        self.weight_decay = weight_decay
+        self.implementation = implementation
+        self.warmup_steps = warmup_steps
+        self.schedule = schedule
+
+    @property
+    def _logger(self):
+        return logging.getLogger(__name__)
+
+    def create(self, model):
+        """
+        :return: The optimiser over the trainable parameters of the model
+        """
+        named_parameters = [(n, p) for n, p in model.named_parameters() if p.requires_grad]
+        optimiser_class = self.optimisers[self.optimiser]
+        return optimiser_class(self.param_groups(named_parameters), lr=self.learning_rate,
+                               **self._implementation_kwargs(optimiser_class))
+
+    def param_groups(self, named_parameters):
+        """
+        :param named_parameters: A list of tuples (name, parameter)
+        :return: The param groups, the parameters excluded from weight decay in a separate group
+        """
+        if not self.weight_decay:
+            return [{"params": [p for _, p in named_parameters], "weight_decay": 0.0}]
+
+        decay = [p for n, p in named_parameters if not n.endswith(self.no_decay)]
+        no_decay = [p for n, p in named_parameters if n.endswith(self.no_decay)]
+        return [g for g in [{"params": decay, "weight_decay": self.weight_decay},
+                            {"params": no_decay, "weight_decay": 0.0}] if g["params"]]
+
+    def create_scheduler(self, optimiser, total_steps=None):
+        """
+        :param total_steps: The total number of optimiser steps, required by the linear schedule
+        :return: The learning rate schedule, stepped once per optimiser step, or None when the learning rate is constant
+        """
+        if self.schedule == "constant" and not self.warmup_steps:
+            return None
+        assert self.schedule == "constant" or total_steps, "The total steps are required by the linear schedule"
+        return WarmupLinearSchedule(optimiser, self.warmup_steps,
+                                    total_steps=total_steps if self.schedule == "linear" else None)
+
+    def _implementation_kwargs(self, optimiser_class):
+        if self.implementation is None:
+            return {}
+
+        if self.implementation not in inspect.signature(optimiser_class).parameters:
+            self._logger.warning("The installed torch {} does not support {} {}, using the default".format(
+                torch.__version__, self.implementation, optimiser_class.__name__))
+            return {}
+        return {self.implementation: True}
+
+
+class WarmupLinearSchedule:
+    """
+    Linearly increases the learning rate of each param group from 0 over the warmup steps, and then optionally linearly decays it to 0 by the total steps.
+    Applies to the param groups added after the schedule was created, e.g. by GradualUnfreezer, as well
+    """
+
+    def __init__(self, optimiser, warmup_steps, total_steps=None):
+        """
+        :param total_steps: The total number of optimiser steps to decay over, None keeps the learning rate constant after the warmup
+        """
+        self.optimiser = optimiser
+        self.warmup_steps = warmup_steps
+        self.total_steps = total_steps
+        self.steps = 0
+        self._apply()
+
+    def factor(self, step):
+        if step < self.warmup_steps:
+            return step / self.warmup_steps
+        if self.total_steps is None:
+            return 1.0
+        return max(0.0, (self.total_steps - step) / max(1, self.total_steps - self.warmup_steps))
+
+    def step(self):
+        self.steps += 1
+        self._apply()
+
+    def get_last_lr(self):
+        return [g["lr"] for g in self.optimiser.param_groups]
+
+    def state_dict(self):
+        return {"steps": self.steps}
+
+    def load_state_dict(self, state_dict):
+        self.steps = state_dict["steps"]
+        self._apply()
+
+    def _apply(self):
+        factor = self.factor(self.steps)
+        for group in self.optimiser.param_groups:
+            # The learning rate the group was created with
+            group.setdefault("initial_lr", group["lr"])
+            group["lr"] = group["initial_lr"] * factor
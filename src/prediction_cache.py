@@ -0,0 +1,101 @@
+import collections
+import threading
+import time
+
+
+class LruCache:
+    """
+    Thread safe least recently used cache, bounded by the number of entries and optionally by the age of an entry.
+    Counts the hits and misses, so that the hit rate can be monitored
+    """
+
+    def __init__(self, max_size, ttl_seconds=None, clock=time.monotonic):
+        """
+        :param max_size: The max number of entries, the least recently used entry is evicted when full
+        :param ttl_seconds: Optionally, the max age of an entry in seconds. Expired entries are treated as misses
+        :param clock: The function returning the current time in seconds, overridden in tests
+        """
+        assert max_size > 0, "The max size must be positive, found {}".format(max_size)
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        :return: the cached value, or None when the key is not cached or has expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_seconds is not None and self._clock() - entry[1] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, self._clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getstate__(self):
+        # The lock cannot be pickled, e.g. to a data loader worker
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def stats(self):
+        """
+        :return: a dict containing the hits, misses, hit rate and the number of entries
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self),
+            "max_size": self.max_size
+        }
+
+
+class PredictionCache(LruCache):
+    """
+    Caches the prediction for a (premise, hypothesis) pair, keyed on the model version and the pair with the whitespace normalised.
+    The tokeniser splits on whitespace, so the normalisation only merges pairs that are converted to the same tokens and a hit returns the same prediction as the model
+    """
+
+    def __init__(self, model_version, max_size=10000, ttl_seconds=3600, clock=time.monotonic):
+        """
+        :param model_version: Identifies the model weights and backend, so that a reloaded or different model does not return stale predictions
+        """
+        super().__init__(max_size, ttl_seconds=ttl_seconds, clock=clock)
+        self.model_version = model_version
+
+    def key(self, premise, hypothesis):
+        return self.model_version, self.normalise(premise), self.normalise(hypothesis)
+
+    @staticmethod
+    def normalise(text):
+        return " ".join(text.split())
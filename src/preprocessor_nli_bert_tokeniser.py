@@ -1,19 +1,31 @@
 import torch
 
+from dynamic_padding_collator import DynamicPaddingCollator
+
 
 class PreprocessorNliBertTokeniser:
     """
     Text to an array of indices using the BERT tokeniser
     """
 
-    def __init__(self, max_feature_len, tokeniser):
+    def __init__(self, max_feature_len, tokeniser, pad_to_max=True):
+        """
+        :param max_feature_len: The max number of tokens, longer sequences are truncated
+        :param tokeniser: The BERT tokeniser
+        :param pad_to_max: If True, pads every sequence to max_feature_len. Else returns unpadded sequences so that the batch can be padded to its longest sequence, see DynamicPaddingCollator
+        """
         self.max_feature_len = max_feature_len
         self.tokeniser = tokeniser
+        self.pad_to_max = pad_to_max
 
     @staticmethod
     def pad_token():
         return "[PAD]"
 
+    @property
+    def pad_index(self):
+        return self.tokeniser.convert_tokens_to_ids([self.pad_token()])[0]
+
     @staticmethod
     def eos_token():
         return "<EOS>"
@@ -23,13 +35,50 @@ class PreprocessorNliBertTokeniser:
         return "[UNK]"
 
     def __call__(self, item):
+        """
+        Converts a (premise, hypothesis) pair to tensors
+        :return: a tuple of tensors (input_ids, attention_mask, token_type_ids)
+        """
         prem, hyp = item[0], item[1]
         prem, hyp = self.tokenise(prem, hyp)
-        item = self.sequence_pad(prem, hyp)
-        item = self.token_to_index(item)
-        item = self.to_tensor(item)
+        tokens = self.sequence_pad(prem, hyp)
+        input_ids = self.to_tensor(self.token_to_index(tokens))
+        attention_mask = self.to_tensor(self.attention_mask(tokens))
+        token_type_ids = self.to_tensor(self.segment_index(tokens))
 
-        return item
+        return input_ids, attention_mask, token_type_ids
+
+    def encode(self, item):
+        """
+        Converts a (premise, hypothesis) pair to token indices and the corresponding segment indices, without creating tensors.
+        Used to pre-compute the token cache
+        :return: a tuple (token indices, segment indices)
+        """
+        prem, hyp = self.tokenise(item[0], item[1])
+        tokens = self.sequence_pad(prem, hyp)
+        return self.token_to_index(tokens), self.segment_index(tokens)
+
+    def encode_batch(self, items):
+        """
+        Converts a list of (premise, hypothesis) pairs to token indices and segment indices, see encode
+        :return: a list of tuples (token indices, segment indices)
+        """
+        return [self.encode(item) for item in items]
+
+    def encode_texts(self, texts):
+        """
+        Converts each text to token indices, without the special tokens, padding or truncation.
+        Used to tokenise each distinct sentence once, see NliDedupTokenCache
+        :return: a list of lists of token indices
+        """
+        return [self.token_to_index(self.tokeniser.tokenize(t)) for t in texts]
+
+    def batch(self, items):
+        """
+        Converts a list of (premise, hypothesis) pairs to stacked tensors, padded to the longest item
+        :return: a tuple of long tensors (input_ids, attention_mask, token_type_ids), each of shape [len(items), sequence len]
+        """
+        return DynamicPaddingCollator.pad_structured([self(item) for item in items], self.pad_index)
 
     def tokenise(self, prem, hyp):
         """
@@ -55,11 +104,29 @@ class PreprocessorNliBertTokeniser:
         prem = prem[:self.max_feature_len // 2 - 2]
         hyp = hyp[:self.max_feature_len // 2 - 1]
         token_len = len(prem) + len(hyp)
-        pad_tokens = [self.pad_token()] * (self.max_feature_len - 3 - token_len)
+        pad_tokens = []
+        # Preprocessors pickled before pad_to_max was added, e.g. in older model dirs, always pad to the max
+        if getattr(self, "pad_to_max", True):
+            pad_tokens = [self.pad_token()] * (self.max_feature_len - 3 - token_len)
         result = ['[CLS]'] + prem + ['[SEP]'] + hyp + pad_tokens + ['[SEP]']
 
         return result
 
+    def segment_index(self, tokens):
+        """
+        Returns the segment (token type) index for each token, 0 for the [CLS] premise [SEP] and 1 for the rest
+        e.g. ["[CLS]", "The", "[SEP]", "dog", "[SEP]"] would return [0, 0, 0, 1, 1]
+        """
+        premise_end = tokens.index('[SEP]') + 1
+        return [0] * premise_end + [1] * (len(tokens) - premise_end)
+
+    def attention_mask(self, tokens):
+        """
+        Returns 0 for the pad tokens and 1 for the rest
+        e.g. ["[CLS]", "The", "[SEP]", "[PAD]", "[SEP]"] would return [1, 1, 1, 0, 1]
+        """
+        return [0 if t == self.pad_token() else 1 for t in tokens]
+
     def to_tensor(self, item):
         """
         Converts list of int to tensor
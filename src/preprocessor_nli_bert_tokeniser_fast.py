@@ -0,0 +1,66 @@
+from preprocessor_nli_bert_tokeniser import PreprocessorNliBertTokeniser
+
+
+class PreprocessorNliBertTokeniserFast(PreprocessorNliBertTokeniser):
+    """
+    Batch oriented version of PreprocessorNliBertTokeniser, using the Rust backed BertTokenizerFast to tokenise a list of (premise, hypothesis) pairs in a single call.
+    Produces the same truncation and padding layout as PreprocessorNliBertTokeniser, [CLS] premise [SEP] hypothesis [PAD].. [SEP]
+    """
+
+    def __call__(self, item):
+        input_ids, attention_mask, token_type_ids = self._encode_batch([item])[0]
+        return self.to_tensor(input_ids), self.to_tensor(attention_mask), self.to_tensor(token_type_ids)
+
+    @property
+    def pad_index(self):
+        return self.tokeniser.pad_token_id
+
+    def encode(self, item):
+        return self.encode_batch([item])[0]
+
+    def encode_batch(self, items):
+        return [(input_ids, token_type_ids) for input_ids, _, token_type_ids in self._encode_batch(items)]
+
+    def encode_texts(self, texts):
+        return self.tokeniser(list(texts), add_special_tokens=False, return_attention_mask=False,
+                              return_token_type_ids=False)["input_ids"]
+
+    def batch(self, items):
+        encoded = self._encode_batch(items)
+        max_len = max(len(input_ids) for input_ids, _, _ in encoded)
+
+        input_ids, attention_mask, token_type_ids = [], [], []
+        for ids, mask, token_types in encoded:
+            num_pad = max_len - len(ids)
+            input_ids.append(ids + [self.pad_index] * num_pad)
+            attention_mask.append(mask + [0] * num_pad)
+            token_type_ids.append(token_types + [0] * num_pad)
+
+        return self.to_tensor(input_ids), self.to_tensor(attention_mask), self.to_tensor(token_type_ids)
+
+    def _encode_batch(self, items):
+        """
+        Tokenises all the premises and hypothesis in a single call, and formats each pair according to sequence_pad
+        :return: a list of tuples of lists (input_ids, attention_mask, token_type_ids)
+        """
+        premises = [prem for prem, _ in items]
+        hypotheses = [hyp for _, hyp in items]
+        tokenised = self.tokeniser(premises + hypotheses, add_special_tokens=False, return_attention_mask=False,
+                                   return_token_type_ids=False)["input_ids"]
+
+        cls_index, sep_index, pad_index = self.tokeniser.cls_token_id, self.tokeniser.sep_token_id, self.pad_index
+        result = []
+        for prem, hyp in zip(tokenised[:len(items)], tokenised[len(items):]):
+            prem = prem[:self.max_feature_len // 2 - 2]
+            hyp = hyp[:self.max_feature_len // 2 - 1]
+            num_pad = 0
+            # Preprocessors pickled before pad_to_max was added always pad to the max
+            if getattr(self, "pad_to_max", True):
+                num_pad = self.max_feature_len - 3 - len(prem) - len(hyp)
+
+            input_ids = [cls_index] + prem + [sep_index] + hyp + [pad_index] * num_pad + [sep_index]
+            attention_mask = [1] * (len(prem) + len(hyp) + 2) + [0] * num_pad + [1]
+            token_type_ids = [0] * (len(prem) + 2) + [1] * (len(hyp) + num_pad + 1)
+            result.append((input_ids, attention_mask, token_type_ids))
+
+        return result
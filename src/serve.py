@@ -1,27 +1,73 @@
+import collections
 import glob
+import inspect
 import json
+import logging
 import os
 import pickle
+import time
+import weakref
 
 import torch
 
+from memoized_tokeniser import MemoizedTokeniser
+from model_artifacts import ModelArtifacts
+from prediction_cache import LruCache, PredictionCache
+
 """
 This is the sagemaker inference entry script
 """
 CSV_CONTENT_TYPE = 'text/csv'
 JSON_CONTENT_TYPE = 'text/json'
 
+# The environment variable to select the inference backend, see ModelArtifacts.backends
+BACKEND_ENV = 'SERVE_BACKEND'
+
+# The environment variable to set the max number of records per forward pass, larger requests are split
+PREDICT_BATCH_SIZE_ENV = 'SERVE_PREDICT_BATCH_SIZE'
+DEFAULT_PREDICT_BATCH_SIZE = 64
+
+# The environment variables to bound the prediction cache, set the size to 0 to disable the cache
+CACHE_SIZE_ENV = 'SERVE_CACHE_SIZE'
+CACHE_TTL_ENV = 'SERVE_CACHE_TTL_SECONDS'
+DEFAULT_CACHE_SIZE = 10000
+DEFAULT_CACHE_TTL_SECONDS = 3600
+
+# The environment variable to set the max number of premises and hypotheses whose tokens are memoized, 0 to disable
+TOKEN_CACHE_SIZE_ENV = 'SERVE_TOKEN_CACHE_SIZE'
+DEFAULT_TOKEN_CACHE_SIZE = 100000
+
+# The prediction cache of each model loaded using load_model
+_prediction_caches = weakref.WeakKeyDictionary()
+
 
 def model_fn(model_dir):
-    # Load model
+    return load_model(model_dir, backend=os.environ.get(BACKEND_ENV, "eager"))
+
+
+def load_model(model_dir, backend="eager"):
+    """
+    Loads the model artifacts
+    :param backend: One of ModelArtifacts.backends, e.g. eager, int8, torchscript or onnx
+    :return: a tuple (preprocessor, model, label mapper)
+    """
+    # The quantized and onnx models only run on cpu
+    device = "cpu" if backend in ("int8", "onnx") else get_device()
+    if ModelArtifacts.exists(model_dir):
+        model_artifacts = ModelArtifacts.load(model_dir, device=device, backend=backend)
+        return _add_caches(model_artifacts, os.path.join(model_dir, ModelArtifacts.weights_file), backend)
+
+    # Model dir written by an earlier version, containing the pickled model, preprocessor and label mapper
+    start = time.perf_counter()
     model_files = list(glob.glob("{}/*.pt".format(model_dir)))
     error_msg = "Expected exactly 1 model file (match pattern *.pt)in dir {}, but instead found {} files. Found.. {}".format(
         model_dir, len(model_files), ",".join(model_files))
     assert len(model_files) == 1, error_msg
 
     model_file = model_files[0]
-    device = get_device()
-    model = torch.load(model_file, map_location=torch.device(device))
+    # The whole model is pickled, so needs to be unpickled in full in newer versions of torch
+    load_kwargs = {"weights_only": False} if "weights_only" in inspect.signature(torch.load).parameters else {}
+    model = torch.load(model_file, map_location=torch.device(device), **load_kwargs)
 
     # Load label mapper
     label_mapper_pickle_file = os.path.join(model_dir, "label_mapper.pkl")
@@ -33,7 +79,48 @@ def model_fn(model_dir):
     with open(preprocessor_pickle_file, "rb") as f:
         preprocessor_mapper = pickle.load(f)
 
-    return preprocessor_mapper, model, label_mapper
+    if backend == "int8":
+        model = ModelArtifacts.quantize_int8(model)
+    else:
+        assert backend == "eager", "Backend {} is only supported for the model artifacts, see ModelArtifacts".format(
+            backend)
+
+    logging.getLogger(__name__).info("Loaded pickled model artifacts in {:.3f}s".format(time.perf_counter() - start))
+    return _add_caches((preprocessor_mapper, model, label_mapper), model_file, backend)
+
+
+def _add_caches(model_artifacts, weights_file, backend):
+    """
+    Memoizes the tokens of the preprocessor, and creates the prediction cache for the model, as configured by the environment variables
+    :param weights_file: The file containing the model weights, whose size and modified time identify the model version
+    """
+    preprocessor, model, label_mapper = model_artifacts
+
+    token_cache_size = int(os.environ.get(TOKEN_CACHE_SIZE_ENV, DEFAULT_TOKEN_CACHE_SIZE))
+    if token_cache_size > 0:
+        preprocessor.tokeniser = MemoizedTokeniser(preprocessor.tokeniser, LruCache(token_cache_size))
+
+    cache_size = int(os.environ.get(CACHE_SIZE_ENV, DEFAULT_CACHE_SIZE))
+    if cache_size > 0:
+        stat = os.stat(weights_file)
+        model_version = "{}:{}:{}:{}".format(os.path.basename(weights_file), stat.st_size, stat.st_mtime_ns, backend)
+        ttl_seconds = float(os.environ.get(CACHE_TTL_ENV, DEFAULT_CACHE_TTL_SECONDS)) or None
+        _prediction_caches[model] = PredictionCache(model_version, max_size=cache_size, ttl_seconds=ttl_seconds)
+
+    return model_artifacts
+
+
+def cache_stats(model_artifacts):
+    """
+    :return: a dict containing the hit and miss counters of the prediction cache and the token cache, None when the cache is disabled
+    """
+    preprocessor, model, _ = model_artifacts
+    prediction_cache = _prediction_caches.get(model)
+    tokeniser = preprocessor.tokeniser
+    return {
+        "prediction_cache": prediction_cache.stats() if prediction_cache is not None else None,
+        "token_cache": tokeniser.cache.stats() if isinstance(tokeniser, MemoizedTokeniser) else None
+    }
 
 
 def get_device():
@@ -41,6 +128,15 @@ def get_device():
     return device
 
 
+def _model_device(model):
+    # Models that are not torch modules, e.g. the onnx runtime model, declare their device
+    if hasattr(model, "device"):
+        return model.device
+    for p in model.parameters():
+        return p.device
+    return get_device()
+
+
 def input_fn(input, content_type):
     if content_type == JSON_CONTENT_TYPE:
         records = json.loads(input)
@@ -51,35 +147,76 @@ def input_fn(input, content_type):
 
 
 def preprocess(input, preprocessor):
-    result = [preprocessor((row["premise"], row["hypothesis"])).unsqueeze(dim=0) for row in input]
-    result = torch.cat(result)
-    return result
+    # Tokenises the records in one call, padded to the longest sequence
+    input_ids, attention_mask, token_type_ids = preprocessor.batch(
+        [(row["premise"], row["hypothesis"]) for row in input])
+    return input_ids, attention_mask, token_type_ids
 
 
-def predict_fn(input, model_artifacts):
-    preprocessor, model, label_mapper = model_artifacts
+def approximate_length(row):
+    # Approximates the number of tokens by the number of words, so that the records need not be tokenised upfront
+    return len(row["premise"].split()) + len(row["hypothesis"].split())
 
-    # Pre-process
-    input_tensor = preprocess(input, preprocessor)
 
-    # Copy input to gpu if available
-    device = get_device()
-    input_tensor = input_tensor.to(device=device)
+def predict_tensors(input_tensor, model, label_mapper):
+    """
+    Runs the model on a pre-processed batch
+    :param input_tensor: a tuple of tensors (input_ids, attention_mask, token_type_ids), see preprocess
+    :return: a list of (label, confidence) tuples, the class with the highest prob and the corresponding prob
+    """
+    # Copy input to the device of the model, the quantized models run on cpu even when a gpu is available
+    device = _model_device(model)
+    input_tensor = [t.to(device=device) for t in input_tensor]
 
-    # Invoke
     model.eval()
     with torch.no_grad():
-        output_tensor = model(input_tensor)[0]
+        output_tensor = model(*input_tensor)[0]
         # Convert to probabilities
-        softmax = torch.nn.Softmax()
-        output_tensor = softmax(output_tensor)
+        output_tensor = torch.softmax(output_tensor, dim=1)
 
-    # Return the class with the highest prob and the corresponding prob
     prob, class_indices = torch.max(output_tensor, dim=1)
-    classes = [label_mapper.reverse_map(i.item()) for i in class_indices]
-    result = []
-    for c, p in zip(classes, prob):
-        result.append({"label": c, "confidence": p.item()})
+    return [(label_mapper.reverse_map(c), p) for c, p in zip(class_indices.tolist(), prob.tolist())]
+
+
+def predict_fn(input, model_artifacts, batch_size=None):
+    """
+    Predicts the records in micro batches, so that the memory stays bounded regardless of the size of the request.
+    The records are sorted by length. For artifacts trained with --dynamicpadding 1, each micro batch is then padded only to the longest record in it; the default artifacts pad every record to the max sequence length.
+    When the model was loaded using load_model, cached predictions are returned without tokenising or running the model, and only the misses are predicted
+    :param batch_size: The max number of records per forward pass, defaults to the SERVE_PREDICT_BATCH_SIZE environment variable
+    :return: a list of {"label", "confidence"} in the same order as the input records
+    """
+    preprocessor, model, label_mapper = model_artifacts
+    batch_size = batch_size or int(os.environ.get(PREDICT_BATCH_SIZE_ENV, DEFAULT_PREDICT_BATCH_SIZE))
+
+    # Look up the cache, the records with the same key are predicted once
+    cache = _prediction_caches.get(model)
+    result = [None] * len(input)
+    keys = []
+    misses = collections.OrderedDict()
+    for i, row in enumerate(input):
+        key = cache.key(row["premise"], row["hypothesis"]) if cache is not None else i
+        cached = cache.get(key) if cache is not None else None
+        if cached is None:
+            misses.setdefault(key, []).append(i)
+        else:
+            result[i] = {"label": cached[0], "confidence": cached[1]}
+        keys.append(key)
+
+    order = sorted(misses.values(), key=lambda indices: approximate_length(input[indices[0]]))
+
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+
+        # Pre-process
+        input_tensor = preprocess([input[indices[0]] for indices in batch], preprocessor)
+
+        # Invoke, and return the predictions in the order of the input
+        for indices, (label, p) in zip(batch, predict_tensors(input_tensor, model, label_mapper)):
+            if cache is not None:
+                cache.put(keys[indices[0]], (label, p))
+            for i in indices:
+                result[i] = {"label": label, "confidence": p}
 
     return result
 
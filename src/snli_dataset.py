@@ -1,8 +1,10 @@
-import json
 import logging
 
 from torch.utils.data import Dataset
 
+from nli_columnar_records import NliColumnarRecords
+from nli_source_registry import get_source
+from nli_token_cache import NliTokenCache
 from snli_dataset_label_mapper import SnliLabelMapper
 
 
@@ -15,40 +17,78 @@ class SnliDataset(Dataset):
     def _logger(self):
         return logging.getLogger(__name__)
 
-    def __init__(self, json_file: str, preprocessor=None):
+    def __init__(self, json_file: str, preprocessor=None, token_cache_dir=None):
+        """
+        :param json_file: The SNLI jsonl file
+        :param preprocessor: The preprocessor to apply to the (premise, hypothesis)
+        :param token_cache_dir: Optional directory to cache the preprocessed tokens in. When set, the preprocessor only runs once per file and the items are read from the memory mapped cache
+        """
         self.preprocessor = preprocessor
         self._file = json_file
         self._label_mapper = SnliLabelMapper()
-        self._items = []
-        with open(json_file) as f:
-            for i, l in enumerate(f):
-                data = json.loads(l)
-                item = {"premise": data["sentence1"],
-                        "hypothesis": data["sentence2"],
-                        "label": data["gold_label"]
-                        }
+        self._items = NliColumnarRecords()
+        self._token_cache = None
 
-                if item["label"] == "-":
-                    self._logger.info(f"Missing label in idx {i}.. hence skipping")
-                    continue
-                elif item["label"] not in self._label_mapper.raw_labels:
-                    raise IndexError(
-                        "Loading Index {}: Label {} unexpected for premise {}".format(i, item["label"], item["premise"]))
+        if token_cache_dir is not None and preprocessor is not None:
+            self._token_cache = NliTokenCache(token_cache_dir, json_file, preprocessor)
+            self._pad_index = preprocessor.pad_index
+            if self._token_cache.exists():
+                self._logger.info("Using token cache {}".format(self._token_cache.path))
+            else:
+                self._load_items()
+                self._token_cache.build(self._raw_items())
+                # No longer required, as the items are read from the cache
+                self._items = NliColumnarRecords()
+        else:
+            self._load_items()
 
+        self._logger.info("Loaded {} records from the dataset".format(len(self)))
 
-                self._items.append(item)
+    def _load_items(self):
+        with open(self._file) as f:
+            for premise, hypothesis, label in self.parse_lines(f, self._label_mapper):
+                self._items.append(premise, hypothesis, label)
 
-        self._logger.info("Loaded {} records from the dataset".format(len(self)))
+    @staticmethod
+    def parse_lines(lines, label_mapper, start_index=0):
+        """
+        Parses SNLI json lines, skipping the lines without a gold label
+        :param lines: An iterable of json lines
+        :param label_mapper: The label mapper to map the gold label to a zero indexed label
+        :param start_index: The index of the first line, used in log messages
+        :return: A generator of (premise, hypothesis, zero indexed label)
+        """
+        return get_source("snli").parse_lines(lines, label_mapper, start_index=start_index)
+
+    def _raw_items(self):
+        for premise, hypothesis, y in self._raw_records():
+            yield (premise, hypothesis), y
+
+    def _raw_records(self):
+        return (self._items[i] for i in range(len(self._items)))
 
     def __len__(self):
+        if self._token_cache is not None:
+            return len(self._token_cache)
         return len(self._items)
 
+    @property
+    def lengths(self):
+        """
+        The length of each item, used to group items of similar length into the same batch.
+        This is the exact number of tokens when read from the token cache, else approximated by the number of words so that the items need not be tokenised upfront
+        """
+        if self._token_cache is not None:
+            return self._token_cache.lengths.tolist()
+        return [len(premise.split()) + len(hypothesis.split()) for premise, hypothesis, _ in self._raw_records()]
+
     def __getitem__(self, idx):
-        row = self._items[idx]
-        x_prem, x_hype, y_raw = row["premise"], row["hypothesis"], row["label"]
+        if self._token_cache is not None:
+            input_ids, token_type_ids, y = self._token_cache[idx]
+            attention_mask = (input_ids != self._pad_index).long()
+            return (input_ids, attention_mask, token_type_ids.long()), y
 
-        # The original label is 1 indexed, this needs to be converted to zero index
-        y = self._label_mapper.map(y_raw)
+        x_prem, x_hype, y = self._items[idx]
 
         x = (x_prem, x_hype)
         if self.preprocessor:
@@ -0,0 +1,67 @@
+import logging
+import os
+
+import torch.distributed
+from torch.utils.data import IterableDataset, get_worker_info
+
+from snli_dataset import SnliDataset
+from snli_dataset_label_mapper import SnliLabelMapper
+
+
+class SnliIterableDataset(IterableDataset):
+    """
+    Streams the SNLI jsonl file without loading it into memory.
+    When used with multiple data loader workers or distributed processes, the file is split into equal byte ranges and each worker only reads and parses the lines that start within its range.
+    Note: The items are not shuffled, and so this is suitable for large files that do not fit in memory and for inference
+    """
+
+    @property
+    def _logger(self):
+        return logging.getLogger(__name__)
+
+    def __init__(self, json_file: str, preprocessor=None):
+        """
+        :param json_file: The SNLI jsonl file
+        :param preprocessor: The preprocessor to apply to the (premise, hypothesis)
+        """
+        self.preprocessor = preprocessor
+        self._file = json_file
+        self._label_mapper = SnliLabelMapper()
+
+        # Captured here, as the process group is not available in spawned data loader workers
+        self._rank, self._world_size = 0, 1
+        if torch.distributed.is_available() and torch.distributed.is_initialized():
+            self._rank, self._world_size = torch.distributed.get_rank(), torch.distributed.get_world_size()
+
+    def __iter__(self):
+        worker_info = get_worker_info()
+        worker_id, num_workers = (0, 1) if worker_info is None else (worker_info.id, worker_info.num_workers)
+        shard_id, num_shards = self._rank * num_workers + worker_id, self._world_size * num_workers
+
+        for x_prem, x_hype, y in SnliDataset.parse_lines(self._read_shard(shard_id, num_shards), self._label_mapper):
+            x = (x_prem, x_hype)
+            if self.preprocessor:
+                x = self.preprocessor(x)
+
+            yield x, y
+
+    def _read_shard(self, shard_id, num_shards):
+        """
+        Reads the lines that start within the byte range [start, end) of the shard
+        """
+        file_size = os.path.getsize(self._file)
+        start = file_size * shard_id // num_shards
+        end = file_size * (shard_id + 1) // num_shards
+
+        with open(self._file, "rb") as f:
+            # A line that starts before the start of the range belongs to the previous shard
+            if start > 0:
+                f.seek(start - 1)
+                f.readline()
+
+            while f.tell() < end:
+                line = f.readline()
+                if not line:
+                    break
+                if line.strip():
+                    yield line.decode("utf-8")
@@ -0,0 +1,171 @@
+import contextlib
+import json
+import logging
+import os
+import resource
+import time
+
+import torch
+
+
+class TrainingProfiler:
+    """
+    Records the time spent in each stage of a train step, data wait, host to device copy, forward, backward and optimiser step,
+    along with the samples / sec, non pad tokens / sec and the peak memory, as a json line per step in the metrics file.
+    At the end of each epoch, a summary line averaging the steps of the epoch is written.
+
+    On cuda the stages are timed by synchronising the device at the end of each stage, so the metrics file slows down training and is intended for diagnosing slow runs.
+    Optionally, traces a window of steps using torch.profiler, which can be viewed in tensorboard or chrome://tracing
+    """
+
+    stages = ["forward", "backward", "optimizer"]
+
+    def __init__(self, metrics_file=None, profile_steps=None, trace_dir=None, device="cpu"):
+        """
+        :param metrics_file: The jsonl file to write the per step metrics to. When None, the steps are not timed
+        :param profile_steps: Optionally, a tuple (start step, end step) of the steps to trace using torch.profiler, the end step is exclusive. The steps are 1-based, the same as the step of the metrics file
+        :param trace_dir: The directory to write the torch.profiler trace to, required when profile_steps is set
+        :param device: The training device
+        """
+        assert profile_steps is None or trace_dir is not None, "The trace dir is required to profile steps"
+        self.metrics_file = metrics_file
+        self.profile_steps = profile_steps
+        self.trace_dir = trace_dir
+        self.device = torch.device(device)
+        self._file = None
+        self._torch_profiler = None
+        self._stage_seconds = {}
+        self._epoch_records = []
+
+    @property
+    def _logger(self):
+        return logging.getLogger(__name__)
+
+    def start(self):
+        if self.metrics_file:
+            os.makedirs(os.path.dirname(os.path.abspath(self.metrics_file)), exist_ok=True)
+            self._file = open(self.metrics_file, "a")
+            self._logger.info("Writing per step training metrics to {}".format(self.metrics_file))
+
+        if self.profile_steps:
+            start, end = self.profile_steps
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if self.device.type == "cuda":
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            # The profiler schedule counts the steps from 0, and the train steps from 1
+            first = max(start - 1, 0)
+            # Warms up on the step before the window, as the first profiled step has a higher overhead
+            warmup = 1 if first > 0 else 0
+            self._torch_profiler = torch.profiler.profile(
+                activities=activities,
+                schedule=torch.profiler.schedule(wait=first - warmup, warmup=warmup, active=end - max(start, 1),
+                                                 repeat=1),
+                on_trace_ready=torch.profiler.tensorboard_trace_handler(self.trace_dir),
+                record_shapes=True, profile_memory=True)
+            self._torch_profiler.start()
+            self._logger.info("Tracing steps [{}, {}) to {}".format(start, end, self.trace_dir))
+
+        if self.device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats(self.device)
+
+    def close(self):
+        if self._torch_profiler is not None:
+            self._torch_profiler.stop()
+            self._torch_profiler = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def stage(self, name):
+        """
+        Times a stage of the current step
+        :param name: One of stages
+        """
+        if self._file is None:
+            return contextlib.nullcontext()
+        return self._time_stage(name)
+
+    @contextlib.contextmanager
+    def _time_stage(self, name):
+        start = time.perf_counter()
+        yield
+        self._synchronize()
+        self._stage_seconds[name] = self._stage_seconds.get(name, 0.0) + time.perf_counter() - start
+
+    def step(self, epoch, step, batch_x, batch_y, data_wait_seconds=0.0, copy_seconds=0.0):
+        """
+        Ends the step, writing its metrics
+        :param batch_x: Either a tensor of token indices or a tuple of tensors (input_ids, attention_mask, token_type_ids)
+        :param data_wait_seconds: The time blocked loading the batch of the step, including the copy to the device, see DevicePrefetcher last_wait_seconds
+        :param copy_seconds: The part of the data wait spent copying the batch to the device
+        """
+        if self._torch_profiler is not None:
+            self._torch_profiler.step()
+
+        if self._file is None:
+            return
+
+        stage_seconds, self._stage_seconds = self._stage_seconds, {}
+        # The attention mask excludes the pad tokens
+        tokens = int(batch_x[1].sum().item()) if isinstance(batch_x, (tuple, list)) else batch_x.numel()
+        step_seconds = data_wait_seconds + sum(stage_seconds.values())
+        record = {
+            "epoch": epoch,
+            "step": step,
+            "samples": len(batch_y),
+            "tokens": tokens,
+            "data_wait_ms": 1000 * (data_wait_seconds - copy_seconds),
+            "h2d_ms": 1000 * copy_seconds
+        }
+        for name in self.stages:
+            record["{}_ms".format(name)] = 1000 * stage_seconds.get(name, 0.0)
+        record.update({
+            "step_ms": 1000 * step_seconds,
+            "samples_per_sec": len(batch_y) / step_seconds if step_seconds else 0.0,
+            "tokens_per_sec": tokens / step_seconds if step_seconds else 0.0,
+            "peak_memory_mb": self._peak_memory_mb()
+        })
+        self._epoch_records.append(record)
+        self._write(record)
+
+    def epoch_end(self, epoch, trainable_params=None):
+        """
+        Writes the summary of the epoch, and logs the share of the step time spent in each stage
+        :param trainable_params: Optionally, the number of trainable parameters in the epoch, to compare the step time and memory as layers are frozen or unfrozen
+        """
+        records, self._epoch_records = self._epoch_records, []
+        if self._file is None or not records:
+            return
+
+        total_ms = sum(r["step_ms"] for r in records)
+        summary = {"epoch": epoch, "summary": True, "steps": len(records)}
+        for key in ["data_wait_ms", "h2d_ms"] + ["{}_ms".format(name) for name in self.stages] + ["step_ms"]:
+            summary["mean_" + key] = sum(r[key] for r in records) / len(records)
+        summary.update({
+            "samples_per_sec": 1000 * sum(r["samples"] for r in records) / total_ms if total_ms else 0.0,
+            "tokens_per_sec": 1000 * sum(r["tokens"] for r in records) / total_ms if total_ms else 0.0,
+            "peak_memory_mb": max(r["peak_memory_mb"] for r in records)
+        })
+        if trainable_params is not None:
+            summary["trainable_params"] = trainable_params
+        self._write(summary)
+
+        self._logger.info("Epoch {} step time {:.2f} ms: {}, {:.1f} samples / sec, {:.1f} tokens / sec".format(
+            epoch, summary["mean_step_ms"],
+            ", ".join("{} {:.1f}%".format(key[len("mean_"):-len("_ms")], 100 * summary[key] / summary["mean_step_ms"])
+                      for key in summary if key.startswith("mean_") and key != "mean_step_ms"),
+            summary["samples_per_sec"], summary["tokens_per_sec"]))
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def _synchronize(self):
+        if self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
+
+    def _peak_memory_mb(self):
+        if self.device.type == "cuda":
+            return torch.cuda.max_memory_allocated(self.device) / 1024 / 1024
+        # The peak resident memory of the process, in kilobytes on linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
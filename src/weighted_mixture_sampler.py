@@ -0,0 +1,66 @@
+import torch
+from torch.utils.data import Sampler
+
+
+class WeightedMixtureSampler(Sampler):
+    """
+    Samples the items of a dataset that concatenates several sources, e.g. NliMixtureDataset, drawing each source in proportion to its weight.
+    A weight is the number of passes over the source per epoch, e.g. 0.5 samples a random half of the source, 3 repeats the source 3 times. The items of an epoch are then shuffled.
+    When distributed, each replica gets every num_replicas th item of the same permutation, similar to DistributedSampler
+    """
+
+    def __init__(self, source_sizes, weights, num_replicas=None, rank=None, seed=0):
+        """
+        :param source_sizes: The number of items of each source, in the order of the dataset
+        :param weights: The weight of each source
+        :param num_replicas: The number of distributed processes, if set the permutation is seeded by the seed and the epoch so that all the replicas use the same permutation
+        :param rank: The rank of the current distributed process
+        :param seed: The seed used when distributed
+        """
+        assert len(source_sizes) == len(weights), "Expected a weight per source"
+        assert all(w >= 0 for w in weights), "The weights must not be negative"
+        self.source_sizes = list(source_sizes)
+        self.weights = list(weights)
+        self.num_replicas = num_replicas or 1
+        self.rank = rank or 0
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    @property
+    def num_samples(self):
+        """
+        The number of items of each source per epoch
+        """
+        return [int(round(w * s)) for s, w in zip(self.source_sizes, self.weights)]
+
+    def __iter__(self):
+        generator = torch.Generator()
+        if self.num_replicas > 1:
+            generator.manual_seed(self.seed + self.epoch)
+        else:
+            # Seed from the torch global random state similar to RandomSampler, so that the torch seed makes the order reproducible
+            generator.manual_seed(int(torch.empty((), dtype=torch.int64).random_().item()))
+
+        indices = []
+        offset = 0
+        for size, num_samples in zip(self.source_sizes, self.num_samples):
+            if size > 0:
+                # Whole passes over the source, and then a random subset for the fraction of a pass
+                repeats, remainder = divmod(num_samples, size)
+                for _ in range(repeats):
+                    indices.append(offset + torch.randperm(size, generator=generator))
+                indices.append(offset + torch.randperm(size, generator=generator)[:remainder])
+            offset += size
+
+        indices = torch.cat(indices) if indices else torch.zeros(0, dtype=torch.long)
+        indices = indices[torch.randperm(len(indices), generator=generator)]
+
+        # Drops the tail, so that every replica gets the same number of items
+        indices = indices[:len(self) * self.num_replicas]
+        return iter(indices[self.rank::self.num_replicas].tolist())
+
+    def __len__(self):
+        return sum(self.num_samples) // self.num_replicas
@@ -27,3 +27,151 @@ class TestBertModel(TestCase):
 
         # Assert
         self.assertEqual(expected_shape, actual.shape)
+
+    def test_forward_attention_mask(self):
+        """
+        Test case  pad positions that are masked out should not change the output
+        """
+        vocab_size = 10
+        num_classes = 3
+        config = transformers.BertConfig(vocab_size=vocab_size, hidden_size=10, num_hidden_layers=1,
+                                         num_attention_heads=1, num_labels=num_classes)
+        sut = BertModel(None, None, bert_config=config)
+        sut.eval()
+
+        input_ids = torch.tensor([[2, 5, 3, 6, 3]])
+        token_type_ids = torch.tensor([[0, 0, 0, 1, 1]])
+        padded_input_ids = torch.tensor([[2, 5, 3, 6, 3, 0, 0]])
+        padded_token_type_ids = torch.tensor([[0, 0, 0, 1, 1, 0, 0]])
+        attention_mask = torch.tensor([[1, 1, 1, 1, 1, 0, 0]])
+
+        expected = sut(input_ids, token_type_ids=token_type_ids)[0]
+
+        # Act
+        actual = sut(padded_input_ids, attention_mask, padded_token_type_ids)[0]
+
+        # Assert
+        self.assertTrue(torch.allclose(expected, actual, atol=1e-5))
+
+    def test_freeze_layers(self):
+        """
+        Test case  no graph should be recorded for the frozen layers, and only the layers above should get gradients
+        """
+        config = transformers.BertConfig(vocab_size=10, hidden_size=10, num_hidden_layers=3, num_attention_heads=1,
+                                         num_labels=3)
+        sut = BertModel(None, None, fine_tune=False, bert_config=config, freeze_layers=2)
+        layers = sut.model.base_model.encoder.layer
+        frozen_outputs = []
+        layers[1].register_forward_hook(lambda module, inputs, outputs: frozen_outputs.append(outputs[0]))
+
+        # Act
+        sut(torch.randint(low=0, high=9, size=(4, 6)))[0].sum().backward()
+
+        # Assert
+        self.assertFalse(frozen_outputs[0].requires_grad)
+        self.assertTrue(all(p.grad is None for p in sut.model.base_model.embeddings.parameters()))
+        self.assertTrue(all(p.grad is None for p in layers[1].parameters()))
+        self.assertTrue(all(p.grad is not None for p in layers[2].parameters()))
+
+    def test_forward_fine_tune(self):
+        """
+        Test case  with the base frozen, the forward should be the same as the full model and only train the classifier
+        """
+        config = transformers.BertConfig(vocab_size=10, hidden_size=10, num_hidden_layers=1, num_attention_heads=1,
+                                         num_labels=3)
+        sut = BertModel(None, None, fine_tune=True, bert_config=config)
+        sut.eval()
+        input_batch = torch.randint(low=0, high=9, size=(4, 6))
+        with torch.no_grad():
+            expected = sut(input_batch)[0]
+
+        # Act
+        actual = sut(input_batch)[0]
+
+        # Assert
+        self.assertTrue(torch.allclose(expected, actual, atol=1e-6))
+        self.assertTrue(actual.requires_grad)
+
+    def test_gradient_checkpointing(self):
+        """
+        Test case  gradient checkpointing should compute the same gradients, including with the embeddings frozen
+        """
+        config = transformers.BertConfig(vocab_size=10, hidden_size=10, num_hidden_layers=2, num_attention_heads=1,
+                                         num_labels=3, hidden_dropout_prob=0.0, attention_probs_dropout_prob=0.0)
+        expected_model = BertModel(None, None, fine_tune=False, bert_config=config, freeze_layers=0)
+        sut = BertModel(None, None, fine_tune=False, bert_config=config, freeze_layers=0, gradient_checkpointing=True)
+        sut.load_state_dict(expected_model.state_dict())
+        input_batch = torch.randint(low=0, high=9, size=(4, 6))
+        expected_model(input_batch)[0].sum().backward()
+
+        # Act
+        sut(input_batch)[0].sum().backward()
+
+        # Assert
+        for (name, expected), actual in zip(expected_model.named_parameters(), sut.parameters()):
+            if expected.grad is None:
+                self.assertIsNone(actual.grad, name)
+            else:
+                self.assertTrue(torch.allclose(expected.grad, actual.grad, atol=1e-5), name)
+
+    def test_gradient_checkpointing_freeze_layers(self):
+        """
+        Test case  gradient checkpointing with frozen layers should compute the same gradients, and only recompute the trainable layers
+        """
+        config = transformers.BertConfig(vocab_size=10, hidden_size=10, num_hidden_layers=3, num_attention_heads=1,
+                                         num_labels=3, hidden_dropout_prob=0.0, attention_probs_dropout_prob=0.0)
+        expected_model = BertModel(None, None, fine_tune=False, bert_config=config, freeze_layers=2)
+        sut = BertModel(None, None, fine_tune=False, bert_config=config, freeze_layers=2, gradient_checkpointing=True)
+        sut.load_state_dict(expected_model.state_dict())
+        layers = sut.model.base_model.encoder.layer
+        forward_calls = [0] * len(layers)
+        for i, layer in enumerate(layers):
+            layer.attention.register_forward_hook(lambda module, inputs, outputs, i=i: forward_calls.__setitem__(
+                i, forward_calls[i] + 1))
+        input_batch = torch.randint(low=0, high=9, size=(4, 6))
+        expected_model(input_batch)[0].sum().backward()
+
+        # Act
+        sut(input_batch)[0].sum().backward()
+
+        # Assert
+        self.assertEqual([1, 1, 2], forward_calls)
+        for (name, expected), actual in zip(expected_model.named_parameters(), sut.parameters()):
+            if expected.grad is None:
+                self.assertIsNone(actual.grad, name)
+            else:
+                self.assertTrue(torch.allclose(expected.grad, actual.grad, atol=1e-5), name)
+
+    def test_gradient_checkpointing_data_parallel_replica(self):
+        """
+        Test case  a data parallel replica of a checkpointed model should run its own layers, and back propagate to the weights
+        """
+        config = transformers.BertConfig(vocab_size=10, hidden_size=10, num_hidden_layers=2, num_attention_heads=1,
+                                         num_labels=3, hidden_dropout_prob=0.0, attention_probs_dropout_prob=0.0)
+        model = BertModel(None, None, fine_tune=False, bert_config=config, freeze_layers=0, gradient_checkpointing=True)
+        called = []
+        for layer in model.model.base_model.encoder.layer:
+            layer.attention.register_forward_hook(lambda module, inputs, outputs: called.append(module))
+        sut = _replicate(model)
+
+        # Act
+        sut(torch.randint(low=0, high=9, size=(4, 6)))[0].sum().backward()
+
+        # Assert
+        replica_layers = list(sut.model.base_model.encoder.layer)
+        self.assertTrue(len(called) > 0)
+        self.assertTrue(all(any(m is l.attention for l in replica_layers) for m in called))
+        self.assertTrue(all(p.grad is not None for p in model.model.base_model.encoder.parameters()))
+
+
+def _replicate(model):
+    """
+    Replicates the model on the same device, the way nn.DataParallel replicates it on each device
+    """
+    replicas = {m: m._replicate_for_data_parallel() for m in model.modules()}
+    for module, replica in replicas.items():
+        for name, child in module._modules.items():
+            replica._modules[name] = replicas[child] if child is not None else None
+        for name, param in module._parameters.items():
+            replica._parameters[name] = param * 1 if param is not None else None
+    return replicas[model]
@@ -1,11 +1,17 @@
 
+import json
+import os
 import tempfile
 from unittest import TestCase
 from unittest.mock import MagicMock
 
 import torch
+import transformers
 
+from bert_model import BertModel
 from bert_train import Train
+from gradual_unfreezer import GradualUnfreezer
+from optimiser_factory import WarmupLinearSchedule
 
 
 class TestBertTrain(TestCase):
@@ -49,8 +55,207 @@ class TestBertTrain(TestCase):
         # Assert
         self.assertIsNotNone(actual)
 
+    def test_run_train_accuracy(self):
+        """
+        Test case  the best result should contain the validation accuracy computed from the correct predictions
+        """
+        tmp_dir = tempfile.mkdtemp()
+        num_classes = 3
+        sut = Train(model_dir=tmp_dir, epochs=1, device="cpu", log_interval=1)
+
+        # Network predicts the class in the first column of the input
+        mock_network = MagicMock()
+        mock_network.side_effect = lambda x: (torch.nn.functional.one_hot(x[:, 0], num_classes).float(),)
+
+        mock_loss = MagicMock()
+        mock_loss.return_value = torch.tensor(0.0, requires_grad=True)
+
+        val = [(torch.tensor([[0, 4], [1, 4], [2, 4]]), torch.tensor([0, 1, 1])),
+               (torch.tensor([[2, 4]]), torch.tensor([2]))]
+
+        sut.snapshot = MagicMock()
+
+        # Act
+        actual_score, actual_actuals, actual_predicted = sut.run_train(val, val, loss_function=mock_loss,
+                                                                       model_network=mock_network,
+                                                                       optimizer=MagicMock(), pos_label=0)
+
+        # Assert
+        self.assertEqual(0.75, actual_score)
+        self.assertSequenceEqual([0, 1, 1, 2], actual_actuals)
+        self.assertSequenceEqual([0, 1, 2, 2], actual_predicted)
+
+    def test_run_train_bf16(self):
+        """
+        Test case  run train in bf16 mixed precision should update the weights and keep them in fp32
+        """
+        tmp_dir = tempfile.mkdtemp()
+
+        sut = Train(model_dir=tmp_dir, epochs=1, device="cpu", mixed_precision="bf16", accumulation_steps=2)
+        batch_size = 10
+        sequence_len = 20
+        vocab_size = 5
+        num_classes = 3
+
+        network = _EmbeddingClassifier(vocab_size, num_classes)
+        initial_weights = network.classifier.weight.detach().clone()
+        optimiser = torch.optim.SGD(network.parameters(), lr=0.1)
+
+        train = [self._generate_random_train_batch(batch_size, num_classes, sequence_len, vocab_size) for _ in
+                 range(4)]
+        val = [self._generate_random_train_batch(batch_size, num_classes, sequence_len, vocab_size) for _ in range(2)]
+
+        sut.snapshot = MagicMock()
+
+        # Act
+        sut.run_train(train, val, loss_function=torch.nn.CrossEntropyLoss(), model_network=network,
+                      optimizer=optimiser, pos_label=0)
+
+        # Assert
+        self.assertEqual(torch.float32, network.classifier.weight.dtype)
+        self.assertFalse(torch.equal(initial_weights, network.classifier.weight))
+
+    def test_run_train_metrics_file(self):
+        """
+        Test case  should write the stage timings of each step and an epoch summary to the metrics file, and trace the profile steps
+        """
+        tmp_dir = tempfile.mkdtemp()
+        metrics_file = os.path.join(tmp_dir, "metrics", "train_metrics.jsonl")
+        trace_dir = os.path.join(tmp_dir, "trace")
+        sut = Train(model_dir=tmp_dir, epochs=1, device="cpu", accumulation_steps=2, metrics_file=metrics_file,
+                    profile_steps=(1, 2), trace_dir=trace_dir)
+        network = _EmbeddingClassifier(5, 3)
+        train = [self._generate_random_train_batch(10, 3, 20, 5) for _ in range(4)]
+        sut.snapshot = MagicMock()
+
+        # Act
+        sut.run_train(train, train[:1], loss_function=torch.nn.CrossEntropyLoss(), model_network=network,
+                      optimizer=torch.optim.SGD(network.parameters(), lr=0.1), pos_label=0)
+
+        # Assert
+        with open(metrics_file) as f:
+            records = [json.loads(l) for l in f]
+        steps, summary = records[:-1], records[-1]
+        self.assertEqual([1, 2, 3, 4], [r["step"] for r in steps])
+        self.assertEqual([200] * 4, [r["tokens"] for r in steps])
+        self.assertTrue(all(r["forward_ms"] > 0 and r["backward_ms"] > 0 for r in steps))
+        # The optimiser only steps after the gradients are accumulated for 2 batches
+        self.assertEqual([False, True, False, True], [r["optimizer_ms"] > 0 for r in steps])
+        self.assertTrue(summary["summary"])
+        self.assertGreater(summary["tokens_per_sec"], 0)
+        self.assertTrue(len(os.listdir(trace_dir)) > 0)
+
+    def test_run_train_scheduler(self):
+        """
+        Test case  the learning rate schedule should be stepped once per optimiser step, not per batch
+        """
+        tmp_dir = tempfile.mkdtemp()
+        sut = Train(model_dir=tmp_dir, epochs=2, device="cpu", accumulation_steps=2)
+        network = _EmbeddingClassifier(5, 3)
+        optimiser = torch.optim.SGD(network.parameters(), lr=0.1)
+        scheduler = WarmupLinearSchedule(optimiser, warmup_steps=2, total_steps=6)
+        train = [self._generate_random_train_batch(10, 3, 20, 5) for _ in range(6)]
+        sut.snapshot = MagicMock()
+
+        # Act
+        sut.run_train(train, train[:1], loss_function=torch.nn.CrossEntropyLoss(), model_network=network,
+                      optimizer=optimiser, pos_label=0, scheduler=scheduler)
+
+        # Assert
+        self.assertEqual(6, scheduler.steps)
+        self.assertEqual([0.0], scheduler.get_last_lr())
+
+    def test_run_train_resume_from_checkpoint(self):
+        """
+        Test case  training interrupted within an epoch should resume from the checkpoint and end up with the same weights as uninterrupted training
+        """
+        vocab_size, num_classes = 5, 3
+        dataset = torch.utils.data.TensorDataset(torch.randint(high=vocab_size, size=(40, 6)),
+                                                 torch.randint(high=num_classes, size=(40,)))
+        data = torch.utils.data.DataLoader(dataset, batch_size=4, shuffle=True)
+
+        def train(checkpoint_dir, loss_function):
+            torch.manual_seed(1)
+            network = _EmbeddingClassifier(vocab_size, num_classes)
+            sut = Train(model_dir=tempfile.mkdtemp(), epochs=2, device="cpu", checkpoint_dir=checkpoint_dir,
+                        checkpoint_steps=3, checkpoint_keep=2)
+            sut.snapshot = MagicMock()
+            sut.run_train(data, data, loss_function=loss_function, model_network=network,
+                          optimizer=torch.optim.Adam(network.parameters(), lr=0.1), pos_label=0)
+            return network
+
+        expected = train(None, torch.nn.CrossEntropyLoss())
+
+        # Simulate a preemption in the second epoch
+        checkpoint_dir = tempfile.mkdtemp()
+        calls = {"train": 0}
+
+        def interrupted_loss(predicted, y):
+            if predicted.requires_grad:
+                calls["train"] += 1
+                if calls["train"] > 14:
+                    raise KeyboardInterrupt()
+            return torch.nn.functional.cross_entropy(predicted, y)
+
+        with self.assertRaises(KeyboardInterrupt):
+            train(checkpoint_dir, interrupted_loss)
+
+        # Act
+        actual = train(checkpoint_dir, torch.nn.CrossEntropyLoss())
+
+        # Assert
+        self.assertEqual(2, len(os.listdir(checkpoint_dir)))
+        for expected_param, actual_param in zip(expected.parameters(), actual.parameters()):
+            self.assertTrue(torch.allclose(expected_param, actual_param))
+
+    def test_run_train_resume_with_unfreezer(self):
+        """
+        Test case  resuming from an epoch end checkpoint with a gradual unfreezer should restore the optimiser param groups and end up with the same weights as uninterrupted training
+        """
+        vocab_size, num_classes = 10, 3
+        dataset = torch.utils.data.TensorDataset(torch.randint(high=vocab_size, size=(16, 6)),
+                                                 torch.randint(high=num_classes, size=(16,)))
+        data = torch.utils.data.DataLoader(dataset, batch_size=4, shuffle=True)
+        config = transformers.BertConfig(vocab_size=vocab_size, hidden_size=8, num_hidden_layers=2,
+                                         num_attention_heads=1, intermediate_size=8, num_labels=num_classes)
+
+        def train(checkpoint_dir, epochs):
+            torch.manual_seed(1)
+            network = BertModel(None, None, fine_tune=False, bert_config=config, freeze_layers=2)
+            optimizer = torch.optim.Adam([p for p in network.parameters() if p.requires_grad], lr=0.01)
+            sut = Train(model_dir=tempfile.mkdtemp(), epochs=epochs, device="cpu", checkpoint_dir=checkpoint_dir,
+                        on_epoch_start=GradualUnfreezer(freeze_layers=2, unfreeze_every=1))
+            sut.snapshot = MagicMock()
+            sut.run_train(data, data, loss_function=torch.nn.CrossEntropyLoss(), model_network=network,
+                          optimizer=optimizer, pos_label=0)
+            return network, optimizer
+
+        expected, _ = train(None, 3)
+
+        checkpoint_dir = tempfile.mkdtemp()
+        train(checkpoint_dir, 1)
+
+        # Act
+        actual, actual_optimizer = train(checkpoint_dir, 3)
+
+        # Assert
+        self.assertEqual(3, len(actual_optimizer.param_groups))
+        for expected_param, actual_param in zip(expected.parameters(), actual.parameters()):
+            self.assertTrue(torch.allclose(expected_param, actual_param, atol=1e-6))
+
     def _generate_random_train_batch(self, batch_size, num_classes, sequence_len, vocab_size):
         x = torch.randint(high=vocab_size, size=(batch_size, sequence_len))
         y = torch.randint(high=num_classes, size=(batch_size,))
 
         return x, y
+
+
+class _EmbeddingClassifier(torch.nn.Module):
+
+    def __init__(self, vocab_size, num_classes):
+        super().__init__()
+        self.embedding = torch.nn.EmbeddingBag(vocab_size, 8)
+        self.classifier = torch.nn.Linear(8, num_classes)
+
+    def forward(self, x):
+        return self.classifier(self.embedding(x)),
@@ -0,0 +1,60 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import torch
+import torch.distributed
+import torch.multiprocessing
+
+from bert_train import Train
+
+
+def _run_train(rank, world_size, init_file, model_dir, results):
+    torch.distributed.init_process_group("gloo", init_method="file://{}".format(init_file), rank=rank,
+                                         world_size=world_size)
+    torch.manual_seed(rank)
+
+    network = torch.nn.Sequential(torch.nn.Linear(4, 3))
+    optimiser = torch.optim.SGD(network.parameters(), lr=0.1)
+
+    # Uneven number of batches across the ranks
+    train = [(torch.rand(5, 4), torch.randint(high=3, size=(5,))) for _ in range(3 + rank)]
+    val = [(torch.rand(5, 4), torch.randint(high=3, size=(5,))) for _ in range(2)]
+
+    sut = Train(model_dir=model_dir, epochs=2, device="cpu")
+    sut.run_train(train, val, loss_function=torch.nn.CrossEntropyLoss(),
+                  model_network=_TupleOutput(network), optimizer=optimiser, pos_label=0)
+
+    results[rank] = network[0].weight.detach().clone()
+    torch.distributed.destroy_process_group()
+
+
+class _TupleOutput(torch.nn.Module):
+
+    def __init__(self, network):
+        super().__init__()
+        self.network = network
+
+    def forward(self, x):
+        return self.network(x),
+
+
+class TestBertTrainDistributed(TestCase):
+
+    def test_run_train(self):
+        """
+        Test case  distributed training should keep the weights in sync across the processes, and only the main process should snapshot
+        """
+        world_size = 2
+        tmp_dir = tempfile.mkdtemp()
+        init_file = os.path.join(tmp_dir, "dist_init")
+        model_dir = os.path.join(tmp_dir, "model")
+        os.makedirs(model_dir)
+        results = torch.multiprocessing.Manager().dict()
+
+        # Act
+        torch.multiprocessing.spawn(_run_train, args=(world_size, init_file, model_dir, results), nprocs=world_size)
+
+        # Assert
+        self.assertTrue(torch.allclose(results[0], results[1]))
+        self.assertEqual(1, len(os.listdir(model_dir)))
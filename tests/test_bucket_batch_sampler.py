@@ -0,0 +1,67 @@
+from unittest import TestCase
+
+from bucket_batch_sampler import BucketBatchSampler
+
+
+class TestBucketBatchSampler(TestCase):
+
+    def test___iter__shuffle(self):
+        """
+        Test case  every item is sampled exactly once, and batches contain items of similar length
+        """
+        lengths = [i % 10 for i in range(100)]
+        sut = BucketBatchSampler(lengths, batch_size=10, shuffle=True, bucket_size_multiplier=10)
+
+        # Act
+        actual = list(iter(sut))
+
+        # Assert
+        self.assertEqual(len(sut), len(actual))
+        self.assertSequenceEqual(list(range(100)), sorted(i for b in actual for i in b))
+        for b in actual:
+            self.assertEqual(1, len(set(lengths[i] for i in b)))
+
+    def test___iter__no_shuffle(self):
+        """
+        Test case  without shuffle, items are sorted by length
+        """
+        lengths = [5, 1, 4, 2, 3]
+        sut = BucketBatchSampler(lengths, batch_size=2, shuffle=False)
+        expected = [[1, 3], [4, 2], [0]]
+
+        # Act
+        actual = list(iter(sut))
+
+        # Assert
+        self.assertSequenceEqual(expected, actual)
+        self.assertEqual(len(expected), len(sut))
+
+    def test___len__partial_buckets(self):
+        """
+        Test case  length accounts for the partial batch at the end of each bucket
+        """
+        lengths = list(range(25))
+        sut = BucketBatchSampler(lengths, batch_size=4, shuffle=True, bucket_size_multiplier=2)
+
+        # Act
+        actual = len(list(iter(sut)))
+
+        # Assert
+        self.assertEqual(len(sut), actual)
+
+    def test___iter__distributed(self):
+        """
+        Test case  replicas should get disjoint batches that together cover every item
+        """
+        lengths = [i % 7 for i in range(50)]
+        num_replicas = 3
+        suts = [BucketBatchSampler(lengths, batch_size=4, shuffle=True, bucket_size_multiplier=3,
+                                   num_replicas=num_replicas, rank=r) for r in range(num_replicas)]
+
+        # Act
+        actual = [list(iter(sut)) for sut in suts]
+
+        # Assert
+        self.assertSequenceEqual(list(range(50)), sorted(i for r in actual for b in r for i in b))
+        for sut, batches in zip(suts, actual):
+            self.assertEqual(len(sut), len(batches))
@@ -0,0 +1,68 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import torch
+import torch.distributed
+import torch.multiprocessing
+import transformers
+from transformers import BertTokenizer
+
+from builder_nli import BuilderNli
+from nli_feature_cache import NliFeatureCache
+
+
+def _run_feature_cache(rank, world_size, init_file, input_file, vocab_file, cache_dir, results):
+    torch.distributed.init_process_group("gloo", init_method="file://{}".format(init_file), rank=rank,
+                                         world_size=world_size)
+    # The same encoder weights in each process, so that the processes use the same cache
+    torch.manual_seed(0)
+
+    builds = []
+    build = NliFeatureCache.build
+
+    def counting_build(self, *args, **kwargs):
+        builds.append(self.source_file)
+        return build(self, *args, **kwargs)
+
+    NliFeatureCache.build = counting_build
+
+    sut = BuilderNli(input_file, input_file, model_dir=tempfile.mkdtemp(), num_workers=0, batch_size=2,
+                     max_seq_len=20, fine_tune=True, feature_cache_dir=cache_dir)
+    sut.set_bert_config(transformers.BertConfig(vocab_size=11, hidden_size=10, num_hidden_layers=1,
+                                                num_attention_heads=1, num_labels=3))
+    sut.set_tokensior(BertTokenizer(vocab_file, do_lower_case=False))
+
+    train_dataloader, val_dataloader = sut.get_train_val_dataloader()
+
+    results[rank] = (len(builds), len(train_dataloader.dataset), len(val_dataloader.dataset))
+    torch.distributed.destroy_process_group()
+
+
+class TestBuilderNliDistributed(TestCase):
+
+    def test_feature_cache(self):
+        """
+        Test case  only the main process should build the feature cache, and the other processes should use it once built
+        """
+        world_size = 2
+        tmp_dir = tempfile.mkdtemp()
+        init_file = os.path.join(tmp_dir, "dist_init")
+        cache_dir = os.path.join(tmp_dir, "features")
+        input_file = os.path.join(os.path.dirname(__file__), "sample_data", "snli_train.jsonl")
+        vocab_file = os.path.join(tmp_dir, "vocab.txt")
+        with open(vocab_file, "w") as f:
+            f.write("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "A", "person", "on", "a", "horse", "is", "."]))
+        results = torch.multiprocessing.Manager().dict()
+
+        # Act
+        torch.multiprocessing.spawn(_run_feature_cache,
+                                    args=(world_size, init_file, input_file, vocab_file, cache_dir, results),
+                                    nprocs=world_size)
+
+        # Assert
+        # The train and val data are the same file, and so the same cache
+        self.assertEqual(1, results[0][0])
+        self.assertEqual(0, results[1][0])
+        self.assertEqual(results[0][1:], results[1][1:])
+        self.assertTrue(results[1][1] > 0)
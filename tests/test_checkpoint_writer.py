@@ -0,0 +1,77 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import torch
+
+from checkpoint_writer import CheckpointWriter
+
+
+class TestCheckpointWriter(TestCase):
+
+    def test_save(self):
+        """
+        Test case  the saved checkpoint should be a cpu copy of the state at the time of the save
+        """
+        checkpoint_dir = tempfile.mkdtemp()
+        weights = torch.ones(3)
+        sut = CheckpointWriter(checkpoint_dir)
+
+        # Act
+        checkpoint_path = sut.save({"weights": weights, "progress": {"epoch": 2, "scores": [0.5, 0.7]}}, step=10)
+        # The training loop updates the weights in place while the checkpoint is written
+        weights.add_(1)
+        sut.close()
+
+        # Assert
+        actual = torch.load(checkpoint_path)
+        self.assertTrue(torch.equal(torch.ones(3), actual["weights"]))
+        self.assertEqual({"epoch": 2, "scores": [0.5, 0.7]}, actual["progress"])
+
+    def test_keep_last(self):
+        """
+        Test case  only the last n checkpoints are retained, ordered by step
+        """
+        checkpoint_dir = tempfile.mkdtemp()
+        sut = CheckpointWriter(checkpoint_dir, keep_last=2)
+
+        # Act
+        for step in [1, 5, 20, 100]:
+            sut.save({"step": step}, step=step)
+        sut.close()
+
+        # Assert
+        self.assertSequenceEqual([os.path.join(checkpoint_dir, "checkpoint_0000000020.pt"),
+                                  os.path.join(checkpoint_dir, "checkpoint_0000000100.pt")],
+                                 CheckpointWriter.list_checkpoints(checkpoint_dir))
+        self.assertEqual(100, torch.load(CheckpointWriter.latest_checkpoint(checkpoint_dir))["step"])
+
+    def test_latest_checkpoint_ignores_partial_writes(self):
+        """
+        Test case  a temp file left by an interrupted write is not picked up as a checkpoint
+        """
+        checkpoint_dir = tempfile.mkdtemp()
+        sut = CheckpointWriter(checkpoint_dir, async_write=False)
+        sut.save({"step": 1}, step=1)
+        with open(os.path.join(checkpoint_dir, "checkpoint_0000000002.pt.tmp"), "wb") as f:
+            f.write(b"partial")
+
+        # Act
+        actual = CheckpointWriter.latest_checkpoint(checkpoint_dir)
+
+        # Assert
+        self.assertEqual(os.path.join(checkpoint_dir, "checkpoint_0000000001.pt"), actual)
+
+    def test_write_error_is_raised(self):
+        """
+        Test case  an error in the background write is raised in the training thread
+        """
+        checkpoint_dir = os.path.join(tempfile.mkdtemp(), "file")
+        # The checkpoint dir cannot be created, as a file exists with the same name
+        open(checkpoint_dir, "w").close()
+        sut = CheckpointWriter(checkpoint_dir)
+        sut.save({"step": 1}, step=1)
+
+        # Act + Assert
+        with self.assertRaises(OSError):
+            sut.close()
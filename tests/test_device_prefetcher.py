@@ -0,0 +1,65 @@
+import time
+from unittest import TestCase
+
+import torch
+
+from device_prefetcher import DevicePrefetcher
+
+
+class TestDevicePrefetcher(TestCase):
+
+    def test_iter(self):
+        """
+        Test case  should return the batches in order on the device
+        """
+        data_loader = [((torch.tensor([i]), torch.tensor([i + 1])), torch.tensor([i])) for i in range(3)]
+        sut = DevicePrefetcher(data_loader, "cpu")
+
+        # Act
+        actual = list(sut)
+
+        # Assert
+        self.assertEqual([[i, i + 1, i] for i in range(3)],
+                         [[x[0].item(), x[1].item(), y.item()] for x, y in actual])
+        self.assertEqual(3, sut.steps)
+
+    def test_wait_time(self):
+        """
+        Test case  the data wait should include the time blocked on a slow data loader, but not the time spent in the loop
+        """
+
+        def slow_data_loader():
+            for i in range(4):
+                time.sleep(0.02)
+                yield torch.tensor([i]), torch.tensor([i])
+
+        sut = DevicePrefetcher(slow_data_loader(), "cpu")
+
+        # Act
+        for _ in sut:
+            time.sleep(0.05)
+
+        # Assert
+        self.assertEqual(4, sut.steps)
+        self.assertGreaterEqual(sut.mean_wait_ms, 15)
+        self.assertLess(sut.mean_wait_ms, 50)
+
+    def test_last_wait_time(self):
+        """
+        Test case  the last wait should be the time spent loading the batch returned, not the batch loaded ahead
+        """
+
+        def slow_data_loader():
+            for i in range(3):
+                time.sleep(0.03 if i == 1 else 0.0)
+                yield torch.tensor([i]), torch.tensor([i])
+
+        sut = DevicePrefetcher(slow_data_loader(), "cpu")
+
+        # Act
+        actual = {y.item(): sut.last_wait_seconds for _, y in sut}
+
+        # Assert
+        self.assertLess(actual[0], 0.02)
+        self.assertGreaterEqual(actual[1], 0.025)
+        self.assertLess(actual[2], 0.02)
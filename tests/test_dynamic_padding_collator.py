@@ -0,0 +1,24 @@
+from unittest import TestCase
+
+import torch
+
+from dynamic_padding_collator import DynamicPaddingCollator
+
+
+class TestDynamicPaddingCollator(TestCase):
+
+    def test___call__(self):
+        """
+        Test case  sequences are padded to the longest sequence in the batch
+        """
+        sut = DynamicPaddingCollator(pad_index=0)
+        batch = [(torch.tensor([101, 5, 102]), 1), (torch.tensor([101, 5, 6, 7, 102]), 2)]
+        expected_x = [[101, 5, 102, 0, 0], [101, 5, 6, 7, 102]]
+        expected_y = [1, 2]
+
+        # Act
+        actual_x, actual_y = sut(batch)
+
+        # Assert
+        self.assertSequenceEqual(expected_x, actual_x.tolist())
+        self.assertSequenceEqual(expected_y, actual_y.tolist())
@@ -0,0 +1,43 @@
+from unittest import TestCase
+
+import torch
+import transformers
+
+from bert_model import BertModel
+from gradual_unfreezer import GradualUnfreezer
+
+
+class TestGradualUnfreezer(TestCase):
+
+    def test_frozen_layers(self):
+        """
+        Test case  should unfreeze a layer every n epochs, down to nothing frozen
+        """
+        sut = GradualUnfreezer(freeze_layers=2, unfreeze_every=2)
+
+        # Act
+        actual = [sut.frozen_layers(epoch) for epoch in range(8)]
+
+        # Assert
+        self.assertEqual([2, 2, 1, 1, 0, 0, -1, -1], actual)
+
+    def test_call(self):
+        """
+        Test case  the unfrozen parameters should be added to the optimiser once
+        """
+        config = transformers.BertConfig(vocab_size=10, hidden_size=10, num_hidden_layers=2, num_attention_heads=1,
+                                         num_labels=3)
+        model = BertModel(None, None, fine_tune=False, bert_config=config, freeze_layers=2)
+        optimizer = torch.optim.Adam([p for p in model.parameters() if p.requires_grad])
+        sut = GradualUnfreezer(freeze_layers=2, unfreeze_every=1)
+
+        # Act
+        actual_changed = [sut(model, optimizer, epoch) for epoch in range(5)]
+
+        # Assert
+        self.assertEqual([False, True, True, True, False], actual_changed)
+        self.assertEqual(-1, model.frozen_layers)
+        self.assertEqual(4, len(optimizer.param_groups))
+        optimised = [p for group in optimizer.param_groups for p in group["params"]]
+        self.assertEqual(len(list(model.parameters())), len(optimised))
+        self.assertEqual(len(optimised), len(set(id(p) for p in optimised)))
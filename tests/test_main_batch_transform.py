@@ -0,0 +1,66 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+import transformers
+
+import serve
+from bert_model import BertModel
+from main_batch_transform import BatchTransform
+from model_artifacts import ModelArtifacts
+from preprocessor_nli_bert_tokeniser_fast import PreprocessorNliBertTokeniserFast
+from snli_dataset_label_mapper import SnliLabelMapper
+
+
+class TestBatchTransform(TestCase):
+
+    def test_run(self):
+        """
+        Test case  should write a prediction for every line in the order of the file, matching predict_fn, and count the labelled lines in the confusion matrix
+        """
+        model_dir = tempfile.mkdtemp()
+        vocab_file = os.path.join(tempfile.mkdtemp(), "vocab.txt")
+        with open(vocab_file, "w") as f:
+            f.write("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "a", "person", "on", "horse", "is", "."]))
+        preprocessor = PreprocessorNliBertTokeniserFast(max_feature_len=32, pad_to_max=False,
+                                                        tokeniser=transformers.BertTokenizerFast(vocab_file))
+        bert_config = transformers.BertConfig(vocab_size=10, hidden_size=8, num_hidden_layers=1,
+                                              num_attention_heads=1, intermediate_size=16, num_labels=3)
+        ModelArtifacts.save_metadata(model_dir, bert_config, preprocessor, SnliLabelMapper())
+        ModelArtifacts.save_weights(BertModel(None, None, fine_tune=False, bert_config=bert_config), model_dir)
+        model_artifacts = serve.model_fn(model_dir)
+
+        json_file = os.path.join(tempfile.mkdtemp(), "snli_test.jsonl")
+        labels = ["entailment", "neutral", "contradiction", "-"]
+        records = []
+        with open(json_file, "w") as f:
+            for i in range(11):
+                record = {"sentence1": " ".join(["a horse"] * (i % 4 + 1)), "sentence2": "a person is on a horse .",
+                          "gold_label": labels[i % 4]}
+                if i == 10:
+                    del record["gold_label"]
+                f.write(json.dumps(record) + "\n")
+                records.append({"premise": record["sentence1"], "hypothesis": record["sentence2"],
+                                "label": record.get("gold_label")})
+        expected = serve.predict_fn(records, model_artifacts)
+        output_dir = tempfile.mkdtemp()
+
+        sut = BatchTransform(model_artifacts, batch_size=2, num_workers=2, chunk_size=3)
+
+        # Act
+        actual = sut.run(json_file, output_dir)
+
+        # Assert
+        with open(os.path.join(output_dir, "snli_test_predictions.jsonl")) as f:
+            predictions = [json.loads(l) for l in f]
+        self.assertEqual([(r["premise"], r["label"]) for r in records],
+                         [(p["premise"], p["label"]) for p in predictions])
+        self.assertEqual([e["label"] for e in expected], [p["predicted_label"] for p in predictions])
+        for e, p in zip(expected, predictions):
+            self.assertAlmostEqual(e["confidence"], p["predicted_confidence"], places=5)
+        self.assertEqual(11, actual["records"])
+        self.assertEqual(8, actual["labelled_records"])
+        self.assertEqual([3, 3, 2], [sum(row) for row in actual["confusion_matrix"]])
+        with open(os.path.join(output_dir, "snli_test_metrics.json")) as f:
+            self.assertEqual(actual["accuracy"], json.load(f)["accuracy"])
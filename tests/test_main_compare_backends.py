@@ -0,0 +1,48 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+import transformers
+
+from bert_model import BertModel
+from main_compare_backends import CompareBackends
+from model_artifacts import ModelArtifacts
+from preprocessor_nli_bert_tokeniser_fast import PreprocessorNliBertTokeniserFast
+from snli_dataset_label_mapper import SnliLabelMapper
+
+
+class TestCompareBackends(TestCase):
+
+    def test_run(self):
+        """
+        Test case  should report the accuracy and agreement of each backend
+        """
+        model_dir = tempfile.mkdtemp()
+        vocab_file = os.path.join(tempfile.mkdtemp(), "vocab.txt")
+        with open(vocab_file, "w") as f:
+            f.write("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "a", "person", "on", "horse", "is", "."]))
+        preprocessor = PreprocessorNliBertTokeniserFast(max_feature_len=16,
+                                                        tokeniser=transformers.BertTokenizerFast(vocab_file))
+        bert_config = transformers.BertConfig(vocab_size=10, hidden_size=8, num_hidden_layers=1,
+                                              num_attention_heads=1, intermediate_size=16, num_labels=3)
+        model = BertModel(None, None, fine_tune=False, bert_config=bert_config)
+        ModelArtifacts.save_metadata(model_dir, bert_config, preprocessor, SnliLabelMapper())
+        ModelArtifacts.save_weights(model, model_dir)
+
+        test_file = os.path.join(tempfile.mkdtemp(), "test.jsonl")
+        with open(test_file, "w") as f:
+            for label in ["neutral", "entailment", "-", "contradiction"]:
+                f.write(json.dumps({"sentence1": "A person on a horse.", "sentence2": "A person is.",
+                                    "gold_label": label}) + "\n")
+
+        sut = CompareBackends(model_dir, batch_size=2)
+
+        # Act
+        actual = sut.run(test_file, ["eager", "int8"])
+
+        # Assert
+        self.assertEqual(["eager", "int8"], [r["backend"] for r in actual])
+        self.assertEqual(1.0, actual[0]["agreement"])
+        # All the records are identical, so only one of the 3 labels can be predicted correctly
+        self.assertAlmostEqual(1 / 3, actual[0]["accuracy"])
@@ -0,0 +1,79 @@
+import json
+import os
+import tempfile
+import threading
+from unittest import TestCase
+
+from main_evaluate import Evaluate, HttpEndpointClient
+from main_serve import InferenceServer
+
+
+class TestEvaluate(TestCase):
+
+    def test_run(self):
+        """
+        Test case  should stream every prediction to the output file in the input order, retrying the failed requests
+        """
+        json_file = os.path.join(tempfile.mkdtemp(), "snli_test.jsonl")
+        labels = ["entailment", "neutral", "contradiction"]
+        with open(json_file, "w") as f:
+            for i in range(20):
+                f.write(json.dumps({"sentence1": "premise {}".format(i), "sentence2": "hypothesis {}".format(i),
+                                    "gold_label": labels[i % 3]}) + "\n")
+        output_dir = tempfile.mkdtemp()
+        failures = [2]
+        lock = threading.Lock()
+
+        def predict(records):
+            with lock:
+                if failures[0] > 0:
+                    failures[0] -= 1
+                    raise RuntimeError("Endpoint unavailable")
+            return [{"label": r["label"], "confidence": 0.9} for r in records]
+
+        server = InferenceServer(("127.0.0.1", 0), predict, max_batch_size=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        sut = Evaluate(client=HttpEndpointClient("http://127.0.0.1:{}".format(server.server_address[1])),
+                       batch_size=3, max_concurrency=4, max_retries=3, backoff_seconds=0.01)
+
+        # Act
+        actual = sut.run(json_file, "local", output_dir)
+        server.shutdown()
+        server.server_close()
+
+        # Assert
+        with open(os.path.join(output_dir, "snli_test_predictions.json")) as f:
+            predictions = json.load(f)
+        self.assertEqual(["premise {}".format(i) for i in range(20)], [p["premise"] for p in predictions])
+        self.assertEqual(100.0, actual["accuracy"])
+        self.assertEqual(2, actual["retries"])
+        self.assertEqual(7, actual["requests"])
+
+    def test_run_labels_passed_through(self):
+        """
+        Test case  should only skip the records without a gold label, and compare any other label with the predictions as is
+        """
+        json_file = os.path.join(tempfile.mkdtemp(), "snli_test.jsonl")
+        with open(json_file, "w") as f:
+            for i, label in enumerate(["entailment", "-", "not_entailment", "neutral"]):
+                f.write(json.dumps({"sentence1": "premise {}".format(i), "sentence2": "hypothesis {}".format(i),
+                                    "gold_label": label}) + "\n")
+        output_dir = tempfile.mkdtemp()
+
+        server = InferenceServer(("127.0.0.1", 0),
+                                 lambda records: [{"label": "neutral", "confidence": 0.9} for _ in records],
+                                 max_batch_size=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        sut = Evaluate(client=HttpEndpointClient("http://127.0.0.1:{}".format(server.server_address[1])), batch_size=2)
+
+        # Act
+        actual = sut.run(json_file, "local", output_dir)
+        server.shutdown()
+        server.server_close()
+
+        # Assert
+        with open(os.path.join(output_dir, "snli_test_predictions.json")) as f:
+            predictions = json.load(f)
+        self.assertEqual(["entailment", "not_entailment", "neutral"], [p["label"] for p in predictions])
+        self.assertEqual(3, actual["records"])
+        self.assertAlmostEqual(100 / 3, actual["accuracy"])
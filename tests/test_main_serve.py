@@ -0,0 +1,93 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from unittest import TestCase
+
+from main_serve import InferenceServer
+
+
+class TestInferenceServer(TestCase):
+
+    def test_invocations(self):
+        """
+        Test case  concurrent requests should each receive the predictions for their own records
+        """
+        sut = InferenceServer(("127.0.0.1", 0),
+                              lambda records: [{"label": r["premise"], "confidence": 1.0} for r in records],
+                              max_batch_size=8, max_wait_ms=20)
+        threading.Thread(target=sut.serve_forever, daemon=True).start()
+        url = "http://127.0.0.1:{}/invocations".format(sut.server_address[1])
+        actual = {}
+
+        def client(i):
+            records = [{"premise": "p{}_{}".format(i, j), "hypothesis": "h"} for j in range(3)]
+            request = urllib.request.Request(url, data=json.dumps(records).encode("utf-8"),
+                                             headers={"Content-Type": "text/json", "Accept": "text/json"})
+            with urllib.request.urlopen(request) as response:
+                actual[i] = [p["label"] for p in json.loads(response.read().decode("utf-8"))]
+
+        # Act
+        clients = [threading.Thread(target=client, args=(i,)) for i in range(5)]
+        for c in clients:
+            c.start()
+        for c in clients:
+            c.join()
+        sut.shutdown()
+        sut.server_close()
+
+        # Assert
+        self.assertEqual({i: ["p{}_{}".format(i, j) for j in range(3)] for i in range(5)}, actual)
+
+    def test_invocations_malformed_request(self):
+        """
+        Test case  a malformed request should get a 400, without failing a valid request sent concurrently
+        """
+
+        def predict(records):
+            return [{"label": r["premise"] + r["hypothesis"], "confidence": 1.0} for r in records]
+
+        sut = InferenceServer(("127.0.0.1", 0), predict, max_batch_size=8, max_wait_ms=200)
+        threading.Thread(target=sut.serve_forever, daemon=True).start()
+        url = "http://127.0.0.1:{}/invocations".format(sut.server_address[1])
+        actual = {}
+
+        def client(name, records):
+            request = urllib.request.Request(url, data=json.dumps(records).encode("utf-8"),
+                                             headers={"Content-Type": "text/json", "Accept": "text/json"})
+            try:
+                with urllib.request.urlopen(request) as response:
+                    actual[name] = (response.status, json.loads(response.read().decode("utf-8")))
+            except urllib.error.HTTPError as e:
+                actual[name] = (e.code, None)
+
+        # Act
+        clients = [threading.Thread(target=client, args=("good", [{"premise": "p", "hypothesis": "h"}])),
+                   threading.Thread(target=client, args=("bad", [{"premise": "p"}]))]
+        for c in clients:
+            c.start()
+        for c in clients:
+            c.join()
+        sut.shutdown()
+        sut.server_close()
+
+        # Assert
+        self.assertEqual((200, [{"label": "ph", "confidence": 1.0}]), actual["good"])
+        self.assertEqual((400, None), actual["bad"])
+
+    def test_metrics(self):
+        """
+        Test case  GET /metrics should return the stats
+        """
+        sut = InferenceServer(("127.0.0.1", 0), lambda records: records, max_batch_size=0,
+                              stats=lambda: {"prediction_cache": {"hits": 1}})
+        threading.Thread(target=sut.serve_forever, daemon=True).start()
+
+        # Act
+        with urllib.request.urlopen("http://127.0.0.1:{}/metrics".format(sut.server_address[1])) as response:
+            actual = json.loads(response.read().decode("utf-8"))
+        sut.shutdown()
+        sut.server_close()
+
+        # Assert
+        self.assertEqual({"prediction_cache": {"hits": 1}}, actual)
@@ -0,0 +1,84 @@
+from unittest import TestCase
+
+from micro_batcher import MicroBatcher
+
+
+class TestMicroBatcher(TestCase):
+
+    def test_concurrent_requests_coalesced(self):
+        """
+        Test case  concurrent requests should be predicted in a single batch, and each caller receives its own results
+        """
+        batches = []
+
+        def predict(records):
+            batches.append(list(records))
+            return [r * 10 for r in records]
+
+        sut = MicroBatcher(predict, max_batch_size=100, max_wait_ms=500)
+
+        # Act
+        futures = [sut.submit([i, i + 1]) for i in range(0, 10, 2)]
+        actual = [f.result(timeout=5) for f in futures]
+        sut.stop()
+
+        # Assert
+        self.assertEqual([[i * 10, (i + 1) * 10] for i in range(0, 10, 2)], actual)
+        self.assertEqual([list(range(10))], batches)
+
+    def test_max_batch_size(self):
+        """
+        Test case  a batch should not exceed the max batch size, unless a single request is larger
+        """
+        batch_sizes = []
+
+        def predict(records):
+            batch_sizes.append(len(records))
+            return records
+
+        sut = MicroBatcher(predict, max_batch_size=4, max_wait_ms=500)
+
+        # Act
+        futures = [sut.submit(r) for r in [[1], [2, 3], [4, 5], [6], [7, 8, 9, 10, 11], [12]]]
+        actual = [f.result(timeout=5) for f in futures]
+        sut.stop()
+
+        # Assert
+        self.assertEqual([[1], [2, 3], [4, 5], [6], [7, 8, 9, 10, 11], [12]], actual)
+        self.assertEqual([3, 3, 5, 1], batch_sizes)
+
+    def test_error_routed_to_callers(self):
+        """
+        Test case  an error in the prediction should be raised to the callers of the batch
+        """
+
+        def predict(records):
+            raise ValueError("Failed")
+
+        sut = MicroBatcher(predict, max_batch_size=4, max_wait_ms=1)
+
+        # Act + Assert
+        with self.assertRaises(ValueError):
+            sut([1, 2])
+        sut.stop()
+
+    def test_error_isolated_to_failing_request(self):
+        """
+        Test case  a request that fails the batch should only fail its own caller, the other requests of the batch should get their results
+        """
+
+        def predict(records):
+            if any(r is None for r in records):
+                raise ValueError("Failed")
+            return [r * 10 for r in records]
+
+        sut = MicroBatcher(predict, max_batch_size=100, max_wait_ms=500)
+
+        # Act
+        good, bad = sut.submit([1, 2]), sut.submit([3, None])
+        actual = good.result(timeout=5)
+
+        # Assert
+        self.assertEqual([10, 20], actual)
+        self.assertIsInstance(bad.exception(timeout=5), ValueError)
+        sut.stop()
@@ -0,0 +1,149 @@
+import importlib.util
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+import torch
+import transformers
+
+import serve
+from bert_model import BertModel
+from model_artifacts import ModelArtifacts
+from preprocessor_nli_bert_tokeniser_fast import PreprocessorNliBertTokeniserFast
+from snli_dataset_label_mapper import SnliLabelMapper
+
+
+class TestModelArtifacts(TestCase):
+
+    def setUp(self):
+        vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "a", "person", "on", "horse", "is", "."]
+        vocab_file = os.path.join(tempfile.mkdtemp(), "vocab.txt")
+        with open(vocab_file, "w") as f:
+            f.write("\n".join(vocab))
+
+        self.preprocessor = PreprocessorNliBertTokeniserFast(max_feature_len=16, pad_to_max=False,
+                                                             tokeniser=transformers.BertTokenizerFast(vocab_file))
+        self.label_mapper = SnliLabelMapper()
+        bert_config = transformers.BertConfig(vocab_size=len(vocab), hidden_size=8, num_hidden_layers=1,
+                                              num_attention_heads=1, intermediate_size=16, num_labels=3)
+        self.model = BertModel(None, None, fine_tune=False, bert_config=bert_config)
+        self.model.eval()
+
+        self.records = [{"premise": "A person on a horse.", "hypothesis": "A person is on a horse."},
+                        {"premise": "A horse.", "hypothesis": "A person is."}]
+
+    def test_load(self):
+        """
+        Test case  the loaded artifacts should predict the same as the saved artifacts
+        """
+        model_dir = tempfile.mkdtemp()
+        ModelArtifacts.save_metadata(model_dir, self.model.model.config, self.preprocessor, self.label_mapper)
+        ModelArtifacts.save_weights(self.model, model_dir)
+
+        expected = serve.predict_fn(self.records, (self.preprocessor, self.model, self.label_mapper))
+
+        # Act
+        actual_artifacts = ModelArtifacts.load(model_dir)
+        actual = serve.predict_fn(self.records, actual_artifacts)
+
+        # Assert
+        self.assertEqual([r["label"] for r in expected], [r["label"] for r in actual])
+        for e, a in zip(expected, actual):
+            self.assertAlmostEqual(e["confidence"], a["confidence"], places=5)
+        self.assertEqual("entailment", actual_artifacts[2].positive_label)
+        for e, a in zip(self.model.state_dict().values(), actual_artifacts[1].state_dict().values()):
+            self.assertTrue(torch.equal(e, a))
+
+    def test_model_fn(self):
+        """
+        Test case  model_fn should load the artifacts when the model dir contains the artifacts
+        """
+        model_dir = tempfile.mkdtemp()
+        ModelArtifacts.save_metadata(model_dir, self.model.model.config, self.preprocessor, self.label_mapper)
+        ModelArtifacts.save_weights(self.model, model_dir)
+
+        # Act
+        preprocessor, model, label_mapper = serve.model_fn(model_dir)
+
+        # Assert
+        self.assertIsInstance(preprocessor, PreprocessorNliBertTokeniserFast)
+        self.assertEqual(3, label_mapper.num_classes)
+        self.assertEqual(len(self.records), len(serve.predict_fn(self.records, (preprocessor, model, label_mapper))))
+
+    def test_load_int8(self):
+        """
+        Test case  the exported int8 model should quantize the linear layers, and predict the same as quantizing on load
+        """
+        model_dir = tempfile.mkdtemp()
+        ModelArtifacts.save_metadata(model_dir, self.model.model.config, self.preprocessor, self.label_mapper)
+        ModelArtifacts.save_weights(self.model, model_dir)
+        expected_artifacts = ModelArtifacts.load(model_dir, backend="int8")
+
+        # Act
+        ModelArtifacts.export_int8(model_dir)
+        actual_artifacts = ModelArtifacts.load(model_dir, backend="int8")
+
+        # Assert
+        self.assertFalse(any(type(m) == torch.nn.Linear for m in actual_artifacts[1].modules()))
+        input_tensor = serve.preprocess(self.records, actual_artifacts[0])
+        with torch.no_grad():
+            self.assertTrue(torch.equal(expected_artifacts[1](*input_tensor)[0], actual_artifacts[1](*input_tensor)[0]))
+
+    def test_load_torchscript(self):
+        """
+        Test case  the traced model should predict the same as the eager model, for batch sizes and sequence lengths other than the traced inputs
+        """
+        model_dir = tempfile.mkdtemp()
+        ModelArtifacts.save_metadata(model_dir, self.model.model.config, self.preprocessor, self.label_mapper)
+        ModelArtifacts.save_weights(self.model, model_dir)
+        records = self.records + [{"premise": "A person.", "hypothesis": "A horse is on a person on a horse."}]
+
+        # Act
+        ModelArtifacts.export(model_dir, "torchscript")
+        actual_artifacts = ModelArtifacts.load(model_dir, backend="torchscript")
+
+        # Assert
+        for batch in [records[:1], records]:
+            input_tensor = serve.preprocess(batch, self.preprocessor)
+            with torch.no_grad():
+                expected = self.model(*input_tensor)[0]
+                actual = actual_artifacts[1](*input_tensor)[0]
+            self.assertTrue(torch.allclose(expected, actual, atol=1e-5))
+
+    @unittest.skipUnless(importlib.util.find_spec("onnxruntime"), "onnxruntime is not installed")
+    def test_load_onnx(self):
+        """
+        Test case  the onnx model should return the same logits as the eager model, for batch sizes and sequence lengths other than the exported inputs
+        """
+        model_dir = tempfile.mkdtemp()
+        ModelArtifacts.save_metadata(model_dir, self.model.model.config, self.preprocessor, self.label_mapper)
+        ModelArtifacts.save_weights(self.model, model_dir)
+        records = self.records + [{"premise": "A person.", "hypothesis": "A horse is on a person on a horse."}]
+
+        # Act
+        ModelArtifacts.export(model_dir, "onnx")
+        actual_artifacts = ModelArtifacts.load(model_dir, backend="onnx")
+
+        # Assert
+        for batch in [records[:1], records]:
+            input_tensor = serve.preprocess(batch, self.preprocessor)
+            with torch.no_grad():
+                expected = self.model(*input_tensor)[0]
+            actual = actual_artifacts[1](*input_tensor)[0]
+            self.assertTrue(torch.allclose(expected, actual, atol=1e-4))
+        expected_predictions = serve.predict_fn(records, (self.preprocessor, self.model, self.label_mapper))
+        self.assertEqual([r["label"] for r in expected_predictions],
+                         [r["label"] for r in serve.predict_fn(records, actual_artifacts)])
+
+    def test_load_weights_mismatch(self):
+        """
+        Test case  loading weights that do not match the model should fail
+        """
+        model_dir = tempfile.mkdtemp()
+        ModelArtifacts.save_metadata(model_dir, self.model.model.config, self.preprocessor, self.label_mapper)
+        ModelArtifacts.save_weights(torch.nn.Linear(2, 2), model_dir)
+
+        # Act + Assert
+        with self.assertRaises(KeyError):
+            ModelArtifacts.load(model_dir)
@@ -0,0 +1,26 @@
+from unittest import TestCase
+
+from nli_columnar_records import NliColumnarRecords
+
+
+class TestNliColumnarRecords(TestCase):
+
+    def test___getitem__(self):
+        """
+        Test case  records should be returned as they were appended, including non ascii text
+        """
+        expected = [("A person on a horse.", "A person is outdoors.", 1),
+                    ("", "Café au lait.", 0),
+                    ("Ein Mann läuft.", "", 2)]
+        sut = NliColumnarRecords()
+
+        # Act
+        for r in expected:
+            sut.append(*r)
+
+        # Assert
+        self.assertEqual(len(expected), len(sut))
+        self.assertSequenceEqual(expected, [sut[i] for i in range(len(sut))])
+        self.assertEqual(expected[-1], sut[-1])
+        with self.assertRaises(IndexError):
+            _ = sut[len(expected)]
@@ -0,0 +1,72 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import torch
+import transformers
+from torch.utils.data import DataLoader
+from transformers import BertTokenizer
+
+from bert_model import BertClassifierHead, BertModel
+from nli_feature_cache import NliFeatureCache
+from preprocessor_nli_bert_tokeniser import PreprocessorNliBertTokeniser
+from snli_dataset import SnliDataset
+
+
+class TestNliFeatureCache(TestCase):
+
+    def setUp(self):
+        self.input_file = os.path.join(os.path.dirname(__file__), "sample_data", "snli_train.jsonl")
+        self.preprocessor = PreprocessorNliBertTokeniser(max_feature_len=20, tokeniser=self._get_tokeniser())
+        config = transformers.BertConfig(vocab_size=11, hidden_size=10, num_hidden_layers=1, num_attention_heads=1,
+                                         num_labels=3)
+        self.bert_model = BertModel(None, None, bert_config=config)
+        self.bert_model.eval()
+
+    def test_classifier_head_same_as_model(self):
+        """
+        Test case  the classifier head over the cached features should predict the same as the model in eval mode
+        """
+        dataset = SnliDataset(self.input_file, preprocessor=self.preprocessor)
+        x, y = next(iter(DataLoader(dataset, batch_size=len(dataset))))
+        expected = self.bert_model(*x)[0]
+
+        sut = NliFeatureCache(tempfile.mkdtemp(), self.input_file, self.preprocessor, self.bert_model)
+        sut.build(DataLoader(dataset, batch_size=2, shuffle=False))
+        head = BertClassifierHead(self.bert_model)
+
+        # Act
+        features, labels = next(iter(DataLoader(sut, batch_size=len(sut))))
+        actual = head(features)[0]
+
+        # Assert
+        self.assertEqual(len(dataset), len(sut))
+        self.assertSequenceEqual(y.tolist(), labels.tolist())
+        self.assertTrue(torch.allclose(expected, actual, atol=1e-5))
+        self.assertEqual(set(self.bert_model.state_dict().keys()), set(head.state_dict().keys()))
+
+    def test_exists(self):
+        """
+        Test case  the cache should be reused for the same encoder weights, but not once the encoder changes
+        """
+        cache_dir = tempfile.mkdtemp()
+        dataset = SnliDataset(self.input_file, preprocessor=self.preprocessor)
+        NliFeatureCache(cache_dir, self.input_file, self.preprocessor, self.bert_model) \
+            .build(DataLoader(dataset, batch_size=2, shuffle=False))
+
+        # Act
+        actual_same = NliFeatureCache(cache_dir, self.input_file, self.preprocessor, self.bert_model).exists()
+        with torch.no_grad():
+            self.bert_model.model.base_model.pooler.dense.bias.add_(1.0)
+        actual_changed = NliFeatureCache(cache_dir, self.input_file, self.preprocessor, self.bert_model).exists()
+
+        # Assert
+        self.assertTrue(actual_same)
+        self.assertFalse(actual_changed)
+
+    def _get_tokeniser(self):
+        vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "A", "person", "on", "a", "horse", "is", "."]
+        vocab_file = os.path.join(tempfile.mkdtemp(), "vocab.txt")
+        with open(vocab_file, "w") as f:
+            f.write("\n".join(vocab))
+        return BertTokenizer(vocab_file, do_lower_case=False)
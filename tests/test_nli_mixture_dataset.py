@@ -0,0 +1,77 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from transformers import BertTokenizer, BertTokenizerFast
+
+from nli_mixture_dataset import NliMixtureDataset
+from preprocessor_nli_bert_tokeniser import PreprocessorNliBertTokeniser
+from preprocessor_nli_bert_tokeniser_fast import PreprocessorNliBertTokeniserFast
+from snli_dataset import SnliDataset
+
+
+class TestNliMixtureDataset(TestCase):
+
+    def setUp(self):
+        self.snli_file = os.path.join(os.path.dirname(__file__), "sample_data", "snli_train.jsonl")
+        self.anli_file = os.path.join(tempfile.mkdtemp(), "anli_train.jsonl")
+        with open(self.anli_file, "w") as f:
+            for context, hypothesis, label in [
+                ("A person on a horse jumps over a broken down airplane.", "A person is on a horse.", "e"),
+                ("A person on a horse jumps over a broken down airplane.", "A horse is a person.", "c"),
+                ("A person is a person.", "A person on a horse jumps over a broken down airplane.", "n")]:
+                f.write(json.dumps({"uid": "1", "context": context, "hypothesis": hypothesis, "label": label}) + "\n")
+        self.sources = [("snli", self.snli_file), ("anli", self.anli_file)]
+
+    def test___getitem__(self):
+        """
+        Test case  the mixture should concatenate the records of the sources, mapping the labels of each source
+        """
+        snli = SnliDataset(self.snli_file)
+
+        # Act
+        sut = NliMixtureDataset(self.sources)
+
+        # Assert
+        self.assertEqual([len(snli), 3], sut.source_sizes)
+        self.assertEqual(len(snli) + 3, len(sut))
+        self.assertEqual(snli[0], sut[0])
+        self.assertEqual((("A person is a person.", "A person on a horse jumps over a broken down airplane."), 0),
+                         sut[len(snli) + 2])
+
+    def test___getitem__dedup_token_cache(self):
+        """
+        Test case  items read from the dedup token cache should match the items from the preprocessor
+        """
+        vocab_file = self._get_vocab_file()
+        for preprocessor in [
+            PreprocessorNliBertTokeniser(max_feature_len=12, tokeniser=BertTokenizer(vocab_file, do_lower_case=False)),
+            PreprocessorNliBertTokeniserFast(max_feature_len=12, pad_to_max=False,
+                                             tokeniser=BertTokenizerFast(vocab_file, do_lower_case=False))]:
+            with self.subTest(preprocessor=type(preprocessor).__name__):
+                cache_dir = tempfile.mkdtemp()
+                expected = NliMixtureDataset(self.sources, preprocessor=preprocessor)
+
+                # Build cache and then read from the existing cache
+                NliMixtureDataset(self.sources, preprocessor=preprocessor, token_cache_dir=cache_dir)
+                sut = NliMixtureDataset(self.sources, preprocessor=preprocessor, token_cache_dir=cache_dir)
+
+                # Act
+                actual = [sut[i] for i in range(len(sut))]
+
+                # Assert
+                self.assertEqual(expected.source_sizes, sut.source_sizes)
+                self.assertEqual([len(x[0]) for x, _ in actual], sut.lengths)
+                self.assertEqual(len(expected), len(actual))
+                for (expected_x, expected_y), (actual_x, actual_y) in zip(expected, actual):
+                    for e, a in zip(expected_x, actual_x):
+                        self.assertSequenceEqual(e.tolist(), a.tolist())
+                    self.assertEqual(expected_y, actual_y)
+
+    def _get_vocab_file(self):
+        vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "A", "person", "on", "a", "horse", "is", "."]
+        vocab_file = os.path.join(tempfile.mkdtemp(), "vocab.txt")
+        with open(vocab_file, "w") as f:
+            f.write("\n".join(vocab))
+        return vocab_file
@@ -0,0 +1,29 @@
+from unittest import TestCase
+
+from nli_source_registry import parse_mixture
+
+
+class TestNliSourceRegistry(TestCase):
+
+    def test_parse_mixture(self):
+        """
+        Test case  should parse the source, file and optional weight, where the file may contain ":"
+        """
+        spec = r"snli:snli_train.jsonl:1,mnli:s3://bucket/mnli_train.jsonl:0.5,anli:C:\data\anli.jsonl"
+
+        # Act
+        actual = parse_mixture(spec)
+
+        # Assert
+        self.assertEqual([("snli", "snli_train.jsonl", 1.0), ("mnli", "s3://bucket/mnli_train.jsonl", 0.5),
+                          ("anli", r"C:\data\anli.jsonl", None)], actual)
+
+    def test_parse_mixture_invalid(self):
+        """
+        Test case  should raise a ValueError on an unknown source, a missing file or a negative weight
+        """
+        for spec in ["snli_train.jsonl", "unknown:train.jsonl:1", "snli::1", "snli:train.jsonl:-1"]:
+            with self.subTest(spec=spec):
+                # Act + Assert
+                with self.assertRaises(ValueError):
+                    parse_mixture(spec)
@@ -0,0 +1,64 @@
+from unittest import TestCase
+
+import torch
+import transformers
+
+from bert_model import BertModel
+from optimiser_factory import OptimiserFactory, WarmupLinearSchedule
+
+
+class TestOptimiserFactory(TestCase):
+
+    def setUp(self):
+        config = transformers.BertConfig(vocab_size=10, hidden_size=10, num_hidden_layers=1, num_attention_heads=1,
+                                         num_labels=3)
+        self.model = BertModel(None, None, fine_tune=False, bert_config=config)
+
+    def test_create_no_decay(self):
+        """
+        Test case  the biases and LayerNorm weights should be in the group without weight decay
+        """
+        sut = OptimiserFactory(optimiser="adamw", weight_decay=0.01, implementation="foreach")
+        names = {id(p): n for n, p in self.model.named_parameters()}
+
+        # Act
+        actual = sut.create(self.model)
+
+        # Assert
+        self.assertIsInstance(actual, torch.optim.AdamW)
+        decay, no_decay = actual.param_groups
+        self.assertEqual(0.01, decay["weight_decay"])
+        self.assertEqual(0.0, no_decay["weight_decay"])
+        self.assertTrue(all(not names[id(p)].endswith(("bias", "LayerNorm.weight")) for p in decay["params"]))
+        self.assertTrue(all(names[id(p)].endswith(("bias", "LayerNorm.weight")) for p in no_decay["params"]))
+        self.assertEqual(len(list(self.model.parameters())), len(decay["params"]) + len(no_decay["params"]))
+
+    def test_create_scheduler_constant(self):
+        """
+        Test case  no schedule is required for a constant learning rate
+        """
+        sut = OptimiserFactory()
+
+        # Act
+        actual = sut.create_scheduler(sut.create(self.model))
+
+        # Assert
+        self.assertIsNone(actual)
+
+    def test_warmup_linear_schedule(self):
+        """
+        Test case  the learning rate should warm up and then decay linearly, including for groups added later
+        """
+        optimiser = torch.optim.SGD([torch.nn.Parameter(torch.zeros(1))], lr=1.0)
+        sut = WarmupLinearSchedule(optimiser, warmup_steps=2, total_steps=6)
+
+        # Act
+        actual = [sut.get_last_lr()[0]]
+        for step in range(6):
+            if step == 2:
+                optimiser.add_param_group({"params": [torch.nn.Parameter(torch.zeros(1))]})
+            sut.step()
+            actual.append(sut.get_last_lr()[-1])
+
+        # Assert
+        self.assertEqual([0.0, 0.5, 1.0, 0.75, 0.5, 0.25, 0.0], actual)
@@ -0,0 +1,56 @@
+from unittest import TestCase
+
+from prediction_cache import LruCache, PredictionCache
+
+
+class TestLruCache(TestCase):
+
+    def test_evicts_least_recently_used(self):
+        """
+        Test case  when full, the least recently used entry should be evicted
+        """
+        sut = LruCache(max_size=2)
+        sut.put("a", 1)
+        sut.put("b", 2)
+        sut.get("a")
+
+        # Act
+        sut.put("c", 3)
+
+        # Assert
+        self.assertEqual([1, None, 3], [sut.get("a"), sut.get("b"), sut.get("c")])
+        self.assertEqual({"hits": 3, "misses": 1, "hit_rate": 0.75, "size": 2, "max_size": 2}, sut.stats())
+
+    def test_expires_after_ttl(self):
+        """
+        Test case  an entry older than the ttl should be a miss
+        """
+        now = [0]
+        sut = LruCache(max_size=2, ttl_seconds=10, clock=lambda: now[0])
+        sut.put("a", 1)
+
+        # Act
+        now[0] = 5
+        actual_before = sut.get("a")
+        now[0] = 11
+        actual_after = sut.get("a")
+
+        # Assert
+        self.assertEqual((1, None), (actual_before, actual_after))
+        self.assertEqual(0, len(sut))
+
+
+class TestPredictionCache(TestCase):
+
+    def test_key(self):
+        """
+        Test case  pairs differing only in whitespace should share a key, and the key should include the model version
+        """
+        sut = PredictionCache("v1")
+
+        # Act
+        actual = sut.key(" A person  on a\thorse. ", "A person.")
+
+        # Assert
+        self.assertEqual(("v1", "A person on a horse.", "A person."), actual)
+        self.assertNotEqual(PredictionCache("v2").key("A person on a horse.", "A person."), actual)
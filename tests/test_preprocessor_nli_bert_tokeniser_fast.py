@@ -0,0 +1,78 @@
+import os
+import pickle
+import tempfile
+from unittest import TestCase
+
+from transformers import BertTokenizer, BertTokenizerFast
+
+from preprocessor_nli_bert_tokeniser import PreprocessorNliBertTokeniser
+from preprocessor_nli_bert_tokeniser_fast import PreprocessorNliBertTokeniserFast
+
+
+class TestPreprocessorNliBertTokeniserFast(TestCase):
+
+    def setUp(self):
+        vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "A", "person", "on", "a", "horse", "is", ".", "##s"]
+        self.vocab_file = os.path.join(tempfile.mkdtemp(), "vocab.txt")
+        with open(self.vocab_file, "w") as f:
+            f.write("\n".join(vocab))
+
+        self.items = [("A person on a horse.", "A person is on a horse."),
+                      ("A horse is a horses horse on a person a horse.", "A person.")]
+
+    def test_batch_same_as_slow(self):
+        """
+        Test case  the fast preprocessor should have the same truncation and padding layout as the slow preprocessor
+        """
+        for pad_to_max in [True, False]:
+            with self.subTest(pad_to_max=pad_to_max):
+                expected_sut = PreprocessorNliBertTokeniser(max_feature_len=12, pad_to_max=pad_to_max,
+                                                            tokeniser=BertTokenizer(self.vocab_file,
+                                                                                    do_lower_case=False))
+                sut = PreprocessorNliBertTokeniserFast(max_feature_len=12, pad_to_max=pad_to_max,
+                                                       tokeniser=BertTokenizerFast(self.vocab_file,
+                                                                                   do_lower_case=False))
+
+                # Act
+                actual = sut.batch(self.items)
+
+                # Assert
+                for e, a in zip(expected_sut.batch(self.items), actual):
+                    self.assertSequenceEqual(e.tolist(), a.tolist())
+                for e, a in zip(expected_sut(self.items[1]), sut(self.items[1])):
+                    self.assertSequenceEqual(e.tolist(), a.tolist())
+                self.assertSequenceEqual(expected_sut.encode_batch(self.items), sut.encode_batch(self.items))
+
+    def test_pickle(self):
+        """
+        Test case  the preprocessor can be pickled
+        """
+        sut = PreprocessorNliBertTokeniserFast(max_feature_len=12,
+                                               tokeniser=BertTokenizerFast(self.vocab_file, do_lower_case=False))
+        expected = [t.tolist() for t in sut(self.items[0])]
+
+        # Act
+        actual = pickle.loads(pickle.dumps(sut))
+
+        # Assert
+        self.assertSequenceEqual(expected, [t.tolist() for t in actual(self.items[0])])
+
+    def test_unpickle_without_pad_to_max(self):
+        """
+        Test case  a preprocessor pickled before pad_to_max was added should still load, and pad to the max
+        """
+        for sut in [PreprocessorNliBertTokeniser(max_feature_len=12,
+                                                 tokeniser=BertTokenizer(self.vocab_file, do_lower_case=False)),
+                    PreprocessorNliBertTokeniserFast(max_feature_len=12,
+                                                     tokeniser=BertTokenizerFast(self.vocab_file, do_lower_case=False))]:
+            with self.subTest(preprocessor=type(sut).__name__):
+                expected = [t.tolist() for t in sut(self.items[0])]
+                del sut.pad_to_max
+
+                # Act
+                actual = pickle.loads(pickle.dumps(sut))
+
+                # Assert
+                self.assertFalse(hasattr(actual, "pad_to_max"))
+                self.assertSequenceEqual(expected, [t.tolist() for t in actual(self.items[0])])
+                self.assertEqual(12, len(actual.batch(self.items)[0][0]))
@@ -0,0 +1,114 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import torch
+import transformers
+
+import serve
+from bert_model import BertModel
+from memoized_tokeniser import MemoizedTokeniser
+from model_artifacts import ModelArtifacts
+from prediction_cache import LruCache
+from preprocessor_nli_bert_tokeniser_fast import PreprocessorNliBertTokeniserFast
+from snli_dataset_label_mapper import SnliLabelMapper
+
+
+class TestServe(TestCase):
+
+    def setUp(self):
+        vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "a", "person", "on", "horse", "is", "."]
+        vocab_file = os.path.join(tempfile.mkdtemp(), "vocab.txt")
+        with open(vocab_file, "w") as f:
+            f.write("\n".join(vocab))
+
+        preprocessor = PreprocessorNliBertTokeniserFast(max_feature_len=32, pad_to_max=False,
+                                                        tokeniser=transformers.BertTokenizerFast(vocab_file))
+        bert_config = transformers.BertConfig(vocab_size=len(vocab), hidden_size=8, num_hidden_layers=1,
+                                              num_attention_heads=1, intermediate_size=16, num_labels=3)
+        torch.manual_seed(1)
+        self.model = _ShapeRecorder(BertModel(None, None, fine_tune=False, bert_config=bert_config))
+        self.model_artifacts = (preprocessor, self.model, SnliLabelMapper())
+
+        self.records = [{"premise": " ".join(["a horse"] * n), "hypothesis": "a person is on a horse ."} for n in
+                        [5, 1, 8, 2, 3]]
+
+    def test_predict_fn_micro_batches(self):
+        """
+        Test case  a large request should be predicted in micro batches of similar length, and return the predictions in the input order
+        """
+        expected = [serve.predict_fn([r], self.model_artifacts)[0] for r in self.records]
+        self.model.shapes.clear()
+
+        # Act
+        actual = serve.predict_fn(self.records, self.model_artifacts, batch_size=2)
+
+        # Assert
+        self.assertEqual([e["label"] for e in expected], [a["label"] for a in actual])
+        for e, a in zip(expected, actual):
+            self.assertAlmostEqual(e["confidence"], a["confidence"], places=5)
+        # 3 micro batches, each padded to its longest record, in increasing order of length
+        self.assertEqual([2, 2, 1], [s[0] for s in self.model.shapes])
+        self.assertEqual(sorted(s[1] for s in self.model.shapes), [s[1] for s in self.model.shapes])
+        self.assertLess(self.model.shapes[0][1], self.model.shapes[-1][1])
+
+    def test_predict_fn_cache(self):
+        """
+        Test case  repeated pairs should be returned from the cache, and only the misses should run through the model
+        """
+        model_dir = tempfile.mkdtemp()
+        preprocessor, model, label_mapper = self.model_artifacts
+        ModelArtifacts.save_metadata(model_dir, model.model.model.config, preprocessor, label_mapper)
+        ModelArtifacts.save_weights(model.model, model_dir)
+        model_artifacts = serve.load_model(model_dir)
+        shapes = []
+        model_artifacts[1].register_forward_pre_hook(lambda module, inputs: shapes.append(tuple(inputs[0].shape)))
+
+        expected = serve.predict_fn(self.records[:2], model_artifacts)
+        shapes.clear()
+        records = self.records[:3] + [{"premise": " " + self.records[0]["premise"] + " ",
+                                       "hypothesis": self.records[0]["hypothesis"]}]
+
+        # Act
+        actual = serve.predict_fn(records, model_artifacts)
+
+        # Assert
+        self.assertEqual(expected, actual[:2])
+        self.assertEqual(expected[0], actual[3])
+        self.assertEqual([1], [s[0] for s in shapes])
+        stats = serve.cache_stats(model_artifacts)
+        self.assertEqual({"hits": 3, "misses": 3},
+                         {k: stats["prediction_cache"][k] for k in ["hits", "misses"]})
+        self.assertIsNotNone(stats["token_cache"])
+
+    def test_memoized_tokeniser(self):
+        """
+        Test case  the memoized tokeniser should encode the same as the tokeniser, tokenising each text once
+        """
+        preprocessor = self.model_artifacts[0]
+        items = [(r["premise"], r["hypothesis"]) for r in self.records]
+        expected = preprocessor.batch(items)
+        cache = LruCache(100)
+        preprocessor.tokeniser = MemoizedTokeniser(preprocessor.tokeniser, cache)
+
+        # Act
+        actual = [preprocessor.batch(items), preprocessor.batch(items)]
+
+        # Assert
+        for a in actual:
+            for e_tensor, a_tensor in zip(expected, a):
+                self.assertTrue(torch.equal(e_tensor, a_tensor))
+        # The premises are distinct and the hypothesis is shared
+        self.assertEqual({"hits": 6, "misses": 6}, {k: cache.stats()[k] for k in ["hits", "misses"]})
+
+
+class _ShapeRecorder(torch.nn.Module):
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+        self.shapes = []
+
+    def forward(self, input_ids, attention_mask, token_type_ids):
+        self.shapes.append(tuple(input_ids.shape))
+        return self.model(input_ids, attention_mask, token_type_ids)
@@ -12,6 +12,15 @@ class TestSitTrain(TestCase):
 
 
     def test_run_with_no_exception_nli(self):
+        self._run_train()
+
+    def test_run_with_no_exception_nli_dynamic_padding(self):
+        self._run_train(dynamic_padding=True)
+
+    def test_run_with_no_exception_nli_bf16(self):
+        self._run_train(mixed_precision="bf16")
+
+    def _run_train(self, **kwargs):
         # Arrange
         train_data_file = os.path.join(os.path.dirname(__file__), "sample_data", "snli_train.jsonl")
         tempdir = tempfile.mkdtemp()
@@ -33,7 +42,7 @@ class TestSitTrain(TestCase):
         b = BuilderNli(train_data=train_data_file, val_data=train_data_file, num_workers=0,
                        checkpoint_dir=tempdir, epochs=2,
                        early_stopping_patience=2, batch_size=batch,
-                       max_seq_len=sequence_len, model_dir=tempdir)
+                       max_seq_len=sequence_len, model_dir=tempdir, **kwargs)
         b.set_tokensior(mock_tokenisor)
         b.set_bert_config(bert_config)
 
@@ -1,7 +1,11 @@
 
 import os
+import tempfile
 from unittest import TestCase
 
+from transformers import BertTokenizer
+
+from preprocessor_nli_bert_tokeniser import PreprocessorNliBertTokeniser
 from snli_dataset import SnliDataset
 
 
@@ -23,3 +27,32 @@ class TestSnliDataset(TestCase):
         self.assertEqual(expected_x_prem, actual_x_prem)
         self.assertEqual(expected_x_hyp, actual_x_hyp)
 
+    def test___getitem__token_cache(self):
+        """
+        Test case  items read from the token cache should match the items from the preprocessor
+        """
+        input_file = os.path.join(os.path.dirname(__file__), "sample_data", "snli_train.jsonl")
+        cache_dir = tempfile.mkdtemp()
+        preprocessor = PreprocessorNliBertTokeniser(max_feature_len=20, tokeniser=self._get_tokeniser())
+        expected = SnliDataset(input_file, preprocessor=preprocessor)
+
+        # Build cache and then read from the existing cache
+        SnliDataset(input_file, preprocessor=preprocessor, token_cache_dir=cache_dir)
+        sut = SnliDataset(input_file, preprocessor=preprocessor, token_cache_dir=cache_dir)
+
+        # Act
+        actual = [sut[i] for i in range(len(sut))]
+
+        # Assert
+        self.assertEqual(len(expected), len(actual))
+        for (expected_x, expected_y), (actual_x, actual_y) in zip(expected, actual):
+            for e, a in zip(expected_x, actual_x):
+                self.assertSequenceEqual(e.tolist(), a.tolist())
+            self.assertEqual(expected_y, actual_y)
+
+    def _get_tokeniser(self):
+        vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "A", "person", "on", "a", "horse", "is", "."]
+        vocab_file = os.path.join(tempfile.mkdtemp(), "vocab.txt")
+        with open(vocab_file, "w") as f:
+            f.write("\n".join(vocab))
+        return BertTokenizer(vocab_file, do_lower_case=False)
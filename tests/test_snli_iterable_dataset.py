@@ -0,0 +1,45 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from snli_dataset import SnliDataset
+from snli_iterable_dataset import SnliIterableDataset
+
+
+class TestSnliIterableDataset(TestCase):
+
+    def test___iter__(self):
+        """
+        Test case  streaming should return the same items as the in-memory dataset
+        """
+        input_file = os.path.join(os.path.dirname(__file__), "sample_data", "snli_train.jsonl")
+        expected = list(SnliDataset(input_file))
+
+        sut = SnliIterableDataset(input_file)
+
+        # Act
+        actual = list(sut)
+
+        # Assert
+        self.assertSequenceEqual(expected, actual)
+
+    def test__read_shard(self):
+        """
+        Test case  each line should be read by exactly one shard, irrespective of the number of shards
+        """
+        input_file = os.path.join(tempfile.mkdtemp(), "snli.jsonl")
+        expected = [json.dumps({"sentence1": "premise {}".format(i) * i, "sentence2": "hypothesis",
+                                "gold_label": "neutral"}) + "\n" for i in range(20)]
+        with open(input_file, "w") as f:
+            f.writelines(expected)
+
+        sut = SnliIterableDataset(input_file)
+
+        for num_shards in range(1, 6):
+            with self.subTest(num_shards=num_shards):
+                # Act
+                actual = [l for shard_id in range(num_shards) for l in sut._read_shard(shard_id, num_shards)]
+
+                # Assert
+                self.assertSequenceEqual(expected, actual)
@@ -0,0 +1,25 @@
+import tempfile
+from unittest import TestCase
+
+from torch.profiler import ProfilerAction
+
+from training_profiler import TrainingProfiler
+
+
+class TestTrainingProfiler(TestCase):
+
+    def test_profile_steps(self):
+        """
+        Test case  the profile steps should be 1-based, the same as the step in the metrics file
+        """
+        sut = TrainingProfiler(profile_steps=(3, 5), trace_dir=tempfile.mkdtemp())
+        sut.start()
+
+        # Act
+        # The profiler schedule is indexed by the number of completed steps, i.e. train step - 1
+        actual = [sut._torch_profiler.schedule(step - 1) for step in range(1, 7)]
+        sut.close()
+
+        # Assert
+        self.assertEqual([ProfilerAction.NONE, ProfilerAction.WARMUP, ProfilerAction.RECORD,
+                          ProfilerAction.RECORD_AND_SAVE, ProfilerAction.NONE, ProfilerAction.NONE], actual)
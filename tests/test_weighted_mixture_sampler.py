@@ -0,0 +1,36 @@
+from collections import Counter
+from unittest import TestCase
+
+from weighted_mixture_sampler import WeightedMixtureSampler
+
+
+class TestWeightedMixtureSampler(TestCase):
+
+    def test_iter(self):
+        """
+        Test case  each source should be sampled in proportion to its weight, repeating the whole source for a weight greater than 1
+        """
+        sut = WeightedMixtureSampler(source_sizes=[10, 4, 6], weights=[0.5, 2, 0])
+
+        # Act
+        actual = list(sut)
+
+        # Assert
+        self.assertEqual(len(sut), len(actual))
+        self.assertEqual(5, sum(1 for i in actual if i < 10))
+        self.assertEqual(5, len(set(i for i in actual if i < 10)))
+        self.assertEqual({i: 2 for i in range(10, 14)}, Counter(i for i in actual if i >= 10))
+
+    def test_iter_distributed(self):
+        """
+        Test case  the replicas should get the same number of distinct items of the same permutation
+        """
+        samplers = [WeightedMixtureSampler(source_sizes=[7, 4], weights=[1, 1], num_replicas=3, rank=r)
+                    for r in range(3)]
+
+        # Act
+        actual = [list(s) for s in samplers]
+
+        # Assert
+        self.assertEqual([3, 3, 3], [len(a) for a in actual])
+        self.assertEqual(9, len(set(i for a in actual for i in a)))